@@ -1,22 +1,165 @@
+import os
+import json
+import queue
 import sqlite3
 import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 from helpers import get_db_connection, brl, br_datetime
+from cache import QueryCache, LRUBackend, query_cache
+from chat_log import record_chat
+from forecast import forecast_summary
+from search import search_entries, search_bills
+from budgets import budget_status
 
-def get_assistant_response(user_id, message):
-    """
-    Local AI assistant with NLP rules for financial queries
-    """
-    message_lower = message.lower().strip()
-    
-    # Greeting patterns
-    if any(word in message_lower for word in ['oi', 'olá', 'hello', 'hi', 'bom dia', 'boa tarde', 'boa noite']):
-        return "Olá! Sou o Layon, seu agente financeiro. Posso ajudar com informações sobre suas receitas, despesas, saldo e relatórios. O que gostaria de saber?"
-    
-    # Help patterns
-    if any(word in message_lower for word in ['ajuda', 'help', 'comandos', 'o que você faz']):
-        return """Posso ajudar você com:
+# Assistant worker pool configuration
+# Queries run on a small thread pool so a slow cloud query does not pin the request thread;
+# ASSISTANT_MAX_INFLIGHT caps how many questions (running + queued) are accepted at once
+ASSISTANT_WORKERS = int(os.environ.get("ASSISTANT_WORKERS", "4"))
+ASSISTANT_MAX_INFLIGHT = int(os.environ.get("ASSISTANT_MAX_INFLIGHT", "16"))
+ASSISTANT_TIMEOUT_SECONDS = float(os.environ.get("ASSISTANT_TIMEOUT_SECONDS", "20"))
+SSE_KEEPALIVE_SECONDS = 5
+
+_executor = ThreadPoolExecutor(max_workers=ASSISTANT_WORKERS, thread_name_prefix='assistant')
+_inflight = threading.BoundedSemaphore(ASSISTANT_MAX_INFLIGHT)
+
+def start_pool():
+    """Fresh worker pool and concurrency cap (per worker, e.g. after fork)"""
+    global _executor, _inflight
+    _executor = ThreadPoolExecutor(max_workers=ASSISTANT_WORKERS, thread_name_prefix='assistant')
+    _inflight = threading.BoundedSemaphore(ASSISTANT_MAX_INFLIGHT)
+
+def stop_pool(wait=True):
+    """Finish queued questions and stop the pool threads"""
+    _executor.shutdown(wait=wait)
+
+class AssistantBusy(Exception):
+    """Raised when the assistant pool is at its concurrency cap"""
+
+class AssistantTimeout(Exception):
+    """Raised when an answer is not ready within ASSISTANT_TIMEOUT_SECONDS"""
+
+def _submit(task, *args):
+    """Run task on the worker pool, respecting the concurrency cap"""
+    inflight = _inflight
+    if not inflight.acquire(blocking=False):
+        raise AssistantBusy()
+    try:
+        future = _executor.submit(task, *args)
+    except Exception:
+        inflight.release()
+        raise
+    future.add_done_callback(lambda f: inflight.release())
+    return future
+
+def submit_assistant_query(user_id, message):
+    """Run get_assistant_response on the worker pool; the future holds the whole answer"""
+    return _submit(_answer_and_log, user_id, message)
+
+def _answer_and_log(user_id, message):
+    """Pool task: answer the question and queue it for the chat log"""
+    started = time.perf_counter()
+    answer = get_assistant_response(user_id, message)
+    latency_ms = (time.perf_counter() - started) * 1000
+    record_chat(user_id, normalize_intent(message)[0], message, answer, latency_ms)
+    return answer
+
+class AssistantStream:
+    """Answer parts handed from the pool task to the request thread as each one is ready"""
+
+    def __init__(self):
+        self.parts = queue.Queue()
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """Stop the task: a queued one never starts, a running one stops before its next query"""
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+def submit_assistant_stream(user_id, message):
+    """Start answering on the worker pool; read the parts from the returned stream"""
+    stream = AssistantStream()
+    stream.future = _submit(_stream_and_log, user_id, message, stream)
+    return stream
+
+def _stream_and_log(user_id, message, stream):
+    """Pool task: pass each answer part on as it is produced, then log the whole answer"""
+    started = time.perf_counter()
+    parts = []
+    try:
+        generator = assistant_answer_parts(user_id, message)
+        for part in generator:
+            if stream.cancelled.is_set():
+                # Closing the generator closes its connection: no further queries run
+                generator.close()
+                return
+            parts.append(part)
+            stream.parts.put(('part', part))
+    except Exception as e:
+        stream.parts.put(('error', str(e)))
+        return
+    stream.parts.put(('done', None))
+    latency_ms = (time.perf_counter() - started) * 1000
+    record_chat(user_id, normalize_intent(message)[0], message, ''.join(parts), latency_ms)
+
+def ask_assistant(user_id, message, timeout=ASSISTANT_TIMEOUT_SECONDS):
+    """Blocking helper for the JSON endpoints"""
+    future = submit_assistant_query(user_id, message)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise AssistantTimeout()
+
+def split_answer(answer):
+    """Split an answer into streamable chunks (one per line, keeping line breaks)"""
+    return answer.splitlines(keepends=True) or ['']
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_assistant_response(stream, timeout=ASSISTANT_TIMEOUT_SECONDS):
+    """Yield SSE messages for a submitted stream: each answer part in chunks as it arrives, keep-alives between"""
+    yield ": started\n\n"
+    deadline = time.monotonic() + timeout
+    finished = False
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield sse_event({'message': 'Tempo esgotado ao consultar o assistente.'}, event='error')
+                return
+            try:
+                kind, value = stream.parts.get(timeout=min(SSE_KEEPALIVE_SECONDS, remaining))
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            if kind == 'part':
+                for chunk in split_answer(value):
+                    yield sse_event({'chunk': chunk})
+            elif kind == 'error':
+                finished = True
+                yield sse_event({'message': 'Erro interno do servidor'}, event='error')
+                return
+            else:
+                finished = True
+                yield sse_event({'status': 'ok'}, event='done')
+                return
+    finally:
+        # Timed out or the client went away: stop the pool task too
+        if not finished:
+            stream.cancel()
+
+GREETING_ANSWER = "Olá! Sou o Layon, seu agente financeiro. Posso ajudar com informações sobre suas receitas, despesas, saldo e relatórios. O que gostaria de saber?"
+
+HELP_ANSWER = """Posso ajudar você com:
         
 📊 **Consultas de dados:**
 - "saldo total" ou "quanto tenho"
@@ -34,6 +177,12 @@ def get_assistant_response(user_id, message):
 - "top 5 despesas"
 - "maiores gastos"
 - "resumo mensal"
+- "previsão de saldo" ou "previsão 90 dias"
+- "orçamento" ou "estourei algum limite?"
+
+🔍 **Busca:**
+- "procurar aluguel"
+- "buscar mercado"
 
 ⏰ **Períodos:**
 - "hoje", "ontem", "esta semana"
@@ -42,6 +191,134 @@ def get_assistant_response(user_id, message):
 
 Experimente perguntar algo como: "Quais contas vencem esta semana?" """
 
+UNKNOWN_ANSWER = f"""🤔 Não entendi sua pergunta. Aqui estão algumas sugestões:
+
+💰 "saldo total" - Ver seu patrimônio atual
+📈 "receitas deste mês" - Entradas do período
+💸 "despesas hoje" - Gastos de hoje
+📅 "contas a pagar" - Ver próximos vencimentos
+📊 "resumo mensal" - Balanço completo
+🏆 "top 5 despesas" - Maiores gastos
+
+Digite **"ajuda"** para ver todos os comandos disponíveis."""
+
+# Answers that never touch the database
+STATIC_ANSWERS = {
+    'greeting': GREETING_ANSWER,
+    'help': HELP_ANSWER,
+    'unknown': UNKNOWN_ANSWER,
+}
+
+# Answer cache: keyed by (user_id, intent, period, user data version)
+ASSISTANT_CACHE_SIZE = int(os.environ.get("ASSISTANT_CACHE_SIZE", "2048"))
+answer_cache = QueryCache(LRUBackend(max_entries=ASSISTANT_CACHE_SIZE))
+
+def _entry_period(message_lower, day_words):
+    if any(word in message_lower for word in day_words):
+        return 'hoje'
+    if any(word in message_lower for word in ['ontem']):
+        return 'ontem'
+    if any(word in message_lower for word in ['mês passado', 'mês anterior']):
+        return 'mes_passado'
+    return 'mes'
+
+def normalize_intent(message):
+    """Map a free-text question to (intent, params) - the part of the answer cache key derived from the text"""
+    message_lower = message.lower().strip()
+    
+    # Busca textual ("procurar aluguel"); checked first, the search term may contain any word
+    search = re.match(r'(?:procurar|procure|buscar|busque|pesquisar)\s+(?:por\s+)?(.+)', message_lower)
+    if search:
+        return 'procurar', (' '.join(search.group(1).split()),)
+    
+    # Greeting patterns
+    if any(word in message_lower for word in ['oi', 'olá', 'hello', 'hi', 'bom dia', 'boa tarde', 'boa noite']):
+        return 'greeting', ()
+    
+    # Help patterns
+    if any(word in message_lower for word in ['ajuda', 'help', 'comandos', 'o que você faz']):
+        return 'help', ()
+    
+    # Previsão de saldo (before "saldo": "previsão de saldo")
+    if any(word in message_lower for word in ['previsão', 'previsao', 'projeção', 'projecao', 'prever']):
+        return 'previsao', (90 if '90' in message_lower else 30,)
+    
+    # Orçamentos (before "despesas": "orçamento de gastos")
+    if any(word in message_lower for word in ['orçamento', 'orcamento', 'limite', 'estourei']):
+        return 'orcamento', ()
+    
+    # Saldo total
+    if any(word in message_lower for word in ['saldo', 'quanto tenho', 'total', 'patrimônio']):
+        return 'saldo', ()
+    
+    # Receitas/Faturamento
+    if any(word in message_lower for word in ['receita', 'faturamento', 'ganho', 'entrada']):
+        return 'receitas', (_entry_period(message_lower, ['hoje', 'dia', 'diário']),)
+    
+    # Despesas
+    if any(word in message_lower for word in ['despesa', 'gasto', 'saída', 'gastei']):
+        return 'despesas', (_entry_period(message_lower, ['hoje', 'dia']),)
+    
+    # Top categorias/ranking
+    if any(word in message_lower for word in ['top', 'ranking', 'maiores', 'principais']):
+        if any(word in message_lower for word in ['despesa', 'gasto']):
+            return 'top', ('despesa',)
+        return 'top', ('receita',)
+    
+    # Resumo mensal
+    if any(word in message_lower for word in ['resumo', 'resultado', 'balanço', 'mensal']):
+        return 'resumo', ()
+    
+    # Contas a pagar/receber patterns
+    if any(word in message_lower for word in ['conta', 'pagar', 'receber', 'vencimento', 'atraso']):
+        bill_type = None
+        if any(word in message_lower for word in ['pagar', 'pago']):
+            bill_type = 'pagar'
+        elif any(word in message_lower for word in ['receber', 'recebimento']):
+            bill_type = 'receber'
+        
+        bill_filter = None
+        if any(word in message_lower for word in ['vencendo', 'próxim', 'semana']):
+            bill_filter = 'semana'
+        elif any(word in message_lower for word in ['hoje', 'dia']):
+            bill_filter = 'hoje'
+        elif any(word in message_lower for word in ['atraso', 'vencid']):
+            bill_filter = 'atraso'
+        elif any(word in message_lower for word in ['pendente']):
+            bill_filter = 'pendente'
+        return 'contas', (bill_type, bill_filter)
+    
+    return 'unknown', ()
+
+def get_assistant_response(user_id, message):
+    """
+    Local AI assistant with NLP rules for financial queries
+    """
+    return ''.join(assistant_answer_parts(user_id, message))
+
+def assistant_answer_parts(user_id, message):
+    """The answer as text parts, each yielded as soon as its query has run (a cached answer is one part)"""
+    intent, params = normalize_intent(message)
+
+    if intent in STATIC_ANSWERS:
+        yield STATIC_ANSWERS[intent]
+        return
+
+    # Answers depend on the current day (periods, days until due) and on the user's data
+    today = datetime.now(ZoneInfo('America/Sao_Paulo')).date().isoformat()
+    key_params = (*params, today, query_cache.user_version(user_id))
+
+    try:
+        yield from answer_cache.get_or_stream(user_id, intent, key_params,
+                                              lambda: _answer_parts(user_id, intent, params))
+    except Exception as e:
+        yield f"Desculpe, ocorreu um erro ao processar sua solicitação: {str(e)}"
+
+def assistant_cache_stats():
+    return answer_cache.stats()
+
+def _answer_parts(user_id, intent, params):
+    """Run the SQL behind an intent, yielding the answer text as each query's rows are read"""
     conn = None
     try:
         conn = get_db_connection()
@@ -72,13 +349,87 @@ Experimente perguntar algo como: "Quais contas vencem esta semana?" """
         last_month_start_utc = last_month_start.astimezone(timezone.utc).isoformat()
         last_month_end_utc = month_start.astimezone(timezone.utc).isoformat()
         
+        # Entry periods
+        periods = {
+            'hoje': (f"AND when_utc >= '{today_start_utc}' AND when_utc <= '{today_end_utc}'", "hoje"),
+            'ontem': (f"AND when_utc >= '{yesterday_start_utc}' AND when_utc < '{yesterday_end_utc}'", "ontem"),
+            'mes_passado': (f"AND when_utc >= '{last_month_start_utc}' AND when_utc < '{last_month_end_utc}'", "no mês passado"),
+            'mes': (f"AND when_utc >= '{month_start_utc}'", "neste mês"),
+        }
+        
+        # Busca textual em lançamentos e contas
+        if intent == 'procurar':
+            term, = params
+            header = f"🔍 **Resultados para \"{term}\":**\n\n"
+            # Lançamentos go out before the bills search runs
+            entries, more_entries = search_entries(conn, user_id, term, per_page=5)
+            if entries:
+                response = header + "**Lançamentos:**\n"
+                for entry in entries:
+                    signal = "+" if entry['type'] == 'receita' else "-"
+                    response += f"• {br_datetime(entry['when_utc'])[:10]} - {entry['note']}: {signal}{brl(entry['amount'])}\n"
+                yield response
+            bills, more_bills = search_bills(conn, user_id, term, per_page=5)
+            if not entries and not bills:
+                yield f"🔍 Nada encontrado para \"{term}\"."
+                return
+            
+            if bills:
+                response = "\n**Contas:**\n" if entries else header + "**Contas:**\n"
+                for bill in bills:
+                    response += f"• {br_datetime(bill['due_date_utc'])[:10]} - {bill['description']}: {brl(bill['amount'])} ({bill['status']})\n"
+                yield response
+            if more_entries or more_bills:
+                yield "\nVeja todos os resultados na página Buscar."
+            return
+        
+        # Previsão de saldo (served by the incremental forecast engine)
+        if intent == 'previsao':
+            days, = params
+            forecast = forecast_summary(user_id, days)
+            if not forecast['accounts']:
+                yield "📭 Você ainda não tem contas para projetar o saldo."
+                return
+            
+            min_day = datetime.fromisoformat(forecast['min_day']).strftime('%d/%m/%Y')
+            response = f"🔮 **Previsão de saldo para {len(forecast['days'])} dias:**\n\n"
+            response += f"Hoje: {brl(forecast['start_total'])}\n"
+            response += f"Em {len(forecast['days'])} dias: {brl(forecast['end_total'])}\n"
+            response += f"Menor saldo previsto: {brl(forecast['min_total'])} em {min_day}\n"
+            if len(forecast['accounts']) > 1:
+                response += "\n"
+                for account in forecast['accounts']:
+                    response += f"• {account['name']}: {brl(account['balances'][-1])}\n"
+            if forecast['min_total'] < 0:
+                response += "\n⚠️ Atenção: o saldo pode ficar negativo no período."
+            yield response
+            return
+        
+        # Orçamentos do mês (read from the budget counters)
+        if intent == 'orcamento':
+            budgets = budget_status(conn, user_id)
+            if not budgets:
+                yield "🎯 Você ainda não definiu orçamentos. Defina limites mensais por categoria no Dashboard."
+                return
+            
+            response = "🎯 **Orçamentos deste mês:**\n\n"
+            for budget in budgets:
+                icon = "🔴" if budget['status'] == 'estourado' else "🟡" if budget['status'] == 'alerta' else "🟢"
+                response += f"{icon} {budget['name']}: {brl(budget['spent'])} de {brl(budget['limit'])} ({budget['percent']}%)\n"
+            over = [budget['name'] for budget in budgets if budget['status'] == 'estourado']
+            if over:
+                response += f"\n⚠️ Limite estourado em: {', '.join(over)}."
+            yield response
+            return
+        
         # Saldo total
-        if any(word in message_lower for word in ['saldo', 'quanto tenho', 'total', 'patrimônio']):
+        if intent == 'saldo':
             accounts = conn.execute('''
                 SELECT a.initial_balance,
-                       COALESCE(SUM(CASE 
+                       a.archived_total + COALESCE(SUM(CASE 
                            WHEN e.type = 'receita' THEN e.amount
                            WHEN e.type = 'despesa' THEN -e.amount
+                           WHEN e.type = 'transferencia' THEN e.amount
                            ELSE 0
                        END), 0) as transactions_total
                 FROM accounts a
@@ -89,25 +440,12 @@ Experimente perguntar algo como: "Quais contas vencem esta semana?" """
             
             total_balance = sum(acc['initial_balance'] + acc['transactions_total'] for acc in accounts)
             
-            return f"💰 Seu saldo total atual é de **{brl(total_balance)}**.\n\nQue tal conferir suas receitas e despesas do mês? Digite 'resumo mensal'."
+            yield f"💰 Seu saldo total atual é de **{brl(total_balance)}**.\n\nQue tal conferir suas receitas e despesas do mês? Digite 'resumo mensal'."
+            return
         
         # Receitas/Faturamento
-        if any(word in message_lower for word in ['receita', 'faturamento', 'ganho', 'entrada']):
-            period_query = ""
-            period_name = ""
-            
-            if any(word in message_lower for word in ['hoje', 'dia', 'diário']):
-                period_query = f"AND when_utc >= '{today_start_utc}' AND when_utc <= '{today_end_utc}'"
-                period_name = "hoje"
-            elif any(word in message_lower for word in ['ontem']):
-                period_query = f"AND when_utc >= '{yesterday_start_utc}' AND when_utc < '{yesterday_end_utc}'"
-                period_name = "ontem"
-            elif any(word in message_lower for word in ['mês passado', 'mês anterior']):
-                period_query = f"AND when_utc >= '{last_month_start_utc}' AND when_utc < '{last_month_end_utc}'"
-                period_name = "no mês passado"
-            else:  # Default to current month
-                period_query = f"AND when_utc >= '{month_start_utc}'"
-                period_name = "neste mês"
+        if intent == 'receitas':
+            period_query, period_name = periods[params[0]]
             
             result = conn.execute(f'''
                 SELECT SUM(amount) as total
@@ -117,25 +455,12 @@ Experimente perguntar algo como: "Quais contas vencem esta semana?" """
             
             total = result['total'] or 0
             
-            return f"📈 Suas receitas {period_name} somam **{brl(total)}**.\n\nQuer ver o detalhamento por categoria? Digite 'top receitas'."
+            yield f"📈 Suas receitas {period_name} somam **{brl(total)}**.\n\nQuer ver o detalhamento por categoria? Digite 'top receitas'."
+            return
         
         # Despesas
-        if any(word in message_lower for word in ['despesa', 'gasto', 'saída', 'gastei']):
-            period_query = ""
-            period_name = ""
-            
-            if any(word in message_lower for word in ['hoje', 'dia']):
-                period_query = f"AND when_utc >= '{today_start_utc}' AND when_utc <= '{today_end_utc}'"
-                period_name = "hoje"
-            elif any(word in message_lower for word in ['ontem']):
-                period_query = f"AND when_utc >= '{yesterday_start_utc}' AND when_utc < '{yesterday_end_utc}'"
-                period_name = "ontem"
-            elif any(word in message_lower for word in ['mês passado', 'mês anterior']):
-                period_query = f"AND when_utc >= '{last_month_start_utc}' AND when_utc < '{last_month_end_utc}'"
-                period_name = "no mês passado"
-            else:  # Default to current month
-                period_query = f"AND when_utc >= '{month_start_utc}'"
-                period_name = "neste mês"
+        if intent == 'despesas':
+            period_query, period_name = periods[params[0]]
             
             result = conn.execute(f'''
                 SELECT SUM(amount) as total
@@ -145,16 +470,13 @@ Experimente perguntar algo como: "Quais contas vencem esta semana?" """
             
             total = result['total'] or 0
             
-            return f"💸 Suas despesas {period_name} somam **{brl(total)}**.\n\nPara analisar onde está gastando mais, digite 'top despesas'."
+            yield f"💸 Suas despesas {period_name} somam **{brl(total)}**.\n\nPara analisar onde está gastando mais, digite 'top despesas'."
+            return
         
         # Top categorias/ranking
-        if any(word in message_lower for word in ['top', 'ranking', 'maiores', 'principais']):
-            if any(word in message_lower for word in ['despesa', 'gasto']):
-                entry_type = 'despesa'
-                emoji = '💸'
-            else:
-                entry_type = 'receita'
-                emoji = '📈'
+        if intent == 'top':
+            entry_type = params[0]
+            emoji = '💸' if entry_type == 'despesa' else '📈'
             
             top_categories = conn.execute('''
                 SELECT c.name, SUM(e.amount) as total
@@ -164,20 +486,23 @@ Experimente perguntar algo como: "Quais contas vencem esta semana?" """
                 GROUP BY c.id, c.name
                 ORDER BY total DESC
                 LIMIT 5
-            ''', (user_id, entry_type, month_start_utc)).fetchall()
-            
-            if not top_categories:
-                return f"Ainda não há {entry_type}s registradas neste mês."
+            ''', (user_id, entry_type, month_start_utc))
             
-            response = f"{emoji} **Top 5 {entry_type}s deste mês:**\n\n"
+            # One part per row, as the cursor reads it
+            i = 0
             for i, cat in enumerate(top_categories, 1):
-                response += f"{i}. {cat['name']}: {brl(cat['total'])}\n"
+                if i == 1:
+                    yield f"{emoji} **Top 5 {entry_type}s deste mês:**\n\n"
+                yield f"{i}. {cat['name']}: {brl(cat['total'])}\n"
+            if not i:
+                yield f"Ainda não há {entry_type}s registradas neste mês."
+                return
             
-            response += f"\nQuer mais detalhes? Acesse a seção de Relatórios!"
-            return response
+            yield "\nQuer mais detalhes? Acesse a seção de Relatórios!"
+            return
         
         # Resumo mensal
-        if any(word in message_lower for word in ['resumo', 'resultado', 'balanço', 'mensal']):
+        if intent == 'resumo':
             monthly_stats = conn.execute('''
                 SELECT 
                     SUM(CASE WHEN type = 'receita' THEN amount ELSE 0 END) as receitas,
@@ -193,31 +518,33 @@ Experimente perguntar algo como: "Quais contas vencem esta semana?" """
             status_emoji = "💚" if resultado > 0 else "🔴" if resultado < 0 else "⚪"
             status_text = "positivo" if resultado > 0 else "negativo" if resultado < 0 else "equilibrado"
             
-            return f"""📊 **Resumo do mês atual:**
+            yield f"""📊 **Resumo do mês atual:**
 
 📈 Receitas: {brl(receitas)}
 💸 Despesas: {brl(despesas)}
 {status_emoji} Resultado: {brl(resultado)} ({status_text})
 
 Quer analisar as categorias que mais impactaram? Digite 'top despesas' ou 'top receitas'."""
+            return
         
-        # Contas a pagar/receber patterns
-        if any(word in message_lower for word in ['conta', 'pagar', 'receber', 'vencimento', 'atraso']):
+        # Contas a pagar/receber
+        if intent == 'contas':
+            bill_type, bill_filter = params
             period_filter = ""
             status_filter = ""
             type_filter = ""
             title = "Contas"
             
             # Determinar tipo de conta
-            if any(word in message_lower for word in ['pagar', 'pago']):
+            if bill_type == 'pagar':
                 type_filter = "AND type = 'pagar'"
                 title = "Contas a pagar"
-            elif any(word in message_lower for word in ['receber', 'recebimento']):
+            elif bill_type == 'receber':
                 type_filter = "AND type = 'receber'"
                 title = "Contas a receber"
             
             # Determinar período/status
-            if any(word in message_lower for word in ['vencendo', 'próxim', 'semana']):
+            if bill_filter == 'semana':
                 # Próximos 7 dias
                 next_week = (now_br + timedelta(days=7)).astimezone(timezone.utc).isoformat()
                 period_filter = f"AND due_date_utc <= '{next_week}'"
@@ -225,19 +552,19 @@ Quer analisar as categorias que mais impactaram? Digite 'top despesas' ou 'top r
                     title += " vencendo nos próximos 7 dias"
                 else:
                     title = "Contas vencendo nos próximos 7 dias"
-            elif any(word in message_lower for word in ['hoje', 'dia']):
+            elif bill_filter == 'hoje':
                 period_filter = f"AND due_date_utc >= '{today_start_utc}' AND due_date_utc <= '{today_end_utc}'"
                 if type_filter:
                     title += " que vencem hoje"
                 else:
                     title = "Contas que vencem hoje"
-            elif any(word in message_lower for word in ['atraso', 'vencid']):
+            elif bill_filter == 'atraso':
                 status_filter = "AND status = 'vencido'"
                 if type_filter:
                     title += " em atraso"
                 else:
                     title = "Contas em atraso"
-            elif any(word in message_lower for word in ['pendente']):
+            elif bill_filter == 'pendente':
                 status_filter = "AND status = 'pendente'"
                 if type_filter:
                     title += " pendentes"
@@ -250,15 +577,14 @@ Quer analisar as categorias que mais impactaram? Digite 'top despesas' ou 'top r
                 WHERE user_id = ? AND status != 'pago' {type_filter} {period_filter} {status_filter}
                 ORDER BY due_date_utc ASC
                 LIMIT 10
-            ''', (user_id,)).fetchall()
-            
-            if not bills:
-                conn.close()
-                return "✅ Não há contas pendentes ou que atendam aos critérios informados."
-            
-            response = f"📅 **{title}:**\n\n"
+            ''', (user_id,))
             
+            # One part per bill, as the cursor reads it
+            found = False
             for bill in bills:
+                if not found:
+                    found = True
+                    yield f"📅 **{title}:**\n\n"
                 due_date = datetime.fromisoformat(bill['due_date_utc'].replace('Z', '+00:00'))
                 due_date_br = due_date.astimezone(ZoneInfo('America/Sao_Paulo'))
                 days_diff = (due_date_br.date() - now_br.date()).days
@@ -288,27 +614,16 @@ Quer analisar as categorias que mais impactaram? Digite 'top despesas' ou 'top r
                 else:
                     days_text = f"({days_diff} dias)"
                 
-                response += f"{status_emoji} {type_emoji} {bill['description']} - {brl(bill['amount'])} {days_text}\n"
+                yield f"{status_emoji} {type_emoji} {bill['description']} - {brl(bill['amount'])} {days_text}\n"
             
-            conn.close()
-            response += "\nQuer mais detalhes? Acesse a seção de Contas a Pagar/Receber!"
-            return response
+            if not found:
+                yield "✅ Não há contas pendentes ou que atendam aos critérios informados."
+                return
+            yield "\nQuer mais detalhes? Acesse a seção de Contas a Pagar/Receber!"
+            return
         
-        # Default response for unrecognized queries
-        conn.close()
-        return f"""🤔 Não entendi sua pergunta. Aqui estão algumas sugestões:
-
-💰 "saldo total" - Ver seu patrimônio atual
-📈 "receitas deste mês" - Entradas do período
-💸 "despesas hoje" - Gastos de hoje
-📅 "contas a pagar" - Ver próximos vencimentos
-📊 "resumo mensal" - Balanço completo
-🏆 "top 5 despesas" - Maiores gastos
-
-Digite **"ajuda"** para ver todos os comandos disponíveis."""
+        yield UNKNOWN_ANSWER
         
-    except Exception as e:
-        return f"Desculpe, ocorreu um erro ao processar sua solicitação: {str(e)}"
     finally:
-        if 'conn' in locals() and conn:
+        if conn:
             conn.close()
@@ -1,23 +1,59 @@
 import os
+import re
+import math
 import sqlite3
 import logging
 from datetime import datetime, timezone, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, Response, current_app, send_file, render_template, request, redirect, url_for, session, flash, jsonify, has_request_context
 from zoneinfo import ZoneInfo
-from helpers import brl, br_datetime, parse_br_currency, parse_br_datetime, get_db_connection, init_db, seed_categories
-from ai_assistant import get_assistant_response
-import mercadopago
+from helpers import brl, br_datetime, parse_br_currency, parse_br_datetime, get_db_connection, init_db, ensure_db, Database, seed_categories, LazyConnection, insert_entry
+from cache import cached_query, bump_user_version, cache_stats, rows_to_dicts, row_to_dict, reset_worker_cache
+from sessions import ServerSideSessionInterface, make_session_store, load_profile, profile_is_stale
+from chat_log import chat_log, get_chat_history, get_intent_stats
+from forecast import forecast_engine, forecast_summary, notify_forecast_write, FORECAST_DAYS
+from instrumentation import instrument_app, route_metrics
+from profiling import profile_app, list_profiles, profile_path
+from assets import assets_app
+from bills import BULK_MAX_ITEMS, load_user_bills, pay_bills, reschedule_bills, update_bill, delete_bill
+from search import SEARCH_SCOPES, search_entries, search_bills
+from balances import HISTORY_GRANULARITIES, HISTORY_MAX_DAYS, balance_history
+from transfers import create_transfer
+from ledger import update_entry, delete_entry, category_matches
+from budgets import set_budget, delete_budget, budget_status, pending_alerts, current_month
+from archive import entries_source, entries_source_for_page, archive_entries, archive_stats
+from backup import BackupError, create_backup, list_backups
+from consistency import check_consistency
+from auth import (AuthBusy, RateLimited, ip_limiter, email_limiter, hash_password, verify_password, needs_rehash,
+                  auth_metrics, start_hash_pool, stop_hash_pool)
+from reports import GRANULARITIES, parse_report_date, default_period, load_entry_columns, build_report
+from ai_assistant import ask_assistant, submit_assistant_stream, stream_assistant_response, sse_event, AssistantBusy, AssistantTimeout, assistant_cache_stats, answer_cache, start_pool, stop_pool
+from config import Config
+from workers import WorkerResources
+from writes import run_write, write_coordinator
+from reminders import reminder_scheduler, unread_notifications, mark_notifications_read
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+# Views are collected here and registered on every app built by create_app,
+# keeping their endpoint names (url_for('dashboard'), ...)
+_routes = []
 
-# Database configuration (now using SQLite Cloud by default)
-# Set USE_SQLITE_CLOUD=false to use local database instead
-DB_PATH = os.environ.get("DB_PATH", "./database.db")
+def route(rule, **options):
+    def decorator(f):
+        _routes.append((rule, f, options))
+        return f
+    return decorator
+
+def ensure_database():
+    """Schema is created/migrated on the first request of each worker (a no-op once current),
+    so importing the app never touches the database (gunicorn preload_app friendly)"""
+    ensure_db()
+
+def get_mercadopago_sdk(token):
+    """Mercado Pago SDK client; the package is only imported on the first checkout"""
+    import mercadopago
+    return mercadopago.SDK(token)
 
 def require_login(f):
     """Decorator to require login for routes"""
@@ -29,11 +65,46 @@ def require_login(f):
     wrapper.__name__ = f.__name__
     return wrapper
 
+def require_admin(f):
+    """Decorator to restrict operational endpoints to ADMIN_EMAILS"""
+    def wrapper(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('login'))
+        profile = get_current_profile()
+        if not profile or profile['email'].lower() not in current_app.config['ADMIN_EMAILS']:
+            return jsonify({'status': 'error', 'message': 'Acesso negado'}), 403
+        return f(*args, **kwargs)
+    wrapper.__name__ = f.__name__
+    return wrapper
+
+def start_user_session(conn, user_id, name):
+    """Log the user in, caching the profile snapshot in the session"""
+    session.clear()
+    session.regenerate()
+    session['user_id'] = user_id
+    session['user_name'] = name
+    session['profile'] = load_profile(conn, user_id)
+
+def get_current_profile(refresh=False):
+    """Profile snapshot of the logged user, refreshed lazily from the users table"""
+    profile = session.get('profile')
+    if refresh or not profile or profile['id'] != session.get('user_id') or profile_is_stale(profile):
+        conn = get_db_connection()
+        profile = load_profile(conn, session['user_id'])
+        conn.close()
+        session['profile'] = profile
+        if profile:
+            session['user_name'] = profile['name']
+    return profile
+
 def check_trial_status(user_id):
     """Check if user's trial is active or if they have subscription"""
-    conn = get_db_connection()
-    user = conn.execute('SELECT trial_start_utc, subscribed FROM users WHERE id = ?', (user_id,)).fetchone()
-    conn.close()
+    if has_request_context() and session.get('user_id') == user_id:
+        user = get_current_profile()
+    else:
+        conn = get_db_connection()
+        user = conn.execute('SELECT trial_start_utc, subscribed FROM users WHERE id = ?', (user_id,)).fetchone()
+        conn.close()
     
     if not user:
         return False, "Usuário não encontrado"
@@ -51,13 +122,26 @@ def check_trial_status(user_id):
     else:
         return False, "Teste grátis expirado"
 
-@app.route('/')
+def get_accounts_and_categories(conn, user_id):
+    """Cached account and category lists used by the entry/bill forms"""
+    accounts = cached_query(user_id, 'accounts', (), lambda: rows_to_dicts(
+        conn.execute('SELECT id, name FROM accounts WHERE user_id = ?', (user_id,)).fetchall()))
+    categories = cached_query(user_id, 'categories', (), lambda: rows_to_dicts(
+        conn.execute('SELECT id, name, type FROM categories WHERE user_id = ?', (user_id,)).fetchall()))
+    return accounts, categories
+
+@route('/')
 def index():
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
-@app.route('/register', methods=['GET', 'POST'])
+AUTH_BUSY_MESSAGE = 'Muitos acessos no momento. Tente novamente em alguns segundos.'
+
+def rate_limited_message(error):
+    return f'Muitas tentativas. Tente novamente em {max(1, round(error.retry_after))} segundos.'
+
+@route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
@@ -72,6 +156,12 @@ def register():
             flash('A senha deve ter pelo menos 6 caracteres.', 'error')
             return render_template('register.html')
         
+        try:
+            ip_limiter.hit(request.remote_addr)
+        except RateLimited as e:
+            flash(rate_limited_message(e), 'error')
+            return render_template('register.html'), 429
+        
         try:
             conn = get_db_connection()
             
@@ -82,8 +172,8 @@ def register():
                 conn.close()
                 return render_template('register.html')
             
-            # Create user
-            password_hash = generate_password_hash(password)
+            # Create user (the KDF runs on the hashing pool)
+            password_hash = hash_password(password)
             trial_start_utc = datetime.now(timezone.utc).isoformat()
             created_at_utc = datetime.now(timezone.utc).isoformat()
             
@@ -103,13 +193,16 @@ def register():
             )
             
             conn.commit()
+            start_user_session(conn, user_id, name)
             conn.close()
             
-            session['user_id'] = user_id
-            session['user_name'] = name
             flash('Conta criada com sucesso! Bem-vindo ao seu teste grátis de 7 dias.', 'success')
             return redirect(url_for('dashboard'))
             
+        except AuthBusy:
+            conn.close()
+            flash(AUTH_BUSY_MESSAGE, 'error')
+            return render_template('register.html'), 503
         except Exception as e:
             logging.error(f"Error creating user: {e}")
             flash('Erro ao criar conta. Tente novamente.', 'error')
@@ -117,7 +210,7 @@ def register():
     
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email', '').strip().lower()
@@ -127,53 +220,86 @@ def login():
             flash('Email e senha são obrigatórios.', 'error')
             return render_template('login.html')
         
+        try:
+            ip_limiter.hit(request.remote_addr)
+            email_limiter.hit(email)
+        except RateLimited as e:
+            flash(rate_limited_message(e), 'error')
+            return render_template('login.html'), 429
+        
+        conn = None
         try:
             conn = get_db_connection()
             user = conn.execute('SELECT id, name, password_hash FROM users WHERE email = ?', (email,)).fetchone()
-            conn.close()
             
-            if user and check_password_hash(user['password_hash'], password):
-                session['user_id'] = user['id']
-                session['user_name'] = user['name']
+            # Unknown emails are checked against a dummy hash, so both misses take as long
+            valid = verify_password(user['password_hash'] if user else None, password)
+            if user and valid:
+                # Hashes made with older KDF parameters are upgraded while the password is at hand;
+                # best-effort: with the pool busy the login goes on and a later one upgrades it
+                if needs_rehash(user['password_hash']):
+                    try:
+                        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (hash_password(password), user['id']))
+                        conn.commit()
+                    except AuthBusy:
+                        logging.info(f"Password rehash skipped for user {user['id']}: hashing pool busy")
+                start_user_session(conn, user['id'], user['name'])
+                conn.close()
                 flash('Login realizado com sucesso!', 'success')
                 return redirect(url_for('dashboard'))
             else:
+                conn.close()
                 flash('Email ou senha incorretos.', 'error')
                 
+        except AuthBusy:
+            if conn:
+                conn.close()
+            flash(AUTH_BUSY_MESSAGE, 'error')
+            return render_template('login.html'), 503
         except Exception as e:
             logging.error(f"Error during login: {e}")
             flash('Erro ao fazer login. Tente novamente.', 'error')
     
     return render_template('login.html')
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.clear()
     flash('Logout realizado com sucesso.', 'success')
     return redirect(url_for('login'))
 
-@app.route('/dashboard')
+@route('/logout-all', methods=['POST'])
+@require_login
+def logout_all():
+    """Revoke every session of the user (all devices)"""
+    current_app.session_interface.store.revoke_user(session['user_id'])
+    session.clear()
+    flash('Você saiu de todos os dispositivos.', 'success')
+    return redirect(url_for('login'))
+
+@route('/dashboard')
 @require_login
 def dashboard():
     user_id = session['user_id']
     trial_active, trial_message = check_trial_status(user_id)
     
     try:
-        conn = get_db_connection()
+        conn = LazyConnection()
         
         # Get accounts with calculated balances
-        accounts = conn.execute('''
+        accounts = cached_query(user_id, 'dashboard.accounts', (), lambda: rows_to_dicts(conn.execute('''
             SELECT a.id, a.name, a.initial_balance,
-                   COALESCE(SUM(CASE 
+                   a.archived_total + COALESCE(SUM(CASE 
                        WHEN e.type = 'receita' THEN e.amount
                        WHEN e.type = 'despesa' THEN -e.amount
+                       WHEN e.type = 'transferencia' THEN e.amount
                        ELSE 0
                    END), 0) as transactions_total
             FROM accounts a
             LEFT JOIN entries e ON a.id = e.account_id
             WHERE a.user_id = ?
             GROUP BY a.id, a.name, a.initial_balance
-        ''', (user_id,)).fetchall()
+        ''', (user_id,)).fetchall()))
         
         # Calculate total balance
         total_balance = sum(acc['initial_balance'] + acc['transactions_total'] for acc in accounts)
@@ -183,30 +309,30 @@ def dashboard():
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         month_start_utc = month_start.astimezone(timezone.utc).isoformat()
         
-        monthly_stats = conn.execute('''
+        monthly_stats = cached_query(user_id, 'dashboard.monthly_stats', (month_start_utc,), lambda: row_to_dict(conn.execute('''
             SELECT 
                 SUM(CASE WHEN type = 'receita' THEN amount ELSE 0 END) as receitas,
                 SUM(CASE WHEN type = 'despesa' THEN amount ELSE 0 END) as despesas
             FROM entries 
             WHERE user_id = ? AND when_utc >= ?
-        ''', (user_id, month_start_utc)).fetchone()
+        ''', (user_id, month_start_utc)).fetchone()))
         
         receitas_mes = monthly_stats['receitas'] or 0
         despesas_mes = monthly_stats['despesas'] or 0
         
         # Get recent transactions
-        recent_entries = conn.execute('''
+        recent_entries = cached_query(user_id, 'dashboard.recent_entries', (), lambda: rows_to_dicts(conn.execute(f'''
             SELECT e.*, a.name as account_name, c.name as category_name
-            FROM entries e
+            FROM {entries_source_for_page(conn, user_id, 0, 5)} e
             JOIN accounts a ON e.account_id = a.id
             LEFT JOIN categories c ON e.category_id = c.id
             WHERE e.user_id = ?
             ORDER BY e.when_utc DESC
             LIMIT 5
-        ''', (user_id,)).fetchall()
+        ''', (user_id,)).fetchall()))
         
         # Get upcoming bills
-        upcoming_bills = conn.execute('''
+        upcoming_bills = cached_query(user_id, 'dashboard.upcoming_bills', (), lambda: rows_to_dicts(conn.execute('''
             SELECT b.*, a.name as account_name, c.name as category_name
             FROM bills b
             JOIN accounts a ON b.account_id = a.id
@@ -214,19 +340,29 @@ def dashboard():
             WHERE b.user_id = ? AND b.status = 'pendente'
             ORDER BY b.due_date_utc ASC
             LIMIT 5
-        ''', (user_id,)).fetchall()
+        ''', (user_id,)).fetchall()))
         
         # Bills summary
-        bills_summary = conn.execute('''
+        bills_summary = cached_query(user_id, 'dashboard.bills_summary', (), lambda: row_to_dict(conn.execute('''
             SELECT 
                 COUNT(CASE WHEN status = 'pendente' AND type = 'pagar' THEN 1 END) as contas_pagar,
                 COUNT(CASE WHEN status = 'pendente' AND type = 'receber' THEN 1 END) as contas_receber,
                 COUNT(CASE WHEN status = 'vencido' THEN 1 END) as contas_vencidas
             FROM bills WHERE user_id = ?
-        ''', (user_id,)).fetchone()
+        ''', (user_id,)).fetchone()))
+        
+        # Monthly budgets (counters kept by the entry triggers, no entries scan)
+        budgets = cached_query(user_id, 'dashboard.budgets', (current_month(),), lambda: budget_status(conn, user_id))
+        _, categories = get_accounts_and_categories(conn, user_id)
+        
+        # Reminders and alerts written by the scheduler thread (not cached: it does not bump versions)
+        notifications = unread_notifications(conn, user_id, limit=5)
         
         conn.close()
         
+        # Projected balances (incrementally maintained by the forecast engine)
+        forecast = forecast_summary(user_id, FORECAST_DAYS)
+        
         return render_template('dashboard.html', 
                              trial_active=trial_active,
                              trial_message=trial_message,
@@ -237,6 +373,10 @@ def dashboard():
                              recent_entries=recent_entries,
                              upcoming_bills=upcoming_bills,
                              bills_summary=bills_summary,
+                             forecast=forecast,
+                             budgets=budgets,
+                             expense_categories=[c for c in categories if c['type'] == 'despesa'],
+                             notifications=notifications,
                              now_utc=datetime.now(timezone.utc).isoformat())
         
     except Exception as e:
@@ -252,9 +392,13 @@ def dashboard():
                              recent_entries=[],
                              upcoming_bills=[],
                              bills_summary=None,
+                             forecast=None,
+                             budgets=[],
+                             expense_categories=[],
+                             notifications=[],
                              now_utc=datetime.now(timezone.utc).isoformat())
 
-@app.route('/lancamentos', methods=['GET', 'POST'])
+@route('/lancamentos', methods=['GET', 'POST'])
 @require_login
 def lancamentos():
     user_id = session['user_id']
@@ -273,34 +417,39 @@ def lancamentos():
             category_id = request.form.get('category_id') or None
             when_str = request.form.get('when', '').strip()
             
+            # Transfers have their own flow (both legs in one transaction)
+            if tipo not in ('receita', 'despesa'):
+                flash('Tipo inválido.', 'error')
+                return redirect(url_for('lancamentos'))
+            
             # Parse amount
             amount = parse_br_currency(amount_str)
-            if amount <= 0:
+            if not (math.isfinite(amount) and amount > 0):
                 flash('Valor deve ser maior que zero.', 'error')
                 return redirect(url_for('lancamentos'))
             
             # Parse datetime
             when_utc = parse_br_datetime(when_str)
             
-            conn = get_db_connection()
+            def write(conn):
+                # Verify account and category belong to user
+                account = conn.execute('SELECT id FROM accounts WHERE id = ? AND user_id = ?', 
+                                     (account_id, user_id)).fetchone()
+                if not account:
+                    return 'Conta inválida.'
+                if category_id is not None and not category_matches(conn, user_id, category_id, tipo):
+                    return 'Categoria inválida.'
+                
+                # Create entry
+                insert_entry(conn, user_id, account_id, category_id, tipo, amount, note, when_utc)
+                return None
             
-            # Verify account belongs to user
-            account = conn.execute('SELECT id FROM accounts WHERE id = ? AND user_id = ?', 
-                                 (account_id, user_id)).fetchone()
-            if not account:
-                flash('Conta inválida.', 'error')
-                conn.close()
+            error = run_write(write)
+            if error:
+                flash(error, 'error')
                 return redirect(url_for('lancamentos'))
-            
-            # Create entry
-            created_at_utc = datetime.now(timezone.utc).isoformat()
-            conn.execute('''
-                INSERT INTO entries (user_id, account_id, category_id, type, amount, note, when_utc, created_at_utc)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, account_id, category_id, tipo, amount, note, when_utc, created_at_utc))
-            
-            conn.commit()
-            conn.close()
+            bump_user_version(user_id)
+            notify_forecast_write(user_id, entries=True)
             
             flash('Lançamento criado com sucesso!', 'success')
             return redirect(url_for('lancamentos'))
@@ -311,24 +460,23 @@ def lancamentos():
     
     # Get user's accounts and categories
     try:
-        conn = get_db_connection()
-        accounts = conn.execute('SELECT id, name FROM accounts WHERE user_id = ?', (user_id,)).fetchall()
-        categories = conn.execute('SELECT id, name, type FROM categories WHERE user_id = ?', (user_id,)).fetchall()
+        conn = LazyConnection()
+        accounts, categories = get_accounts_and_categories(conn, user_id)
         
         # Get entries with pagination
         page = request.args.get('page', 1, type=int)
         per_page = 20
         offset = (page - 1) * per_page
         
-        entries = conn.execute('''
+        entries = cached_query(user_id, 'lancamentos.entries', (page,), lambda: rows_to_dicts(conn.execute(f'''
             SELECT e.*, a.name as account_name, c.name as category_name
-            FROM entries e
+            FROM {entries_source_for_page(conn, user_id, offset, per_page)} e
             JOIN accounts a ON e.account_id = a.id
             LEFT JOIN categories c ON e.category_id = c.id
             WHERE e.user_id = ?
             ORDER BY e.when_utc DESC
             LIMIT ? OFFSET ?
-        ''', (user_id, per_page, offset)).fetchall()
+        ''', (user_id, per_page, offset)).fetchall()))
         
         conn.close()
         
@@ -349,7 +497,197 @@ def lancamentos():
                              categories=[],
                              entries=[])
 
-@app.route('/relatorios')
+@route('/lancamentos/transferencia', methods=['POST'])
+@require_login
+def transferencia():
+    """Move money between two of the user's accounts (form post or JSON)"""
+    user_id = session['user_id']
+    trial_active, trial_message = check_trial_status(user_id)
+    wants_json = request.is_json
+    data = (request.get_json(silent=True) or {}) if wants_json else request.form
+    
+    def fail(message, status=400):
+        if wants_json:
+            return jsonify({'status': 'error', 'message': message}), status
+        flash(f'{message}.', 'error')
+        return redirect(url_for('lancamentos'))
+    
+    if not trial_active:
+        return fail(f'Acesso restrito: {trial_message}', 403)
+    
+    conn = None
+    try:
+        amount = data.get('amount')
+        amount = parse_br_currency(amount) if isinstance(amount, str) else float(amount or 0)
+        when_utc = parse_br_datetime((data.get('when') or '').strip())
+        
+        conn = get_db_connection()
+        transfer_group = create_transfer(conn, user_id, data.get('from_account_id'), data.get('to_account_id'),
+                                         amount, when_utc, (data.get('note') or '').strip() or None)
+        conn.commit()
+    except (TypeError, ValueError) as e:
+        if conn:
+            conn.rollback()
+            conn.close()
+        return fail(str(e))
+    except Exception as e:
+        logging.error(f"Error creating transfer: {e}")
+        if conn:
+            conn.rollback()
+            conn.close()
+        return fail('Erro ao criar transferência. Nenhuma conta foi alterada', 500)
+    conn.close()
+    bump_user_version(user_id)
+    notify_forecast_write(user_id, entries=True)
+    
+    if wants_json:
+        return jsonify({'status': 'ok', 'transfer_group': transfer_group})
+    flash('Transferência realizada com sucesso!', 'success')
+    return redirect(url_for('lancamentos'))
+
+# Request field -> (column, parser) for entry and bill edits
+def _parse_amount(value):
+    return parse_br_currency(value) if isinstance(value, str) else float(value)
+
+def _parse_optional_id(value):
+    return int(value) if value not in (None, '') else None
+
+EDIT_FIELDS = {
+    'type': ('type', str),
+    'amount': ('amount', _parse_amount),
+    'account_id': ('account_id', int),
+    'category_id': ('category_id', _parse_optional_id),
+    'note': ('note', lambda value: (value or '').strip()),
+    'when': ('when_utc', lambda value: parse_br_datetime(value.strip())),
+    'description': ('description', lambda value: value.strip()),
+    'due_date': ('due_date_utc', lambda value: parse_br_datetime(value.strip())),
+    'notes': ('notes', lambda value: (value or '').strip()),
+    'recurring': ('recurring', str),
+}
+
+# Fields an edit may clear; for the others an empty value means "unchanged"
+CLEARABLE_FIELDS = ('category_id', 'note', 'notes')
+
+def parse_edit_changes(data, fields):
+    """Fields present in an edit request (form or JSON), parsed: {column: value}"""
+    changes = {}
+    for field in fields:
+        if field in data and (field in CLEARABLE_FIELDS or data[field] not in (None, '')):
+            column, parse = EDIT_FIELDS[field]
+            changes[column] = parse(data[field])
+    return changes
+
+def write_response(wants_json, endpoint, message, status=200, **payload):
+    """JSON for API clients; flash and redirect for form posts"""
+    if wants_json:
+        return jsonify({'status': 'ok' if status < 400 else 'error', 'message': message, **payload}), status
+    flash(message, 'success' if status < 400 else 'error')
+    return redirect(url_for(endpoint))
+
+def apply_user_write(user_id, endpoint, write, success_message, error_message):
+    """Run write(conn) -> notify kwargs in one transaction, then bump caches and the projection"""
+    wants_json = request.is_json
+    trial_active, trial_message = check_trial_status(user_id)
+    if not trial_active:
+        return write_response(wants_json, endpoint, f'Acesso restrito: {trial_message}', 403)
+    data = (request.get_json(silent=True) or {}) if wants_json else request.form
+    try:
+        notify = run_write(lambda conn: write(conn, data))
+    except LookupError as e:
+        return write_response(wants_json, endpoint, str(e), 404)
+    except (TypeError, ValueError) as e:
+        return write_response(wants_json, endpoint, str(e), 400)
+    except Exception as e:
+        logging.error(f"Error in {endpoint} write: {e}")
+        return write_response(wants_json, endpoint, error_message, 500)
+    bump_user_version(user_id)
+    notify_forecast_write(user_id, **notify)
+    if 'bill_due_utc' in notify:
+        reminder_scheduler.notify_bill_write(user_id)
+    return write_response(wants_json, endpoint, success_message)
+
+@route('/lancamentos/<int:entry_id>/editar', methods=['POST'])
+@require_login
+def editar_lancamento(entry_id):
+    """Edit a lançamento (both legs of a transfer); checkpoints and search follow in the same transaction"""
+    # Read here: with the write coordinator the job runs outside the request context
+    user_id = session['user_id']
+    def write(conn, data):
+        changes = parse_edit_changes(data, ('type', 'amount', 'account_id', 'category_id', 'note', 'when'))
+        update_entry(conn, user_id, entry_id, changes)
+        return {'entries': True}
+    return apply_user_write(user_id, 'lancamentos', write,
+                            'Lançamento atualizado com sucesso!', 'Erro ao atualizar lançamento.')
+
+@route('/lancamentos/<int:entry_id>/excluir', methods=['POST'])
+@require_login
+def excluir_lancamento(entry_id):
+    """Delete a lançamento (both legs of a transfer)"""
+    user_id = session['user_id']
+    def write(conn, data):
+        delete_entry(conn, user_id, entry_id)
+        return {'entries': True}
+    return apply_user_write(user_id, 'lancamentos', write,
+                            'Lançamento excluído com sucesso!', 'Erro ao excluir lançamento.')
+
+@route('/api/orcamentos')
+@require_login
+def api_orcamentos():
+    """This month's budgets (limit, spent, percent) and the user's alerts not yet notified"""
+    user_id = session['user_id']
+    month = request.args.get('month') or current_month()
+    if not re.fullmatch(r'\d{4}-\d{2}', month):
+        return jsonify({'status': 'error', 'message': 'Mês inválido. Use AAAA-MM.'}), 400
+    conn = LazyConnection()
+    try:
+        budgets = cached_query(user_id, 'dashboard.budgets', (month,), lambda: budget_status(conn, user_id, month))
+        alerts = pending_alerts(conn, user_id)
+    finally:
+        conn.close()
+    return jsonify({'status': 'ok', 'month': month, 'budgets': budgets, 'alerts': alerts})
+
+@route('/api/notificacoes')
+@require_login
+def api_notificacoes():
+    """The user's unread notifications (due-date reminders, budget alerts), newest first"""
+    conn = get_db_connection()
+    try:
+        notifications = unread_notifications(conn, session['user_id'])
+    finally:
+        conn.close()
+    return jsonify({'status': 'ok', 'notifications': notifications})
+
+@route('/notificacoes/lidas', methods=['POST'])
+@require_login
+def marcar_notificacoes_lidas():
+    """Mark the given notification ids (form or JSON `ids`), or all unread ones, as read"""
+    user_id = session['user_id']
+    wants_json = request.is_json
+    def write(conn, data):
+        ids = data.get('ids') if wants_json else data.getlist('ids')
+        mark_notifications_read(conn, user_id, [int(i) for i in ids] if ids else None)
+        return {}
+    return apply_user_write(user_id, 'dashboard', write,
+                            'Notificações marcadas como lidas.', 'Erro ao atualizar notificações.')
+
+@route('/orcamentos', methods=['POST'])
+@require_login
+def definir_orcamento():
+    """Set a despesa category's monthly limit (form or JSON); an empty or zero limit removes it"""
+    user_id = session['user_id']
+    def write(conn, data):
+        category_id = int(data.get('category_id'))
+        limit = data.get('limit')
+        limit = _parse_amount(limit) if limit not in (None, '') else 0
+        if limit:
+            set_budget(conn, user_id, category_id, limit)
+        elif not delete_budget(conn, user_id, category_id):
+            raise LookupError("Orçamento não encontrado")
+        return {}
+    return apply_user_write(user_id, 'dashboard', write,
+                            'Orçamento salvo com sucesso!', 'Erro ao salvar orçamento.')
+
+@route('/relatorios')
 @require_login
 def relatorios():
     user_id = session['user_id']
@@ -359,58 +697,40 @@ def relatorios():
         flash(f'Acesso restrito: {trial_message}. Assine o plano PRO para continuar.', 'error')
         return redirect(url_for('assinatura'))
     
+    # Period and granularity (default: current month, daily)
+    default_start, default_end = default_period()
+    granularity = request.args.get('granularity', 'dia')
+    if granularity not in GRANULARITIES:
+        granularity = 'dia'
     try:
-        conn = get_db_connection()
-        
-        # Get current month data
-        now = datetime.now(ZoneInfo('America/Sao_Paulo'))
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        month_start_utc = month_start.astimezone(timezone.utc).isoformat()
+        start_day = parse_report_date(request.args.get('from')) or default_start
+        end_day = parse_report_date(request.args.get('to')) or default_end
+    except ValueError:
+        flash('Período inválido. Use datas no formato DD/MM/AAAA.', 'error')
+        start_day, end_day = default_start, default_end
+    if end_day < start_day:
+        start_day, end_day = end_day, start_day
+    
+    period = {'from': start_day.isoformat(), 'to': end_day.isoformat(), 'granularity': granularity}
+    
+    try:
+        conn = LazyConnection()
         
-        # Monthly P&L
-        monthly_pl = conn.execute('''
-            SELECT 
-                type,
-                SUM(amount) as total
-            FROM entries 
-            WHERE user_id = ? AND when_utc >= ?
-            GROUP BY type
-        ''', (user_id, month_start_utc)).fetchall()
+        def compute_report():
+            _, categories = get_accounts_and_categories(conn, user_id)
+            category_names = {category['id']: category['name'] for category in categories}
+            columns = load_entry_columns(conn, user_id, start_day, end_day)
+            return build_report(columns, start_day, end_day, granularity, category_names)
         
-        # Top categories
-        top_categories = conn.execute('''
-            SELECT 
-                c.name as category_name,
-                e.type,
-                SUM(e.amount) as total
-            FROM entries e
-            JOIN categories c ON e.category_id = c.id
-            WHERE e.user_id = ? AND e.when_utc >= ?
-            GROUP BY c.id, c.name, e.type
-            ORDER BY total DESC
-            LIMIT 10
-        ''', (user_id, month_start_utc)).fetchall()
-        
-        # Daily cash flow for current month
-        daily_flow = conn.execute('''
-            SELECT 
-                DATE(when_utc) as day,
-                SUM(CASE WHEN type = 'receita' THEN amount ELSE 0 END) as receitas,
-                SUM(CASE WHEN type = 'despesa' THEN amount ELSE 0 END) as despesas
-            FROM entries 
-            WHERE user_id = ? AND when_utc >= ?
-            GROUP BY DATE(when_utc)
-            ORDER BY day
-        ''', (user_id, month_start_utc)).fetchall()
+        report = cached_query(user_id, 'relatorios.report', (period['from'], period['to'], granularity), compute_report)
         
         conn.close()
         
         return render_template('relatorios.html',
                              trial_active=trial_active,
                              trial_message=trial_message,
-                             monthly_pl=monthly_pl,
-                             top_categories=top_categories,
-                             daily_flow=daily_flow)
+                             report=report,
+                             period=period)
         
     except Exception as e:
         logging.error(f"Error in relatorios: {e}")
@@ -418,11 +738,50 @@ def relatorios():
         return render_template('relatorios.html',
                              trial_active=trial_active,
                              trial_message=trial_message,
-                             monthly_pl=[],
-                             top_categories=[],
-                             daily_flow=[])
+                             report=None,
+                             period=period)
+
+@route('/buscar')
+@require_login
+def buscar():
+    user_id = session['user_id']
+    trial_active, trial_message = check_trial_status(user_id)
+    
+    if not trial_active:
+        flash(f'Acesso restrito: {trial_message}. Assine o plano PRO para continuar.', 'error')
+        return redirect(url_for('assinatura'))
+    
+    term = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'todos')
+    if scope not in SEARCH_SCOPES:
+        scope = 'todos'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 20
+    
+    entries, entries_more, bills, bills_more = [], False, [], False
+    if term:
+        try:
+            conn = get_db_connection()
+            if scope in ('todos', 'lancamentos'):
+                entries, entries_more = search_entries(conn, user_id, term, page, per_page)
+            if scope in ('todos', 'contas'):
+                bills, bills_more = search_bills(conn, user_id, term, page, per_page)
+            conn.close()
+        except Exception as e:
+            logging.error(f"Error in buscar: {e}")
+            flash('Erro ao realizar a busca.', 'error')
+    
+    return render_template('buscar.html',
+                         trial_active=trial_active,
+                         trial_message=trial_message,
+                         term=term,
+                         scope=scope,
+                         page=page,
+                         entries=entries,
+                         bills=bills,
+                         has_more=entries_more or bills_more)
 
-@app.route('/chat')
+@route('/chat')
 @require_login
 def chat():
     user_id = session['user_id']
@@ -432,7 +791,7 @@ def chat():
                          trial_active=trial_active,
                          trial_message=trial_message)
 
-@app.route('/assinatura', methods=['GET', 'POST'])
+@route('/assinatura', methods=['GET', 'POST'])
 @require_login
 def assinatura():
     user_id = session['user_id']
@@ -445,6 +804,7 @@ def assinatura():
             conn.execute('UPDATE users SET subscribed = 1 WHERE id = ?', (user_id,))
             conn.commit()
             conn.close()
+            get_current_profile(refresh=True)
             
             flash('Assinatura ativada com sucesso! Bem-vindo ao plano PRO.', 'success')
             return redirect(url_for('dashboard'))
@@ -457,7 +817,7 @@ def assinatura():
                          trial_active=trial_active,
                          trial_message=trial_message)
 
-@app.route('/checkout')
+@route('/checkout')
 @require_login
 def checkout():
     user_id = session['user_id']
@@ -488,7 +848,7 @@ def checkout():
                          price=price,
                          mp_token_configured=mp_token_configured)
 
-@app.route('/checkout', methods=['POST'])
+@route('/checkout', methods=['POST'])
 @require_login
 def process_checkout():
     user_id = session['user_id']
@@ -518,7 +878,7 @@ def process_checkout():
         if mp_token and mp_token.strip():
             try:
                 # Configurar SDK do Mercado Pago
-                sdk = mercadopago.SDK(mp_token)
+                sdk = get_mercadopago_sdk(mp_token)
                 
                 # Dados da preferência de pagamento
                 preference_data = {
@@ -584,6 +944,7 @@ def process_checkout():
             
             conn.commit()
             conn.close()
+            get_current_profile(refresh=True)
             
             flash(f'Pagamento simulado com sucesso! Plano {plan.title() if plan else "Stand"} ativado.', 'success')
             return redirect(url_for('dashboard'))
@@ -599,7 +960,7 @@ def process_checkout():
     
     return redirect(url_for('checkout', plan=plan, price=price))
 
-@app.route('/payment-success')
+@route('/payment-success')
 @require_login
 def payment_success():
     # Processar retorno de sucesso do Mercado Pago
@@ -627,6 +988,7 @@ def payment_success():
             
             conn.commit()
             conn.close()
+            get_current_profile(refresh=True)
             
             flash(f'Pagamento aprovado! Plano {plan.title()} ativado com sucesso.', 'success')
             
@@ -636,19 +998,19 @@ def payment_success():
     
     return redirect(url_for('dashboard'))
 
-@app.route('/payment-failure')
+@route('/payment-failure')
 @require_login
 def payment_failure():
     flash('Pagamento não foi aprovado. Tente novamente ou escolha outro método.', 'error')
     return redirect(url_for('assinatura'))
 
-@app.route('/payment-pending')
+@route('/payment-pending')
 @require_login
 def payment_pending():
     flash('Pagamento está pendente. Você receberá uma confirmação quando for aprovado.', 'info')
     return redirect(url_for('dashboard'))
 
-@app.route('/api/assistant', methods=['POST'])
+@route('/api/assistant', methods=['POST'])
 @require_login
 def api_assistant():
     user_id = session['user_id']
@@ -660,15 +1022,189 @@ def api_assistant():
         if not message:
             return jsonify({'status': 'error', 'message': 'Mensagem não pode estar vazia'})
         
-        answer = get_assistant_response(user_id, message)
+        answer = ask_assistant(user_id, message)
         
         return jsonify({'status': 'ok', 'answer': answer})
         
+    except AssistantBusy:
+        return jsonify({'status': 'error', 'message': 'Assistente ocupado. Tente novamente em instantes.'}), 429
+    except AssistantTimeout:
+        return jsonify({'status': 'error', 'message': 'Tempo esgotado ao consultar o assistente.'}), 504
     except Exception as e:
         logging.error(f"Error in assistant: {e}")
-        return jsonify({'status': 'error', 'message': 'Erro interno do servidor'})
+        return jsonify({'status': 'error', 'message': 'Erro interno do servidor'}), 500
+
+@route('/api/assistant/stream', methods=['POST'])
+@require_login
+def api_assistant_stream():
+    """Assistant answer streamed as Server-Sent Events"""
+    user_id = session['user_id']
+    data = request.get_json(silent=True) or {}
+    message = (data.get('message') or '').strip()
+    
+    if not message:
+        return Response(sse_event({'message': 'Mensagem não pode estar vazia'}, event='error'),
+                        status=400, mimetype='text/event-stream')
+    
+    try:
+        stream = submit_assistant_stream(user_id, message)
+    except AssistantBusy:
+        return Response(sse_event({'message': 'Assistente ocupado. Tente novamente em instantes.'}, event='error'),
+                        status=429, mimetype='text/event-stream')
+    
+    return Response(stream_assistant_response(stream), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/api/chat/history')
+@require_login
+def api_chat_history():
+    """Paginated (newest first) assistant conversation of the logged user"""
+    user_id = session['user_id']
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    
+    try:
+        conn = get_db_connection()
+        messages, has_more = get_chat_history(conn, user_id, page, per_page)
+        conn.close()
+        return jsonify({'status': 'ok', 'page': page, 'has_more': has_more, 'messages': messages})
+    except Exception as e:
+        logging.error(f"Error loading chat history: {e}")
+        return jsonify({'status': 'error', 'message': 'Erro ao carregar histórico'})
+
+@route('/metrics')
+@require_admin
+def metrics():
+    """Per-route request and SQL aggregates in Prometheus text format"""
+    return Response(route_metrics.render() + auth_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@route('/admin/profiles')
+@require_admin
+def admin_profiles():
+    """Stored request profiles (ring buffer), newest first"""
+    return jsonify({'status': 'ok', 'profiles': list_profiles()})
+
+@route('/admin/profiles/<name>')
+@require_admin
+def admin_profile_download(name):
+    path = profile_path(name)
+    if not path:
+        return jsonify({'status': 'error', 'message': 'Perfil não encontrado'}), 404
+    return send_file(path, as_attachment=True, download_name=name, mimetype='application/gzip')
+
+@route('/admin/archive', methods=['GET', 'POST'])
+@require_admin
+def admin_archive():
+    """Hot/cold entries split; POST moves entries older than the horizon to the yearly archives"""
+    conn = get_db_connection()
+    try:
+        moved = archive_entries(conn) if request.method == 'POST' else {}
+        stats = archive_stats(conn)
+    except Exception as e:
+        logging.error(f"Error archiving entries: {e}")
+        return jsonify({'status': 'error', 'message': 'Erro ao arquivar lançamentos'}), 500
+    finally:
+        conn.close()
+    return jsonify({'status': 'ok', 'moved': {str(year): count for year, count in moved.items()}, 'archive': stats})
+
+@route('/admin/backups', methods=['GET', 'POST'])
+@require_admin
+def admin_backups():
+    """Local database snapshots, newest first; POST takes a new one (online, in paged steps)"""
+    created = None
+    if request.method == 'POST':
+        try:
+            created = os.path.basename(create_backup())
+        except (BackupError, sqlite3.Error, OSError) as e:
+            logging.error(f"Error creating backup: {e}")
+            return jsonify({'status': 'error', 'message': 'Erro ao criar backup'}), 500
+    backups = [{key: value for key, value in backup.items() if key != 'path'} for backup in list_backups()]
+    return jsonify({'status': 'ok', 'created': created, 'backups': backups})
+
+@route('/admin/consistency', methods=['GET', 'POST'])
+@require_admin
+def admin_consistency():
+    """Derived data (checkpoints, archived totals, search index, transfers) against a full recompute; POST repairs"""
+    user_id = request.args.get('user_id', type=int)
+    conn = get_db_connection()
+    try:
+        problems = check_consistency(conn, user_id, repair=request.method == 'POST')
+    except Exception as e:
+        logging.error(f"Error checking consistency: {e}")
+        return jsonify({'status': 'error', 'message': 'Erro ao verificar consistência'}), 500
+    finally:
+        conn.close()
+    return jsonify({'status': 'ok', 'consistent': not problems, 'repaired': bool(problems) and request.method == 'POST',
+                    'problems': problems})
+
+@route('/api/chat/stats')
+@require_admin
+def api_chat_stats():
+    """Intent frequency and latency, to guide cache and index work"""
+    conn = get_db_connection()
+    stats = get_intent_stats(conn)
+    conn.close()
+    return jsonify({'status': 'ok', 'intents': stats})
+
+@route('/api/cache/stats')
+@require_admin
+def api_cache_stats():
+    """Process-wide query cache statistics (all users)"""
+    return jsonify(cache_stats())
+
+@route('/api/previsao')
+@require_login
+def api_previsao():
+    """Day-by-day projected balance per account (?days=30 or 90)"""
+    user_id = session['user_id']
+    days = request.args.get('days', 30, type=int)
+    if days not in (30, 90):
+        return jsonify({'status': 'error', 'message': 'Período inválido. Use 30 ou 90 dias.'}), 400
+    
+    try:
+        return jsonify({'status': 'ok', 'forecast': forecast_summary(user_id, days)})
+    except Exception as e:
+        logging.error(f"Error in forecast: {e}")
+        return jsonify({'status': 'error', 'message': 'Erro interno do servidor'}), 500
+
+@route('/api/saldo/historico')
+@require_login
+def api_saldo_historico():
+    """Balance per account over time (?from=&to=&granularity=dia|mes), for charts"""
+    user_id = session['user_id']
+    granularity = request.args.get('granularity', 'dia')
+    if granularity not in HISTORY_GRANULARITIES:
+        return jsonify({'status': 'error', 'message': 'Granularidade inválida. Use dia ou mes.'}), 400
+    
+    today = datetime.now(ZoneInfo('America/Sao_Paulo')).date()
+    default_start = today - timedelta(days=29) if granularity == 'dia' else today.replace(day=1, year=today.year - 1)
+    try:
+        start_day = parse_report_date(request.args.get('from')) or default_start
+        end_day = parse_report_date(request.args.get('to')) or today
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Período inválido. Use datas no formato AAAA-MM-DD.'}), 400
+    if end_day < start_day:
+        start_day, end_day = end_day, start_day
+    if granularity == 'dia' and (end_day - start_day).days >= HISTORY_MAX_DAYS:
+        return jsonify({'status': 'error',
+                        'message': f'Período muito longo. Use até {HISTORY_MAX_DAYS} dias ou granularidade mes.'}), 400
+    
+    try:
+        conn = LazyConnection()
+        history = cached_query(user_id, 'balance.history', (start_day.isoformat(), end_day.isoformat(), granularity),
+                               lambda: balance_history(conn, user_id, start_day, end_day, granularity))
+        conn.close()
+        return jsonify({'status': 'ok', 'history': history})
+    except Exception as e:
+        logging.error(f"Error in balance history: {e}")
+        return jsonify({'status': 'error', 'message': 'Erro interno do servidor'}), 500
 
-@app.route('/contas-pagar-receber', methods=['GET', 'POST'])
+@route('/api/assistant/cache-stats')
+@require_login
+def api_assistant_cache_stats():
+    return jsonify(assistant_cache_stats())
+
+@route('/contas-pagar-receber', methods=['GET', 'POST'])
 @require_login
 def contas_pagar_receber():
     user_id = session['user_id']
@@ -693,7 +1229,7 @@ def contas_pagar_receber():
             amount = parse_br_currency(amount_str)
             due_date_utc = parse_br_datetime(due_date_str)
             
-            if amount <= 0:
+            if not (math.isfinite(amount) and amount > 0):
                 flash('Valor deve ser maior que zero.', 'error')
                 return redirect(url_for('contas_pagar_receber'))
             
@@ -701,27 +1237,33 @@ def contas_pagar_receber():
                 flash('Descrição é obrigatória.', 'error')
                 return redirect(url_for('contas_pagar_receber'))
             
-            conn = get_db_connection()
+            def write(conn):
+                # Verify account and category belong to user
+                account = conn.execute('SELECT id FROM accounts WHERE id = ? AND user_id = ?', 
+                                     (account_id, user_id)).fetchone()
+                if not account:
+                    return 'Conta inválida.'
+                if category_id is not None and not category_matches(
+                        conn, user_id, category_id, 'despesa' if bill_type == 'pagar' else 'receita'):
+                    return 'Categoria inválida.'
+                
+                # Create bill
+                created_at_utc = datetime.now(timezone.utc).isoformat()
+                conn.execute('''
+                    INSERT INTO bills (user_id, account_id, category_id, type, amount, description, 
+                                     due_date_utc, status, notes, recurring, created_at_utc)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, 'pendente', ?, ?, ?)
+                ''', (user_id, account_id, category_id, bill_type, amount, description, 
+                      due_date_utc, notes, recurring, created_at_utc))
+                return None
             
-            # Verify account belongs to user
-            account = conn.execute('SELECT id FROM accounts WHERE id = ? AND user_id = ?', 
-                                 (account_id, user_id)).fetchone()
-            if not account:
-                flash('Conta inválida.', 'error')
-                conn.close()
+            error = run_write(write)
+            if error:
+                flash(error, 'error')
                 return redirect(url_for('contas_pagar_receber'))
-            
-            # Create bill
-            created_at_utc = datetime.now(timezone.utc).isoformat()
-            conn.execute('''
-                INSERT INTO bills (user_id, account_id, category_id, type, amount, description, 
-                                 due_date_utc, status, notes, recurring, created_at_utc)
-                VALUES (?, ?, ?, ?, ?, ?, ?, 'pendente', ?, ?, ?)
-            ''', (user_id, account_id, category_id, bill_type, amount, description, 
-                  due_date_utc, notes, recurring, created_at_utc))
-            
-            conn.commit()
-            conn.close()
+            bump_user_version(user_id)
+            notify_forecast_write(user_id, bill_due_utc=due_date_utc)
+            reminder_scheduler.notify_bill_write(user_id)
             
             flash('Conta criada com sucesso!', 'success')
             return redirect(url_for('contas_pagar_receber'))
@@ -733,8 +1275,21 @@ def contas_pagar_receber():
     # Get user's accounts and categories
     try:
         conn = get_db_connection()
-        accounts = conn.execute('SELECT id, name FROM accounts WHERE user_id = ?', (user_id,)).fetchall()
-        categories = conn.execute('SELECT id, name, type FROM categories WHERE user_id = ?', (user_id,)).fetchall()
+        
+        # Update overdue bills (before listing, so statuses are current)
+        now_utc = datetime.now(timezone.utc).isoformat()
+        overdue = conn.execute('''
+            UPDATE bills 
+            SET status = 'vencido' 
+            WHERE user_id = ? AND status = 'pendente' AND due_date_utc < ?
+        ''', (user_id, now_utc))
+        conn.commit()
+        if overdue.rowcount:
+            bump_user_version(user_id)
+            # Overdue bills are still expected, so the projection does not change
+            notify_forecast_write(user_id)
+        
+        accounts, categories = get_accounts_and_categories(conn, user_id)
         
         # Get bills with filters
         status_filter = request.args.get('status', 'all')
@@ -759,19 +1314,11 @@ def contas_pagar_receber():
             
         query += ' ORDER BY b.due_date_utc ASC'
         
-        bills = conn.execute(query, params).fetchall()
-        
-        # Update overdue bills
-        now_utc = datetime.now(timezone.utc).isoformat()
-        conn.execute('''
-            UPDATE bills 
-            SET status = 'vencido' 
-            WHERE user_id = ? AND status = 'pendente' AND due_date_utc < ?
-        ''', (user_id, now_utc))
-        conn.commit()
+        bills = cached_query(user_id, 'contas.bills', (status_filter, type_filter),
+                             lambda: rows_to_dicts(conn.execute(query, params).fetchall()))
         
         # Get summary stats
-        summary = conn.execute('''
+        summary = cached_query(user_id, 'contas.summary', (), lambda: row_to_dict(conn.execute('''
             SELECT 
                 COUNT(CASE WHEN status = 'pendente' AND type = 'pagar' THEN 1 END) as contas_pagar_pendentes,
                 COUNT(CASE WHEN status = 'pendente' AND type = 'receber' THEN 1 END) as contas_receber_pendentes,
@@ -779,7 +1326,7 @@ def contas_pagar_receber():
                 SUM(CASE WHEN status = 'pendente' AND type = 'pagar' THEN amount ELSE 0 END) as valor_pagar,
                 SUM(CASE WHEN status = 'pendente' AND type = 'receber' THEN amount ELSE 0 END) as valor_receber
             FROM bills WHERE user_id = ?
-        ''', (user_id,)).fetchone()
+        ''', (user_id,)).fetchone()))
         
         conn.close()
         
@@ -806,7 +1353,7 @@ def contas_pagar_receber():
                              status_filter='all',
                              type_filter='all')
 
-@app.route('/bill/<int:bill_id>/pay', methods=['POST'])
+@route('/bill/<int:bill_id>/pay', methods=['POST'])
 @require_login
 def pay_bill(bill_id):
     user_id = session['user_id']
@@ -818,40 +1365,40 @@ def pay_bill(bill_id):
     try:
         paid_amount_str = request.form.get('paid_amount', '').strip()
         paid_amount = parse_br_currency(paid_amount_str) if paid_amount_str else None
+        if paid_amount is not None and not (math.isfinite(paid_amount) and paid_amount > 0):
+            flash('Valor deve ser maior que zero.', 'error')
+            return redirect(url_for('contas_pagar_receber'))
         
-        conn = get_db_connection()
-        
-        # Get bill info
-        bill = conn.execute('''
-            SELECT * FROM bills WHERE id = ? AND user_id = ? AND status = 'pendente'
-        ''', (bill_id, user_id)).fetchone()
+        def write(conn):
+            # Get bill info (a category that is not the user's does not reach the entry)
+            bill = load_user_bills(conn, user_id, [bill_id]).get(bill_id)
+            if not bill or bill['status'] != 'pendente':
+                return None
+            
+            # Use original amount if no amount specified
+            amount = paid_amount if paid_amount is not None else bill['amount']
+            
+            # Mark as paid (unless a concurrent request already did)
+            paid_date_utc = datetime.now(timezone.utc).isoformat()
+            if conn.execute('''
+                UPDATE bills 
+                SET status = 'pago', paid_date_utc = ?, paid_amount = ?
+                WHERE id = ? AND user_id = ? AND status != 'pago'
+            ''', (paid_date_utc, amount, bill_id, user_id)).rowcount == 0:
+                return None
+            
+            # Create corresponding entry
+            entry_type = 'despesa' if bill['type'] == 'pagar' else 'receita'
+            insert_entry(conn, user_id, bill['account_id'], bill['category_id'], entry_type,
+                         amount, f"Pagamento: {bill['description']}", paid_date_utc, paid_date_utc)
+            return bill
         
+        bill = run_write(write)
         if not bill:
-            conn.close()
             return jsonify({'status': 'error', 'message': 'Conta não encontrada'})
-        
-        # Use original amount if no amount specified
-        if paid_amount is None:
-            paid_amount = bill['amount']
-        
-        # Mark as paid
-        paid_date_utc = datetime.now(timezone.utc).isoformat()
-        conn.execute('''
-            UPDATE bills 
-            SET status = 'pago', paid_date_utc = ?, paid_amount = ?
-            WHERE id = ? AND user_id = ?
-        ''', (paid_date_utc, paid_amount, bill_id, user_id))
-        
-        # Create corresponding entry
-        entry_type = 'despesa' if bill['type'] == 'pagar' else 'receita'
-        conn.execute('''
-            INSERT INTO entries (user_id, account_id, category_id, type, amount, note, when_utc, created_at_utc)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, bill['account_id'], bill['category_id'], entry_type, 
-              paid_amount, f"Pagamento: {bill['description']}", paid_date_utc, paid_date_utc))
-        
-        conn.commit()
-        conn.close()
+        bump_user_version(user_id)
+        notify_forecast_write(user_id, entries=True, bill_due_utc=bill['due_date_utc'])
+        reminder_scheduler.notify_bill_write(user_id)
         
         flash('Conta marcada como paga!', 'success')
         return redirect(url_for('contas_pagar_receber'))
@@ -861,7 +1408,102 @@ def pay_bill(bill_id):
         flash('Erro ao marcar conta como paga.', 'error')
         return redirect(url_for('contas_pagar_receber'))
 
-@app.route('/export/csv')
+@route('/bill/<int:bill_id>/editar', methods=['POST'])
+@require_login
+def editar_conta(bill_id):
+    user_id = session['user_id']
+    def write(conn, data):
+        changes = parse_edit_changes(data, ('amount', 'account_id', 'category_id', 'description', 'due_date',
+                                            'notes', 'recurring'))
+        bill = update_bill(conn, user_id, bill_id, changes)
+        return {'bill_due_utc': min(bill['due_date_utc'], changes.get('due_date_utc', bill['due_date_utc']))}
+    return apply_user_write(user_id, 'contas_pagar_receber', write,
+                            'Conta atualizada com sucesso!', 'Erro ao atualizar conta.')
+
+@route('/bill/<int:bill_id>/excluir', methods=['POST'])
+@require_login
+def excluir_conta(bill_id):
+    user_id = session['user_id']
+    def write(conn, data):
+        bill = delete_bill(conn, user_id, bill_id)
+        return {'bill_due_utc': bill['due_date_utc']}
+    return apply_user_write(user_id, 'contas_pagar_receber', write,
+                            'Conta excluída com sucesso!', 'Erro ao excluir conta.')
+
+@route('/bills/bulk', methods=['POST'])
+@require_login
+def bulk_bills():
+    """Pay or reschedule many bills in one transaction, with a result per bill"""
+    user_id = session['user_id']
+    trial_active, trial_message = check_trial_status(user_id)
+    
+    if not trial_active:
+        return jsonify({'status': 'error', 'message': 'Acesso restrito'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    raw_items = data.get('items') or []
+    if action not in ('pay', 'reschedule') or not isinstance(raw_items, list) or not raw_items:
+        return jsonify({'status': 'error', 'message': 'Informe a ação (pay ou reschedule) e as contas.'}), 400
+    if len(raw_items) > BULK_MAX_ITEMS:
+        return jsonify({'status': 'error', 'message': f'Máximo de {BULK_MAX_ITEMS} contas por operação.'}), 400
+    
+    # Parse every item up front; invalid ones get an error result and are skipped
+    items, slots = [], []
+    for raw in raw_items:
+        raw = raw if isinstance(raw, dict) else {'id': raw}
+        try:
+            bill_id = int(raw.get('id'))
+        except (TypeError, ValueError):
+            slots.append({'id': raw.get('id'), 'status': 'error', 'message': 'Id inválido'})
+            continue
+        try:
+            if action == 'pay':
+                value = raw.get('paid_amount')
+                if isinstance(value, str):
+                    value = parse_br_currency(value) if value.strip() else None
+                items.append((bill_id, float(value) if value is not None else None))
+            else:
+                if not (raw.get('due_date') or '').strip():
+                    raise ValueError("Data de vencimento obrigatória")
+                items.append((bill_id, parse_br_datetime(raw['due_date'])))
+            slots.append(None)
+        except (TypeError, ValueError) as e:
+            slots.append({'id': bill_id, 'status': 'error', 'message': str(e)})
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        if action == 'pay':
+            results, earliest_due = pay_bills(conn, user_id, items) if items else ([], None)
+        else:
+            results, earliest_due = reschedule_bills(conn, user_id, items) if items else ([], None)
+        conn.commit()
+    except Exception as e:
+        logging.error(f"Error in bulk bills: {e}")
+        if conn:
+            conn.rollback()
+        return jsonify({'status': 'error', 'message': 'Erro ao processar as contas. Nenhuma foi alterada.'}), 500
+    finally:
+        if conn:
+            conn.close()
+    
+    if earliest_due:
+        bump_user_version(user_id)
+        notify_forecast_write(user_id, entries=action == 'pay', bill_due_utc=earliest_due)
+        reminder_scheduler.notify_bill_write(user_id)
+    
+    # Results in request order
+    processed = iter(results)
+    results = [slot if slot is not None else next(processed) for slot in slots]
+    return jsonify({
+        'status': 'ok',
+        'processed': sum(1 for result in results if result['status'] == 'ok'),
+        'failed': sum(1 for result in results if result['status'] == 'error'),
+        'results': results,
+    })
+
+@route('/export/csv')
 @require_login
 def export_csv():
     user_id = session['user_id']
@@ -877,9 +1519,9 @@ def export_csv():
         from io import StringIO
         
         conn = get_db_connection()
-        entries = conn.execute('''
+        entries = conn.execute(f'''
             SELECT e.when_utc, e.type, e.amount, e.note, a.name as account_name, c.name as category_name
-            FROM entries e
+            FROM {entries_source(conn)} e
             JOIN accounts a ON e.account_id = a.id
             LEFT JOIN categories c ON e.category_id = c.id
             WHERE e.user_id = ?
@@ -919,18 +1561,16 @@ def export_csv():
         flash('Erro ao exportar dados.', 'error')
         return redirect(url_for('relatorios'))
 
-# Make helper functions available in templates
-@app.template_global()
+# Make helper functions available in templates (registered by create_app)
 def brl(value):
     from helpers import brl as format_brl
     return format_brl(value)
 
-@app.template_global()
 def br_datetime(value):
     from helpers import br_datetime as format_br_datetime
     return format_br_datetime(value)
 
-@app.route('/perfil', methods=['GET', 'POST'])
+@route('/perfil', methods=['GET', 'POST'])
 @require_login
 def perfil():
     user_id = session['user_id']
@@ -945,13 +1585,11 @@ def perfil():
                 return redirect(url_for('perfil'))
             
             # Atualizar perfil
-            conn = get_db_connection()
-            conn.execute('UPDATE users SET name = ? WHERE id = ?', (name, user_id))
-            conn.commit()
-            conn.close()
+            run_write(lambda conn: conn.execute('UPDATE users SET name = ? WHERE id = ?', (name, user_id)))
+            bump_user_version(user_id)
             
             # Atualizar sessão
-            session['user_name'] = name
+            get_current_profile(refresh=True)
             
             flash('Perfil atualizado com sucesso!', 'success')
             return redirect(url_for('perfil'))
@@ -960,14 +1598,12 @@ def perfil():
             logging.error(f"Error updating profile: {e}")
             flash('Erro ao atualizar perfil.', 'error')
     
-    # Buscar dados do usuário
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    conn.close()
+    # Dados do usuário (snapshot da sessão)
+    user = get_current_profile()
     
     return render_template('perfil.html', user=user, trial_active=trial_active, trial_message=trial_message)
 
-@app.route('/upload-foto', methods=['POST'])
+@route('/upload-foto', methods=['POST'])
 @require_login
 def upload_foto():
     user_id = session['user_id']
@@ -999,10 +1635,10 @@ def upload_foto():
             
             # Atualizar banco de dados
             photo_url = f"uploads/{filename}"
-            conn = get_db_connection()
-            conn.execute('UPDATE users SET profile_photo = ? WHERE id = ?', (photo_url, user_id))
-            conn.commit()
-            conn.close()
+            run_write(lambda conn: conn.execute('UPDATE users SET profile_photo = ? WHERE id = ?',
+                                                (photo_url, user_id)))
+            bump_user_version(user_id)
+            get_current_profile(refresh=True)
             
             flash('Foto de perfil atualizada com sucesso!', 'success')
         else:
@@ -1014,7 +1650,7 @@ def upload_foto():
     
     return redirect(url_for('perfil'))
 
-@app.route('/chat-assistant', methods=['POST'])
+@route('/chat-assistant', methods=['POST'])
 @require_login
 def chat_assistant():
     """API endpoint para o assistente flutuante"""
@@ -1026,18 +1662,83 @@ def chat_assistant():
         if not user_message:
             return jsonify({'response': 'Por favor, digite uma mensagem válida.'})
         
-        # Usar o assistente existente
-        from ai_assistant import get_assistant_response
-        assistant_response = get_assistant_response(user_id, user_message)
+        # Usar o assistente existente (pool limitado)
+        assistant_response = ask_assistant(user_id, user_message)
         
         return jsonify({'response': assistant_response})
         
+    except AssistantBusy:
+        return jsonify({'response': '⏳ Assistente ocupado no momento. Tente novamente em instantes.'}), 429
     except Exception as e:
         logging.error(f"Error in chat assistant: {e}")
         return jsonify({'response': '❌ Desculpe, ocorreu um erro. Tente novamente.'})
 
+def build_worker_resources(database):
+    """Per-worker subsystems, started after fork and stopped on worker exit"""
+    resources = WorkerResources()
+    # First: everything started after it opens connections to the app's database
+    resources.register('database', start=database.activate)
+    resources.register('query_cache', start=reset_worker_cache)
+    resources.register('answer_cache', start=answer_cache.backend.clear)
+    resources.register('forecast', start=forecast_engine.clear)
+    resources.register('route_metrics', start=route_metrics.reset)
+    resources.register('assistant_pool', start=start_pool, stop=stop_pool)
+    resources.register('auth_hash_pool', start=start_hash_pool, stop=stop_hash_pool)
+    resources.register('chat_log', start=chat_log.reset, stop=chat_log.stop)
+    resources.register('write_coordinator', start=write_coordinator.start, stop=write_coordinator.stop)
+    resources.register('reminders', start=reminder_scheduler.start, stop=reminder_scheduler.stop)
+    return resources
+
+def create_app(config=None, overrides=None):
+    """Build the Flask app
+
+    config: a Config subclass or a mapping of overrides on top of Config;
+    overrides: a mapping applied after it. Building an app has no effect
+    on the process: its database is used once its worker resources start.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if isinstance(config, type):
+        app.config.from_object(config)
+    elif config:
+        app.config.update(config)
+    if overrides:
+        app.config.update(overrides)
+    app.secret_key = app.config['SECRET_KEY']
+
+    app.extensions['database'] = Database(app.config['DB_PATH'], app.config['USE_SQLITE_CLOUD'],
+                                          app.config['SQLITECLOUD_URL'])
+
+    # Server-side sessions: the cookie only carries an opaque id
+    app.session_interface = ServerSideSessionInterface(
+        make_session_store(app.config['SESSION_STORE'], app.config['SESSION_DB_PATH']))
+
+    # Per-request SQL timing (Server-Timing header, slow-query log, /metrics)
+    instrument_app(app)
+
+    # Opt-in request profiling (PROFILE_ENABLED=true); no hooks are installed otherwise
+    profile_app(app)
+
+    # Fingerprinted, precompressed JS/CSS bundles and on-the-fly HTML compression
+    assets_app(app)
+
+    app.before_request(ensure_database)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view.__name__, view, **options)
+    app.add_template_global(brl)
+    app.add_template_global(br_datetime)
+
+    app.extensions['worker_resources'] = build_worker_resources(app.extensions['database'])
+    return app
+
+def worker_resources(app):
+    return app.extensions['worker_resources']
+
+app = create_app()
+
 if __name__ == '__main__':
     # Initialize database
+    app.extensions['database'].activate()
     init_db()
     
     # Run app
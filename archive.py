@@ -0,0 +1,197 @@
+import os
+import logging
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from helpers import SIGNED_AMOUNT, get_db_connection
+
+# Entries whose local day is older than this many months (before the first day of
+# that month) move to per-year archive tables. Never less than 3: the dashboard,
+# the assistant and the forecast run-rate only read the last 90 days.
+ARCHIVE_HORIZON_MONTHS = max(3, int(os.environ.get("ARCHIVE_HORIZON_MONTHS", "24")))
+
+BR_TZ = ZoneInfo('America/Sao_Paulo')
+
+# Columns copied to the archive tables; a new entries column must be added here too
+ENTRY_COLUMNS = ('id', 'user_id', 'account_id', 'category_id', 'type', 'amount', 'note',
+                 'when_utc', 'local_day', 'transfer_group', 'created_at_utc')
+_COLUMN_LIST = ', '.join(ENTRY_COLUMNS)
+
+def archive_table(year):
+    return f"entries_archive_{int(year)}"
+
+def hot_floor(today=None):
+    """First local day that is never archived: entries on or after it are always in `entries`"""
+    today = today or datetime.now(BR_TZ).date()
+    month_index = today.year * 12 + today.month - 1 - ARCHIVE_HORIZON_MONTHS
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def archived_floor(conn):
+    """Day before which entries may be in an archive (what was actually moved), None if nothing was"""
+    row = conn.execute('SELECT MAX(archived_before) FROM entry_archives').fetchone()
+    return date.fromisoformat(row[0]) if row[0] else None
+
+def _archived_years(conn, start_day=None, end_day=None):
+    sql = 'SELECT year, table_name FROM entry_archives WHERE 1 = 1'
+    params = []
+    if start_day:
+        sql += ' AND year >= ?'
+        params.append(start_day.year)
+    if end_day:
+        sql += ' AND year <= ?'
+        params.append(end_day.year)
+    return [(row['year'], row['table_name']) for row in conn.execute(sql + ' ORDER BY year', params).fetchall()]
+
+def archived_tables(conn):
+    """Archive tables that hold entries, oldest year first"""
+    return [table for _, table in _archived_years(conn)]
+
+def refresh_search_source(conn):
+    """Point the entries search index source at the hot table plus every archive table
+
+    Archived entries keep their rows in entries_fts, so /buscar and the
+    assistant still find them; the view is what rebuild and
+    integrity-check read.
+    """
+    tables = ['entries'] + [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'entries_archive_[0-9]*' ORDER BY name")]
+    selects = [f"SELECT id, note, 'u' || user_id AS owner FROM {table}" for table in tables]
+    conn.execute('DROP VIEW IF EXISTS entries_fts_source')
+    conn.execute('CREATE VIEW entries_fts_source AS ' + ' UNION ALL '.join(selects))
+
+def entries_source(conn, start_day=None, end_day=None):
+    """FROM source for entries of [start_day, end_day] (None: unbounded)
+
+    'entries' when the range starts on or after the archived floor (one
+    lookup in entry_archives; the current horizon says nothing about what
+    an earlier run with another horizon moved); otherwise a UNION ALL with
+    the archive tables of the years the range overlaps. Use it as
+    `FROM {source} e` with the usual filters.
+    """
+    floor = archived_floor(conn)
+    if floor is None or (start_day and start_day >= floor):
+        return 'entries'
+    tables = [table for _, table in _archived_years(conn, start_day, end_day)]
+    if not tables:
+        return 'entries'
+    selects = [f'SELECT {_COLUMN_LIST} FROM {table}' for table in ['entries', *tables]]
+    return '(' + ' UNION ALL '.join(selects) + ')'
+
+def entries_source_for_page(conn, user_id, offset, limit):
+    """Source for a newest-first page: the hot table unless the page runs past its rows"""
+    hot_rows = conn.execute('SELECT COUNT(*) FROM entries WHERE user_id = ?', (user_id,)).fetchone()[0]
+    return 'entries' if offset + limit <= hot_rows else entries_source(conn)
+
+def _create_archive_table(conn, year):
+    table = archive_table(year)
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+          id INTEGER PRIMARY KEY,
+          user_id INTEGER NOT NULL,
+          account_id INTEGER NOT NULL,
+          category_id INTEGER,
+          type TEXT NOT NULL,
+          amount REAL NOT NULL,
+          note TEXT,
+          when_utc TEXT NOT NULL,
+          local_day TEXT,
+          transfer_group TEXT,
+          created_at_utc TEXT NOT NULL
+        )
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user_local_day ON {table}(user_id, local_day)')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_user_when_utc ON {table}(user_id, when_utc)')
+    if exists is None:
+        refresh_search_source(conn)
+    return table
+
+def _archive_month(conn, month_start, month_end):
+    """Move one local month of entries (all users) to its year's archive table, in one transaction"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        where = 'local_day >= ? AND local_day < ?'
+        bounds = (month_start.isoformat(), month_end.isoformat())
+        table = _create_archive_table(conn, month_start.year)
+        moved = conn.execute(f'''
+            INSERT INTO {table} ({_COLUMN_LIST})
+            SELECT {_COLUMN_LIST} FROM entries WHERE {where}
+        ''', bounds).rowcount
+
+        # Carry-forward: all-time balances add archived_total instead of reading the archive
+        conn.execute(f'''
+            UPDATE accounts
+            SET archived_total = archived_total + (
+                SELECT COALESCE(SUM({SIGNED_AMOUNT}), 0) FROM entries
+                WHERE entries.account_id = accounts.id AND {where})
+            WHERE id IN (SELECT DISTINCT account_id FROM entries WHERE {where})
+        ''', bounds + bounds)
+
+        # Moving entries does not change any balance: restore the checkpoints the delete trigger adjusts
+        checkpoints = conn.execute(f'''
+            SELECT account_id, user_id, month, closing_total FROM balance_checkpoints
+            WHERE account_id IN (SELECT DISTINCT account_id FROM entries WHERE {where})
+        ''', bounds).fetchall()
+        conn.execute(f'DELETE FROM entries WHERE {where}', bounds)
+        # The delete trigger dropped their search rows: index them again from the archive
+        conn.execute(f'''
+            INSERT INTO entries_fts (rowid, note, owner)
+            SELECT id, note, 'u' || user_id FROM {table} WHERE {where}
+        ''', bounds)
+        # Budget counters only matter for recent months: drop those of the archived month
+        conn.execute('DELETE FROM budget_spending WHERE month = ?', (month_start.isoformat()[:7],))
+        conn.executemany('''
+            INSERT OR REPLACE INTO balance_checkpoints (account_id, user_id, month, closing_total)
+            VALUES (?, ?, ?, ?)
+        ''', [tuple(row) for row in checkpoints])
+
+        conn.execute('''
+            INSERT INTO entry_archives (year, table_name, rows, archived_before) VALUES (?, ?, ?, ?)
+            ON CONFLICT(year) DO UPDATE SET rows = rows + excluded.rows,
+                                            archived_before = MAX(archived_before, excluded.archived_before)
+        ''', (month_start.year, table, moved, month_end.isoformat()))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return moved
+
+def archive_entries(conn=None):
+    """Move every entry older than the horizon to the archive, one month per transaction
+
+    Returns {year: entries moved}. Safe to rerun: it only finds what is
+    still in the hot table.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    moved = {}
+    try:
+        floor = hot_floor()
+        months = [row[0] for row in conn.execute('''
+            SELECT DISTINCT substr(local_day, 1, 7) FROM entries WHERE local_day < ? ORDER BY 1
+        ''', (floor.isoformat(),)).fetchall()]
+        for month in months:
+            month_start = date(int(month[:4]), int(month[5:7]), 1)
+            month_end = date(month_start.year + month_start.month // 12, month_start.month % 12 + 1, 1)
+            count = _archive_month(conn, month_start, month_end)
+            moved[month_start.year] = moved.get(month_start.year, 0) + count
+    finally:
+        if own_conn:
+            conn.close()
+    return moved
+
+def archive_stats(conn):
+    hot_rows = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+    return {
+        'horizon_months': ARCHIVE_HORIZON_MONTHS,
+        'hot_floor': hot_floor().isoformat(),
+        'hot_rows': hot_rows,
+        'archives': [dict(row) for row in conn.execute(
+            'SELECT year, table_name, rows, archived_before FROM entry_archives ORDER BY year').fetchall()],
+    }
+
+if __name__ == '__main__':
+    # Periodic job (e.g. monthly cron): python archive.py
+    logging.basicConfig(level=logging.INFO)
+    for year, count in archive_entries().items():
+        logging.info(f"{count} entries archived into {archive_table(year)}")
@@ -0,0 +1,164 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+import threading
+from flask import abort, current_app, request, send_file, url_for
+
+# Asset pipeline configuration
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSETS_DIST_DIR = os.environ.get("ASSETS_DIST_DIR", os.path.join(STATIC_DIR, 'dist'))
+ASSETS_MAX_AGE = int(os.environ.get("ASSETS_MAX_AGE", str(365 * 24 * 3600)))
+# HTML responses at least this big are compressed on the fly (when the client accepts it)
+HTML_COMPRESS_ENABLED = os.environ.get("HTML_COMPRESS_ENABLED", "true").lower() == "true"
+HTML_COMPRESS_MIN_BYTES = int(os.environ.get("HTML_COMPRESS_MIN_BYTES", "1024"))
+HTML_GZIP_LEVEL = int(os.environ.get("HTML_GZIP_LEVEL", "6"))
+HTML_BROTLI_QUALITY = int(os.environ.get("HTML_BROTLI_QUALITY", "5"))
+
+# Bundle name -> sources (relative to static/), concatenated in order
+BUNDLES = {
+    'app.css': ['style.css', 'css/perfil.css'],
+    'base.js': ['js/base.js'],
+    'chat.js': ['js/chat.js'],
+    'lancamentos.js': ['js/lancamentos.js'],
+    'contas_pagar_receber.js': ['js/contas_pagar_receber.js'],
+    'checkout.js': ['js/checkout.js'],
+    'assinatura.js': ['js/assinatura.js'],
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+_STRING_RE = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_PUNCT_RE = re.compile(r'\s*([{};,])\s*|(?<=:)\s+')
+
+def _brotli():
+    """The brotli module when installed (optional: without it only gzip variants are made)"""
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+def minify_css(text):
+    """Drop comments and collapse whitespace outside string literals"""
+    parts = _STRING_RE.split(_CSS_COMMENT_RE.sub('', text))
+    for index in range(0, len(parts), 2):
+        parts[index] = _CSS_PUNCT_RE.sub(lambda match: match.group(1) or '', re.sub(r'\s+', ' ', parts[index]))
+    return ''.join(parts).replace(';}', '}').strip() + '\n'
+
+def minify_js(text):
+    """Conservative: drop indentation, blank lines and whole-line // comments
+
+    Line breaks stay, so automatic semicolon insertion behaves exactly as
+    in the source.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build_assets(static_dir=STATIC_DIR, dist_dir=None):
+    """Minify and fingerprint every bundle, with .gz/.br variants: {bundle: file name}
+
+    Files already built for the same content are kept, so running this at
+    every startup only costs reading and hashing the sources.
+    """
+    dist_dir = dist_dir or ASSETS_DIST_DIR
+    os.makedirs(dist_dir, exist_ok=True)
+    brotli = _brotli()
+    manifest = {}
+    for bundle, sources in BUNDLES.items():
+        text = ''
+        for source in sources:
+            with open(os.path.join(static_dir, source), encoding='utf-8') as f:
+                text += f.read() + '\n'
+        stem, extension = os.path.splitext(bundle)
+        data = (minify_css(text) if extension == '.css' else minify_js(text)).encode('utf-8')
+        name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+        path = os.path.join(dist_dir, name)
+        if not os.path.exists(path):
+            _write_atomic(f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli:
+                _write_atomic(f"{path}.br", brotli.compress(data, quality=11))
+            _write_atomic(path, data)  # last: its presence means the variants exist
+        manifest[bundle] = name
+    _write_atomic(os.path.join(dist_dir, MANIFEST_NAME), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_manifest():
+    """Bundle -> fingerprinted file, built once per process (on every call in debug mode)"""
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None or current_app.debug:
+            _manifest = build_assets()
+        return _manifest
+
+def asset_url(bundle):
+    """URL of a bundle's current fingerprinted file (template global)"""
+    return url_for('asset', filename=get_manifest()[bundle])
+
+def _accepts(encoding):
+    return request.accept_encodings[encoding] > 0
+
+def serve_asset(filename):
+    """Fingerprinted bundle, precompressed variant when the client accepts it; cached for a year"""
+    if filename not in get_manifest().values():
+        abort(404)
+    path = os.path.join(ASSETS_DIST_DIR, filename)
+    encoding = None
+    if _accepts('br') and os.path.exists(f"{path}.br"):
+        path, encoding = f"{path}.br", 'br'
+    elif _accepts('gzip') and os.path.exists(f"{path}.gz"):
+        path, encoding = f"{path}.gz", 'gzip'
+
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], max_age=ASSETS_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def _compress_html(response):
+    if (response.mimetype != 'text/html' or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < HTML_COMPRESS_MIN_BYTES:
+        return response
+
+    brotli = _brotli()
+    if brotli and _accepts('br'):
+        compressed, encoding = brotli.compress(data, quality=HTML_BROTLI_QUALITY), 'br'
+    elif _accepts('gzip'):
+        compressed, encoding = gzip.compress(data, compresslevel=HTML_GZIP_LEVEL), 'gzip'
+    else:
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def assets_app(app):
+    """Serve fingerprinted bundles at /assets/ and compress HTML responses"""
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
+    app.add_template_global(asset_url)
+    if HTML_COMPRESS_ENABLED:
+        app.after_request(_compress_html)
+
+if __name__ == '__main__':
+    # Build step: python assets.py
+    logging.basicConfig(level=logging.INFO)
+    for bundle, name in build_assets().items():
+        logging.info(f"{bundle} -> {name}")
@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing pool: the KDF is deliberately slow, so it runs off the request thread.
+# AUTH_MAX_PENDING caps how many hash jobs (running + queued) a worker accepts at once.
+AUTH_POOL_KIND = os.environ.get("AUTH_POOL_KIND", "process").lower()   # process | thread
+AUTH_POOL_SIZE = int(os.environ.get("AUTH_POOL_SIZE", "2"))
+AUTH_MAX_PENDING = int(os.environ.get("AUTH_MAX_PENDING", "8"))
+AUTH_HASH_TIMEOUT_SECONDS = float(os.environ.get("AUTH_HASH_TIMEOUT_SECONDS", "10"))
+# Tuned KDF parameters; stored hashes with other parameters are upgraded on login
+AUTH_HASH_METHOD = os.environ.get("AUTH_HASH_METHOD", "scrypt:32768:8:1")
+
+# Token buckets: burst size and refill per minute
+AUTH_IP_BURST = int(os.environ.get("AUTH_IP_BURST", "20"))
+AUTH_IP_PER_MINUTE = float(os.environ.get("AUTH_IP_PER_MINUTE", "10"))
+AUTH_EMAIL_BURST = int(os.environ.get("AUTH_EMAIL_BURST", "5"))
+AUTH_EMAIL_PER_MINUTE = float(os.environ.get("AUTH_EMAIL_PER_MINUTE", "2"))
+AUTH_BUCKET_MAX_KEYS = int(os.environ.get("AUTH_BUCKET_MAX_KEYS", "10000"))
+# Hashing latency histogram buckets (seconds)
+HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class AuthBusy(Exception):
+    """Raised when the hashing pool is at its pending-job cap or a job outlives its timeout"""
+
+class RateLimited(Exception):
+    """Raised when a token bucket is empty; retry_after is in seconds"""
+
+    def __init__(self, scope, retry_after):
+        super().__init__(scope)
+        self.scope = scope
+        self.retry_after = retry_after
+
+class MemoryBucketStore:
+    """Token buckets in process memory, least recently used keys evicted first
+
+    Local stand-in for a shared store: limits are per worker. A shared
+    backend only needs the same take() with an atomic refill-and-take.
+    """
+
+    def __init__(self, max_keys=AUTH_BUCKET_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_second, now=None):
+        """Take one token; returns 0 when allowed, else the seconds until the next token"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / refill_per_second
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+class RateLimiter:
+    """Token bucket per key: `burst` requests at once, then `per_minute`"""
+
+    def __init__(self, scope, burst, per_minute, store):
+        self.scope = scope
+        self.burst = burst
+        self.refill_per_second = per_minute / 60
+        self.store = store
+
+    def hit(self, key):
+        retry_after = self.store.take(f"{self.scope}:{key}", self.burst, self.refill_per_second)
+        if retry_after:
+            auth_metrics.rate_limited(self.scope)
+            raise RateLimited(self.scope, retry_after)
+
+bucket_store = MemoryBucketStore()
+ip_limiter = RateLimiter('ip', AUTH_IP_BURST, AUTH_IP_PER_MINUTE, bucket_store)
+email_limiter = RateLimiter('email', AUTH_EMAIL_BURST, AUTH_EMAIL_PER_MINUTE, bucket_store)
+
+class AuthMetrics:
+    """Hashing latency (queue wait included) and admission counters, in Prometheus text format"""
+
+    def __init__(self, buckets=HASH_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+            self.rejected = 0
+            self._rate_limited = {}
+
+    def observe(self, operation, seconds):
+        with self._lock:
+            stats = self._operations.setdefault(operation, {'count': 0, 'sum': 0.0, 'buckets': [0] * len(self.buckets)})
+            stats['count'] += 1
+            stats['sum'] += seconds
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats['buckets'][index] += 1
+
+    def busy(self):
+        with self._lock:
+            self.rejected += 1
+
+    def rate_limited(self, scope):
+        with self._lock:
+            self._rate_limited[scope] = self._rate_limited.get(scope, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'operations': {operation: dict(stats, buckets=list(stats['buckets']))
+                               for operation, stats in self._operations.items()},
+                'rejected': self.rejected,
+                'rate_limited': dict(self._rate_limited),
+            }
+
+    def render(self):
+        snapshot = self.snapshot()
+        lines = ['# HELP app_auth_hash_seconds Password hashing latency, queue wait included',
+                 '# TYPE app_auth_hash_seconds histogram']
+        for operation, stats in sorted(snapshot['operations'].items()):
+            for bound, count in zip(self.buckets, stats['buckets']):
+                lines.append(f'app_auth_hash_seconds_bucket{{operation="{operation}",le="{bound}"}} {count}')
+            lines.append(f'app_auth_hash_seconds_bucket{{operation="{operation}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'app_auth_hash_seconds_sum{{operation="{operation}"}} {stats["sum"]:.6f}')
+            lines.append(f'app_auth_hash_seconds_count{{operation="{operation}"}} {stats["count"]}')
+        lines += ['# HELP app_auth_rejected_total Hash jobs refused because the pool was full',
+                  '# TYPE app_auth_rejected_total counter',
+                  f'app_auth_rejected_total {snapshot["rejected"]}',
+                  '# HELP app_auth_rate_limited_total Login/register attempts refused by a token bucket',
+                  '# TYPE app_auth_rate_limited_total counter']
+        for scope, count in sorted(snapshot['rate_limited'].items()):
+            lines.append(f'app_auth_rate_limited_total{{scope="{scope}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+auth_metrics = AuthMetrics()
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(AUTH_MAX_PENDING)
+
+def _make_executor():
+    if AUTH_POOL_KIND == 'thread':
+        return ThreadPoolExecutor(max_workers=AUTH_POOL_SIZE, thread_name_prefix='auth-hash')
+    # spawn: the worker has request/pool threads running, forking it is unsafe
+    return ProcessPoolExecutor(max_workers=AUTH_POOL_SIZE, mp_context=multiprocessing.get_context('spawn'))
+
+def start_hash_pool():
+    """Fresh hashing pool (created on first use), job cap and rate-limit buckets, per worker"""
+    global _executor, _pending
+    with _executor_lock:
+        _executor = None
+        _pending = threading.BoundedSemaphore(AUTH_MAX_PENDING)
+    bucket_store.clear()
+
+def stop_hash_pool(wait=True):
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = _make_executor()
+        return _executor
+
+def _run(operation, function, *args):
+    """Run a KDF call on the pool, refusing it when too many are pending
+
+    The admission slot is held until the job itself ends, not until the
+    caller stops waiting: a timed-out job still occupies the pool.
+    """
+    pending = _pending
+    if not pending.acquire(blocking=False):
+        auth_metrics.busy()
+        raise AuthBusy()
+    started = time.perf_counter()
+
+    def done(future):
+        pending.release()
+        auth_metrics.observe(operation, time.perf_counter() - started)
+
+    try:
+        future = _get_executor().submit(function, *args)
+    except Exception:
+        pending.release()
+        raise
+    future.add_done_callback(done)
+    try:
+        return future.result(timeout=AUTH_HASH_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        # A job still queued is dropped (its callback frees the slot); a running one keeps it
+        future.cancel()
+        auth_metrics.busy()
+        raise AuthBusy()
+
+def hash_password(password):
+    return _run('hash', generate_password_hash, password, AUTH_HASH_METHOD)
+
+# Checked when the email is unknown, so a miss costs the same time as a wrong password
+_dummy_hash = None
+
+def verify_password(password_hash, password):
+    global _dummy_hash
+    if password_hash is None:
+        if _dummy_hash is None:
+            _dummy_hash = hash_password('dummy-password')
+        password_hash = _dummy_hash
+    return _run('verify', check_password_hash, password_hash, password)
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with other KDF parameters than AUTH_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != AUTH_HASH_METHOD
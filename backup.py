@@ -0,0 +1,303 @@
+import os
+import re
+import sys
+import gzip
+import time
+import shutil
+import sqlite3
+import logging
+import tempfile
+from datetime import datetime, timezone
+import helpers
+from archive import _create_archive_table
+from cache import query_cache
+
+# Snapshots of the local database: gzip files in BACKUP_DIR, newest BACKUP_KEEP kept
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "./backups")
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+# The copy runs in steps of this many pages, sleeping between steps so writers get the lock
+BACKUP_PAGES_PER_STEP = int(os.environ.get("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_SECONDS = float(os.environ.get("BACKUP_STEP_SLEEP_SECONDS", "0.01"))
+# A write between steps starts the copy over; past this many restarts the rest goes in one step
+BACKUP_MAX_RESTARTS = int(os.environ.get("BACKUP_MAX_RESTARTS", "3"))
+# Rows per round trip when exporting from SQLite Cloud
+CLOUD_EXPORT_BATCH_SIZE = int(os.environ.get("CLOUD_EXPORT_BATCH_SIZE", "1000"))
+
+SNAPSHOT_RE = re.compile(r'^(?P<source>[\w-]+)-(?P<stamp>\d{8}T\d{6}\d{6}Z)\.db\.gz$')
+
+class BackupError(Exception):
+    """Raised when a snapshot fails its integrity check or cannot be taken"""
+
+class _TooManyRestarts(Exception):
+    pass
+
+def _step_pause(status, remaining, total):
+    # Between steps the source is unlocked: this is when writers get through
+    time.sleep(BACKUP_STEP_SLEEP_SECONDS)
+
+def online_copy(source, target, pages=None, max_restarts=None):
+    """Copy database `source` into `target` (connections) in paged steps; returns the restart count
+
+    A write from another connection between two steps makes SQLite start
+    the copy over from the first page. After max_restarts of those the
+    rest is copied in a single step, which keeps the read lock (and
+    writers waiting) until it ends, so a busy database still gets its
+    snapshot in bounded time.
+    """
+    max_restarts = BACKUP_MAX_RESTARTS if max_restarts is None else max_restarts
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        # Each step copies at least one page: a count that did not go down means the copy restarted
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        _step_pause(status, remaining, total)
+
+    try:
+        source.backup(target, pages=pages or BACKUP_PAGES_PER_STEP, progress=progress)
+    except _TooManyRestarts:
+        logging.info(f"Backup restarted {max_restarts} times; finishing the copy in one step")
+        source.backup(target)
+    return state['restarts']
+
+def integrity_check(path):
+    """Raise BackupError unless PRAGMA integrity_check passes on the database file"""
+    conn = sqlite3.connect(path)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check').fetchall()]
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"{path}: {e}")
+    finally:
+        conn.close()
+    if result != ['ok']:
+        raise BackupError(f"{path}: {'; '.join(result[:5])}")
+
+def _snapshot_name(source='database'):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    return f"{source}-{stamp}.db.gz"
+
+def _compress_into(db_file, backup_dir, source):
+    """Gzip a checked database file into backup_dir (atomically) and rotate"""
+    path = os.path.join(backup_dir, _snapshot_name(source))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(db_file, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_path, path)
+    rotate_backups(backup_dir, source=source)
+    return path
+
+def create_backup(db_path=None, backup_dir=None, source='database'):
+    """Take a consistent snapshot of the live local database; returns its path
+
+    The page copy holds the read lock only during each step, so writes
+    keep going while it runs. A write between steps restarts the whole
+    copy; after BACKUP_MAX_RESTARTS restarts the rest is copied in one
+    step with writers waiting (see online_copy). The result is the
+    database as of the last (re)start.
+    """
+    database = helpers.current_database()
+    if database.use_sqlite_cloud and db_path is None:
+        raise BackupError("Backups are for the local engine; use export_cloud for SQLite Cloud")
+    db_path = db_path or database.db_path
+    backup_dir = backup_dir or BACKUP_DIR
+    if not os.path.exists(db_path):
+        raise BackupError(f"{db_path}: database not found")
+
+    os.makedirs(backup_dir, exist_ok=True)
+    fd, tmp_db = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+    os.close(fd)
+    try:
+        live = sqlite3.connect(db_path)
+        copy = sqlite3.connect(tmp_db)
+        try:
+            online_copy(live, copy)
+        finally:
+            copy.close()
+            live.close()
+        integrity_check(tmp_db)
+        return _compress_into(tmp_db, backup_dir, source)
+    finally:
+        os.unlink(tmp_db)
+
+def list_backups(backup_dir=None, source=None):
+    """Snapshots in backup_dir (of one source when given), newest first: [{name, source, path, size, created}]"""
+    backup_dir = backup_dir or BACKUP_DIR
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        match = SNAPSHOT_RE.match(name)
+        if not match or (source and match.group('source') != source):
+            continue
+        path = os.path.join(backup_dir, name)
+        created = datetime.strptime(match.group('stamp'), '%Y%m%dT%H%M%S%fZ').replace(tzinfo=timezone.utc)
+        backups.append({'name': name, 'source': match.group('source'), 'path': path, 'size': os.path.getsize(path), 'created': created.isoformat()})
+    return sorted(backups, key=lambda backup: backup['created'], reverse=True)
+
+def rotate_backups(backup_dir=None, keep=None, source='database'):
+    """Delete all but the newest `keep` snapshots of a source; returns the deleted names"""
+    keep = BACKUP_KEEP if keep is None else keep
+    deleted = []
+    for backup in list_backups(backup_dir, source)[keep:]:
+        os.unlink(backup['path'])
+        deleted.append(backup['name'])
+    return deleted
+
+def _decompress(snapshot_path, directory=None):
+    """Decompress a snapshot to a temporary file and check it; the caller removes the file"""
+    fd, tmp_db = tempfile.mkstemp(suffix='.db', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as dst, gzip.open(snapshot_path, 'rb') as src:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        integrity_check(tmp_db)
+    except (OSError, EOFError) as e:
+        os.unlink(tmp_db)
+        raise BackupError(f"{snapshot_path}: {e}")
+    except BackupError:
+        os.unlink(tmp_db)
+        raise
+    return tmp_db
+
+def verify_backup(snapshot_path):
+    """Decompress (gzip CRC) and integrity-check a snapshot; raises BackupError"""
+    os.unlink(_decompress(snapshot_path))
+    return True
+
+def restore_backup(snapshot_path, db_path=None, keep_current=True):
+    """Replace the local database with a snapshot; returns the pre-restore snapshot path (or None)
+
+    The snapshot is verified first, and the current database is itself
+    saved as a 'prerestore' snapshot before it is overwritten.
+
+    Restore offline: stop the app first. Workers keep derived state of
+    the old data in memory (query and answer caches, forecasts, reminder
+    heaps) that nothing invalidates, and a write landing mid-restore is
+    lost. Entries in a shared cache (CACHE_BACKEND=redis) outlive the
+    workers; the restore command flushes them.
+    """
+    db_path = db_path or helpers.current_database().db_path
+    tmp_db = _decompress(snapshot_path, os.path.dirname(os.path.abspath(db_path)))
+    try:
+        previous = None
+        if keep_current and os.path.exists(db_path):
+            previous = create_backup(db_path, os.path.dirname(os.path.abspath(snapshot_path)), 'prerestore')
+        source = sqlite3.connect(tmp_db)
+        target = sqlite3.connect(db_path)
+        try:
+            # One step: a restore must not interleave with writers
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        os.unlink(tmp_db)
+    return previous
+
+def _cloud_tables(cloud):
+    rows = cloud.execute('''
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '%_fts%'
+    ''').fetchall()
+    return [row[0] for row in rows]
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+def _copy_table(cloud, local, table):
+    """Copy a cloud table into the local one (shared columns), paging by rowid"""
+    columns = [column for column in _columns(cloud, table) if column in set(_columns(local, table))]
+    column_list = ', '.join(columns)
+    insert = f"INSERT INTO {table} ({column_list}) VALUES ({', '.join('?' * len(columns))})"
+    last_rowid, copied = 0, 0
+    while True:
+        rows = cloud.execute(f'''
+            SELECT rowid, {column_list} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?
+        ''', (last_rowid, CLOUD_EXPORT_BATCH_SIZE)).fetchall()
+        if not rows:
+            return copied
+        local.executemany(insert, [tuple(row)[1:] for row in rows])
+        last_rowid = rows[-1][0]
+        copied += len(rows)
+
+def export_cloud(backup_dir=None, sqlitecloud_url=None):
+    """Copy the SQLite Cloud database into a local snapshot; returns (path, {table: rows})
+
+    The local file gets the current schema, then every cloud table the
+    schema knows, copied with the triggers dropped: counters, alerts and
+    checkpoints come over as the cloud has them instead of being derived
+    twice. The triggers are recreated and the search index rebuilt after
+    the copy. Seed a local replica with restore_backup(path).
+    """
+    import sqlitecloud
+    backup_dir = backup_dir or BACKUP_DIR
+    os.makedirs(backup_dir, exist_ok=True)
+    cloud = sqlitecloud.connect(sqlitecloud_url or helpers.current_database().sqlitecloud_url)
+    fd, tmp_db = tempfile.mkstemp(suffix='.db', dir=backup_dir)
+    os.close(fd)
+    counts = {}
+    try:
+        local = sqlite3.connect(tmp_db)
+        local.row_factory = sqlite3.Row
+        try:
+            with open('schema.sql', 'r', encoding='utf-8') as f:
+                local.executescript(f.read())
+            triggers = local.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+            for trigger in triggers:
+                local.execute(f"DROP TRIGGER {trigger['name']}")
+            for table in _cloud_tables(cloud):
+                if table.startswith('entries_archive_'):
+                    _create_archive_table(local, table.rsplit('_', 1)[1])
+                if not helpers._table_exists(local, table):
+                    continue
+                counts[table] = _copy_table(cloud, local, table)
+                local.commit()
+            for trigger in triggers:
+                local.execute(trigger['sql'])
+            for fts_table in ('entries_fts', 'bills_fts'):
+                local.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+            local.commit()
+            helpers.migrate_db(local)
+        finally:
+            local.close()
+        integrity_check(tmp_db)
+        return _compress_into(tmp_db, backup_dir, 'cloud'), counts
+    finally:
+        cloud.close()
+        os.unlink(tmp_db)
+
+def main(argv):
+    commands = ('create', 'list', 'verify', 'restore', 'export-cloud')
+    if not argv or argv[0] not in commands or (argv[0] in ('verify', 'restore') and len(argv) < 2):
+        print(f"usage: python backup.py {{{'|'.join(commands)}}} [snapshot]")
+        return 2
+    command = argv[0]
+    try:
+        if command == 'create':
+            logging.info(f"Backup created: {create_backup()}")
+        elif command == 'list':
+            for backup in list_backups():
+                print(f"{backup['created']}  {backup['size']:>12}  {backup['path']}")
+        elif command == 'verify':
+            verify_backup(argv[1])
+            logging.info(f"{argv[1]}: ok")
+        elif command == 'restore':
+            previous = restore_backup(argv[1])
+            if not query_cache.backend.process_local:
+                # Shared entries are keyed by version counters the restore did not move
+                query_cache.backend.clear()
+            logging.info(f"Database restored from {argv[1]}" + (f" (previous copy in {previous})" if previous else ''))
+        else:
+            path, counts = export_cloud()
+            logging.info(f"SQLite Cloud exported to {path}: {counts}")
+    except BackupError as e:
+        logging.error(f"Backup error: {e}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    # Periodic job (e.g. hourly cron): python backup.py create
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
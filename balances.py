@@ -0,0 +1,191 @@
+import os
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from helpers import SIGNED_AMOUNT
+from archive import entries_source
+
+# Balance history configuration
+HISTORY_MAX_DAYS = int(os.environ.get("BALANCE_HISTORY_MAX_DAYS", "366"))
+HISTORY_GRANULARITIES = ('dia', 'mes')
+
+BR_TZ = ZoneInfo('America/Sao_Paulo')
+
+
+def month_key(day):
+    return f"{day.year:04d}-{day.month:02d}"
+
+def next_month(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+def month_end(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return date(year + number // 12, number % 12 + 1, 1) - timedelta(days=1)
+
+def _last_closed_month():
+    today = datetime.now(BR_TZ).date()
+    return month_key(today.replace(day=1) - timedelta(days=1))
+
+def _resume_points(conn, user_id):
+    """{account_id: (newest checkpoint month, its closing total)}; (None, None) when there is none"""
+    return {row['id']: (row['month'], row['closing_total']) for row in conn.execute('''
+        SELECT a.id, MAX(c.month) as month, c.closing_total
+        FROM accounts a
+        LEFT JOIN balance_checkpoints c ON c.account_id = a.id
+        WHERE a.user_id = ?
+        GROUP BY a.id
+    ''', (user_id,)).fetchall()}
+
+def ensure_checkpoints(conn, user_id):
+    """Bring the user's monthly checkpoints up to the last closed month
+
+    Every account gets one row per month from its first entry's month, so
+    a lookup needs exactly one checkpoint; an account with no entries up to
+    the last closed month gets a zero row for that month, so it is not
+    stale on the next read. The insert/update/delete triggers
+    on entries add each change to the checkpoints from its month on (and
+    drop an account's checkpoints when a change lands before the first);
+    this extends each account from its newest checkpoint with one grouped
+    scan of the missing months. Returns the number of checkpoints written.
+    """
+    through = _last_closed_month()
+    if all(month is not None and month >= through for month, _ in _resume_points(conn, user_id).values()):
+        return 0
+
+    # Read and write in one transaction so a concurrent entry cannot slip between the scan and the insert
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        resume = _resume_points(conn, user_id)
+        stale = [account_id for account_id, (month, _) in resume.items() if month is None or month < through]
+        placeholders = ','.join('?' * len(stale))
+        params = [user_id, *stale, month_end(through).isoformat()]
+        since, since_day = '', None
+        if stale and all(resume[account_id][0] for account_id in stale):
+            since_day = month_end(min(resume[account_id][0] for account_id in stale)) + timedelta(days=1)
+            since = 'AND local_day >= ?'
+            params.append(since_day.isoformat())
+        totals = {}
+        for row in conn.execute(f'''
+            SELECT account_id, substr(local_day, 1, 7) as month, SUM({SIGNED_AMOUNT}) as total
+            FROM {entries_source(conn, since_day, month_end(through))}
+            WHERE user_id = ? AND account_id IN ({placeholders}) AND local_day <= ? {since}
+            GROUP BY account_id, month
+        ''', params).fetchall():
+            totals.setdefault(row['account_id'], {})[row['month']] = row['total']
+
+        checkpoints = []
+        for account_id in stale:
+            month, running = resume[account_id]
+            deltas = totals.get(account_id, {})
+            if month:
+                month = next_month(month)
+            elif deltas:
+                month, running = min(deltas), 0.0
+            else:
+                # No entries up to the last closed month: the balance is the initial one
+                month, running = through, 0.0
+            while month <= through:
+                running += deltas.get(month, 0.0)
+                checkpoints.append((account_id, user_id, month, running))
+                month = next_month(month)
+
+        conn.executemany('''
+            INSERT OR REPLACE INTO balance_checkpoints (account_id, user_id, month, closing_total)
+            VALUES (?, ?, ?, ?)
+        ''', checkpoints)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(checkpoints)
+
+def balance_at(conn, user_id, day):
+    """Balance of each account at the end of a local day: {account_id: balance}
+
+    One checkpoint (the closed month before `day`) plus the entries after
+    it up to `day`: for past days a single month, however long the history.
+    """
+    ensure_checkpoints(conn, user_id)
+    # Checkpoints run up to the last closed month, so later days scan from the current month
+    scan_from = min(month_key(day), next_month(_last_closed_month()))
+    balances = {row['id']: row['initial_balance'] + (row['closing_total'] or 0.0) for row in conn.execute('''
+        SELECT a.id, a.initial_balance,
+               (SELECT c.closing_total FROM balance_checkpoints c
+                WHERE c.account_id = a.id AND c.month < ?
+                ORDER BY c.month DESC LIMIT 1) as closing_total
+        FROM accounts a
+        WHERE a.user_id = ?
+    ''', (scan_from, user_id)).fetchall()}
+    scan_start = date.fromisoformat(f"{scan_from}-01")
+    for row in conn.execute(f'''
+        SELECT account_id, SUM({SIGNED_AMOUNT}) as total
+        FROM {entries_source(conn, scan_start, day)}
+        WHERE user_id = ? AND local_day >= ? AND local_day <= ?
+        GROUP BY account_id
+    ''', (user_id, scan_start.isoformat(), day.isoformat())).fetchall():
+        if row['account_id'] in balances:
+            balances[row['account_id']] += row['total']
+    return balances
+
+def _point(day, balances):
+    return {
+        'date': day.isoformat(),
+        'accounts': {str(account_id): round(balance, 2) for account_id, balance in balances.items()},
+        'total': round(sum(balances.values()), 2),
+    }
+
+def balance_history(conn, user_id, start, end, granularity='dia'):
+    """Balance series for charts: one point per day, or per month end ('mes')
+
+    Daily series start from balance_at(start - 1) and add the per-day
+    totals of the range; monthly series read closed months straight from
+    the checkpoints and close with balance_at(end).
+    """
+    accounts = [dict(row) for row in conn.execute(
+        'SELECT id, name, initial_balance FROM accounts WHERE user_id = ? ORDER BY name', (user_id,)).fetchall()]
+    points = []
+    if granularity == 'mes':
+        ensure_checkpoints(conn, user_id)
+        last_closed = _last_closed_month()
+        month, last = month_key(start), month_key(end)
+        closing = {}
+        for row in conn.execute('''
+            SELECT account_id, month, closing_total FROM balance_checkpoints
+            WHERE user_id = ? AND month >= ? AND month <= ?
+        ''', (user_id, month, last)).fetchall():
+            closing[(row['account_id'], row['month'])] = row['closing_total']
+        while month <= last:
+            day = min(month_end(month), end)
+            if month <= last_closed and day == month_end(month):
+                # Months before an account's first entry have no checkpoint: initial balance only
+                balances = {account['id']: account['initial_balance'] + closing.get((account['id'], month), 0.0)
+                            for account in accounts}
+            else:
+                balances = balance_at(conn, user_id, day)
+            points.append(_point(day, balances))
+            month = next_month(month)
+    else:
+        balances = balance_at(conn, user_id, start - timedelta(days=1))
+        deltas = {}
+        for row in conn.execute(f'''
+            SELECT account_id, local_day, SUM({SIGNED_AMOUNT}) as total
+            FROM {entries_source(conn, start, end)}
+            WHERE user_id = ? AND local_day >= ? AND local_day <= ?
+            GROUP BY account_id, local_day
+        ''', (user_id, start.isoformat(), end.isoformat())).fetchall():
+            deltas.setdefault(row['local_day'], []).append((row['account_id'], row['total']))
+        day = start
+        while day <= end:
+            for account_id, total in deltas.get(day.isoformat(), ()):
+                if account_id in balances:
+                    balances[account_id] += total
+            points.append(_point(day, balances))
+            day += timedelta(days=1)
+
+    return {
+        'granularity': granularity,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'accounts': [{'id': account['id'], 'name': account['name']} for account in accounts],
+        'points': points,
+    }
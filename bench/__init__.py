@@ -0,0 +1 @@
+"""Benchmark suite: synthetic data generator and route timings (python -m bench)"""
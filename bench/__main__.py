@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import sqlite3
+import tempfile
+import subprocess
+from datetime import datetime, timezone, timedelta
+
+# Benchmarks always run against a throwaway local database, in-memory sessions and an
+# in-process cache whose version counters are its own (the host's shared counters belong
+# to the live workers)
+os.environ['USE_SQLITE_CLOUD'] = 'false'
+os.environ.setdefault('SESSION_STORE', 'memory')
+os.environ['CACHE_BACKEND'] = 'memory'
+os.environ['CACHE_VERSIONS'] = 'memory'
+os.environ.setdefault('CHAT_LOG_ENABLED', 'false')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmark the hot routes on synthetic data')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--entries', type=int, default=2000, help='entries per user')
+    parser.add_argument('--bills', type=int, default=60, help='bills per user')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='p95 regression threshold in percent')
+    parser.add_argument('--db', help='database file to use (default: temporary file, removed afterwards)')
+    parser.add_argument('--write-threads', type=int, default=8, help='concurrent writers in the write benchmark')
+    parser.add_argument('--writes', type=int, default=250, help='inserts per writer thread (0 skips it)')
+    return parser.parse_args(argv)
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+def compare(previous, current, threshold):
+    """p95 change per route and mode; regressions are changes above threshold percent"""
+    rows = []
+    for name, modes in current['routes'].items():
+        for mode, summary in modes.items():
+            old = previous.get('routes', {}).get(name, {}).get(mode)
+            if not old or not old['p95_ms']:
+                continue
+            change = (summary['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+            rows.append({
+                'route': name,
+                'mode': mode,
+                'old_p95_ms': old['p95_ms'],
+                'new_p95_ms': summary['p95_ms'],
+                'change_pct': round(change, 1),
+                'old_queries': old['queries_per_request'],
+                'new_queries': summary['queries_per_request'],
+                'regression': change > threshold,
+            })
+    for key in ('import_ms', 'first_request_ms'):
+        old = previous.get('startup', {}).get(key)
+        new = current.get('startup', {}).get(key)
+        if old and new is not None:
+            change = (new - old) / old * 100
+            rows.append({
+                'route': f'startup.{key}',
+                'mode': '-',
+                'old_p95_ms': old,
+                'new_p95_ms': new,
+                'change_pct': round(change, 1),
+                'regression': change > threshold,
+            })
+    return rows
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+
+    db_path = args.db or tempfile.mkstemp(suffix='.db')[1]
+    if not args.db:
+        os.unlink(db_path)
+    # Read by helpers and config.Config at import: the data generator and the app both use it
+    os.environ['DB_PATH'] = db_path
+
+    from bench.datagen import generate_dataset, bench_email, BENCH_PASSWORD
+    from bench.runner import run_routes
+    from bench.startup import measure_startup
+    from bench.writes import measure_write_throughput
+    from app import app
+    from cache import query_cache
+    from ai_assistant import answer_cache
+
+    try:
+        print(f"Generating {args.users} users x {args.entries} entries, {args.bills} bills...")
+        generate_dataset(args.users, args.entries, args.bills, seed=args.seed)
+
+        def clear_caches():
+            # Entries only: rewinding the version counters is never safe
+            query_cache.backend.clear_entries()
+            answer_cache.backend.clear_entries()
+
+        today = datetime.now(timezone.utc).date()
+        period = ((today - timedelta(days=365)).isoformat(), today.isoformat())
+
+        startup = measure_startup(db_path, ROOT)
+
+        with app.test_client() as client:
+            client.post('/login', data={'email': bench_email(0), 'password': BENCH_PASSWORD})
+            routes = run_routes(client, args.iterations, args.warmup, clear_caches=clear_caches, period=period)
+
+        writes = measure_write_throughput(args.write_threads, args.writes) if args.writes else None
+    finally:
+        if not args.db and os.path.exists(db_path):
+            os.unlink(db_path)
+
+    results = {
+        'meta': {
+            'timestamp_utc': datetime.now(timezone.utc).isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'users': args.users,
+            'entries_per_user': args.entries,
+            'bills_per_user': args.bills,
+            'iterations': args.iterations,
+            'seed': args.seed,
+        },
+        'startup': startup,
+        'routes': routes,
+        'writes': writes,
+    }
+
+    print(f"Startup: import {startup['import_ms']:.1f} ms, first request {startup['first_request_ms']:.1f} ms "
+          f"({startup['modules_loaded']} modules)")
+    print(f"{'route':<22}{'mode':<6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+    for name, modes in routes.items():
+        for mode, summary in modes.items():
+            print(f"{name:<22}{mode:<6}{summary['p50_ms']:>9.2f}{summary['p95_ms']:>9.2f}"
+                  f"{summary['p99_ms']:>9.2f}{summary['queries_per_request']:>9.1f}")
+
+    if writes:
+        print(f"Writes ({args.write_threads} threads): {writes['direct']['inserts_per_second']:.0f} inserts/s direct, "
+              f"{writes['group_commit']['inserts_per_second']:.0f} inserts/s group commit "
+              f"(x{writes['speedup']}, mean batch {writes['group_commit']['mean_batch']})")
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            results['comparison'] = compare(json.load(f), results, args.threshold)
+        for row in results['comparison']:
+            flag = '  REGRESSION' if row['regression'] else ''
+            print(f"{row['route']:<22}{row['mode']:<6}p95 {row['old_p95_ms']:.2f} -> {row['new_p95_ms']:.2f} ms "
+                  f"({row['change_pct']:+.1f}%){flag}")
+        if any(row['regression'] for row in results['comparison']):
+            exit_code = 1
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import random
+from datetime import datetime, timezone, timedelta
+from werkzeug.security import generate_password_hash
+import helpers
+
+BENCH_PASSWORD = 'bench-password'
+
+ENTRY_NOTES = {
+    'receita': ['Salário', 'Freelance site', 'Venda de produto', 'Rendimento poupança', 'Reembolso'],
+    'despesa': ['Supermercado', 'Padaria', 'Uber', 'Combustível', 'Farmácia', 'Restaurante',
+                'Conta de luz', 'Internet', 'Academia', 'Cinema', 'Material escolar', 'IPTU'],
+}
+BILL_DESCRIPTIONS = {
+    'pagar': ['Aluguel', 'Condomínio', 'Cartão de crédito', 'Plano de saúde', 'Escola', 'Seguro do carro'],
+    'receber': ['Cliente ACME', 'Consultoria', 'Aluguel sala comercial'],
+}
+
+def generate_dataset(users=20, entries_per_user=2000, bills_per_user=60, days=365, seed=42):
+    """Populate the configured database through the real schema.sql
+
+    Users, accounts and categories are created the way /register does;
+    entries spread over the last `days` days (mostly despesas) and bills
+    around today, with a mix of statuses and recurrences.
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+
+    helpers.init_db()
+    conn = helpers.get_db_connection()
+    user_ids = []
+    for index in range(users):
+        created_at_utc = (now - timedelta(days=days)).isoformat()
+        cursor = conn.execute('''
+            INSERT INTO users (name, email, password_hash, trial_start_utc, subscribed, created_at_utc)
+            VALUES (?, ?, ?, ?, 1, ?)
+        ''', (f'Usuário {index + 1}', bench_email(index), password_hash, created_at_utc, created_at_utc))
+        user_id = cursor.lastrowid
+        user_ids.append(user_id)
+
+        helpers.seed_categories(conn, user_id)
+        account_ids = [
+            conn.execute('INSERT INTO accounts (user_id, name, initial_balance) VALUES (?, ?, ?)',
+                         (user_id, name, balance)).lastrowid
+            for name, balance in (('Conta Principal', 1000.0), ('Poupança', 5000.0))
+        ]
+        categories = {
+            cat_type: [row['id'] for row in conn.execute(
+                'SELECT id FROM categories WHERE user_id = ? AND type = ?', (user_id, cat_type)).fetchall()]
+            for cat_type in ('receita', 'despesa')
+        }
+
+        entries = []
+        for _ in range(entries_per_user):
+            entry_type = 'receita' if rng.random() < 0.15 else 'despesa'
+            amount = round(rng.uniform(800, 6000) if entry_type == 'receita' else rng.lognormvariate(4, 1), 2)
+            when_utc = (now - timedelta(days=rng.uniform(0, days))).isoformat()
+            entries.append((user_id, rng.choice(account_ids), rng.choice(categories[entry_type]), entry_type,
+                            amount, rng.choice(ENTRY_NOTES[entry_type]), when_utc, when_utc))
+        helpers.insert_entries(conn, entries)
+
+        bills = []
+        for _ in range(bills_per_user):
+            bill_type = 'pagar' if rng.random() < 0.8 else 'receber'
+            due = now + timedelta(days=rng.uniform(-60, 90))
+            status = 'pago' if due < now and rng.random() < 0.7 else ('vencido' if due < now else 'pendente')
+            category_type = 'despesa' if bill_type == 'pagar' else 'receita'
+            bills.append((user_id, rng.choice(account_ids), rng.choice(categories[category_type]), bill_type,
+                          round(rng.uniform(50, 2500), 2), rng.choice(BILL_DESCRIPTIONS[bill_type]),
+                          due.isoformat(), status, rng.choice(['nao', 'nao', 'nao', 'mensal', 'anual']),
+                          now.isoformat()))
+        conn.executemany('''
+            INSERT INTO bills (user_id, account_id, category_id, type, amount, description,
+                               due_date_utc, status, recurring, created_at_utc)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', bills)
+        conn.commit()
+
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return user_ids
+
+def bench_email(index):
+    return f'bench{index + 1}@example.com'
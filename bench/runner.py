@@ -0,0 +1,99 @@
+import time
+import threading
+from helpers import on_connect, remove_connect_hook
+
+# Hot routes: (name, method, path, json body)
+ROUTES = [
+    ('dashboard', 'GET', '/dashboard', None),
+    ('lancamentos', 'GET', '/lancamentos', None),
+    ('lancamentos_page_5', 'GET', '/lancamentos?page=5', None),
+    ('relatorios', 'GET', '/relatorios', None),
+    ('relatorios_ano', 'GET', '/relatorios?granularity=mes&from=PERIOD_START&to=PERIOD_END', None),
+    ('export_csv', 'GET', '/export/csv', None),
+    ('saldo_historico_mes', 'GET', '/api/saldo/historico?granularity=mes&from=PERIOD_START&to=PERIOD_END', None),
+    ('api_assistant_saldo', 'POST', '/api/assistant', {'message': 'saldo total'}),
+    ('api_assistant_top', 'POST', '/api/assistant', {'message': 'top despesas'}),
+]
+
+class QueryCounter:
+    """Counts SQL statements on every connection opened while installed"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _trace(self, statement):
+        # Statements run by triggers are reported as comments
+        if not statement.lstrip().startswith('--'):
+            with self._lock:
+                self.count += 1
+
+    def __call__(self, conn):
+        if hasattr(conn, 'set_trace_callback'):
+            conn.set_trace_callback(self._trace)
+
+    def __enter__(self):
+        on_connect(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_connect_hook(self)
+
+    def take(self):
+        with self._lock:
+            count, self.count = self.count, 0
+        return count
+
+def percentile(samples, pct):
+    """Linear-interpolated percentile of a list of numbers"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(timings_ms, queries, statuses):
+    return {
+        'requests': len(timings_ms),
+        'p50_ms': round(percentile(timings_ms, 50), 3),
+        'p95_ms': round(percentile(timings_ms, 95), 3),
+        'p99_ms': round(percentile(timings_ms, 99), 3),
+        'mean_ms': round(sum(timings_ms) / len(timings_ms), 3) if timings_ms else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'statuses': sorted(set(statuses)),
+    }
+
+def time_route(client, method, path, body, iterations, counter, before_request=None):
+    timings_ms, queries, statuses = [], [], []
+    for _ in range(iterations):
+        if before_request:
+            before_request()
+        counter.take()
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        timings_ms.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.take())
+        statuses.append(response.status_code)
+    return summarize(timings_ms, queries, statuses)
+
+def run_routes(client, iterations=50, warmup=3, routes=ROUTES, modes=('cold', 'warm'), clear_caches=None,
+               period=None):
+    """Time every route; 'cold' clears the app caches before each request, 'warm' keeps them
+
+    Returns {route name: {mode: summary}}.
+    """
+    results = {}
+    with QueryCounter() as counter:
+        for name, method, path, body in routes:
+            if period:
+                path = path.replace('PERIOD_START', period[0]).replace('PERIOD_END', period[1])
+            for _ in range(warmup):
+                client.open(path, method=method, json=body).get_data()
+            results[name] = {}
+            for mode in modes:
+                before = clear_caches if mode == 'cold' else None
+                results[name][mode] = time_route(client, method, path, body, iterations, counter, before)
+    return results
@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import subprocess
+
+# Runs in a fresh interpreter so nothing is imported yet
+_PROBE = r'''
+import json, sys, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+client = app_module.app.test_client()
+response = client.get('/login')
+first_request = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'first_request_status': response.status_code,
+    'modules_loaded': len(sys.modules),
+    'mercadopago_loaded': 'mercadopago' in sys.modules,
+    'sqlitecloud_loaded': 'sqlitecloud' in sys.modules,
+}))
+'''
+
+def measure_startup(db_path, root, runs=3):
+    """Import time of app.py and time to first request, median of `runs` fresh processes"""
+    env = dict(os.environ, USE_SQLITE_CLOUD='false', DB_PATH=db_path, SESSION_STORE='memory')
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', _PROBE], cwd=root, env=env, text=True,
+                                         stderr=subprocess.DEVNULL)
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    samples.sort(key=lambda sample: sample['import_ms'])
+    result = dict(samples[len(samples) // 2])
+    result['import_ms'] = round(result['import_ms'], 2)
+    result['first_request_ms'] = round(sorted(sample['first_request_ms'] for sample in samples)[len(samples) // 2], 2)
+    result['runs'] = runs
+    return result
@@ -0,0 +1,71 @@
+import time
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from helpers import get_db_connection, insert_entry
+from writes import WriteCoordinator
+
+def _entry_job(user_id, account_id, index):
+    when_utc = datetime.now(timezone.utc).isoformat()
+    def job(conn):
+        insert_entry(conn, user_id, account_id, None, 'despesa', 1 + index % 100, 'bench write', when_utc)
+    return job
+
+def _direct(job):
+    """What a write route did before: its own connection and commit"""
+    conn = get_db_connection()
+    try:
+        job(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def _run_threads(threads, writes_per_thread, account, write):
+    errors = []
+    def worker(thread_index):
+        for index in range(writes_per_thread):
+            try:
+                write(_entry_job(*account, thread_index * writes_per_thread + index))
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, errors
+
+def measure_write_throughput(threads=8, writes_per_thread=250):
+    """Entry inserts/second from concurrent threads: one commit each vs. group commits
+
+    The inserted rows are deleted afterwards, so the routes benchmark data
+    is left as generated.
+    """
+    conn = get_db_connection()
+    user_id, account_id = tuple(conn.execute('SELECT user_id, id FROM accounts ORDER BY id LIMIT 1').fetchone())
+    conn.close()
+    account = (user_id, account_id)
+    total = threads * writes_per_thread
+
+    results = {}
+    elapsed, errors = _run_threads(threads, writes_per_thread, account, _direct)
+    results['direct'] = {'writes': total, 'seconds': round(elapsed, 3),
+                         'inserts_per_second': round(total / elapsed, 1), 'busy_errors': len(errors)}
+
+    coordinator = WriteCoordinator(enabled=True)
+    elapsed, errors = _run_threads(threads, writes_per_thread, account,
+                                   lambda job: coordinator.submit(job).result(timeout=60))
+    coordinator.stop()
+    stats = coordinator.stats()
+    results['group_commit'] = {'writes': total, 'seconds': round(elapsed, 3),
+                               'inserts_per_second': round(total / elapsed, 1), 'busy_errors': len(errors),
+                               'batches': stats['batches'], 'mean_batch': stats['mean_batch']}
+    results['speedup'] = round(results['group_commit']['inserts_per_second']
+                               / results['direct']['inserts_per_second'], 2)
+
+    conn = get_db_connection()
+    conn.execute("DELETE FROM entries WHERE note = 'bench write'")
+    conn.commit()
+    conn.close()
+    return results
@@ -0,0 +1,164 @@
+import os
+import math
+from datetime import datetime, timezone
+from helpers import insert_entries
+from ledger import _check_category
+
+# Bulk operation limits
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "200"))
+# Stay below SQLite's default host-parameter limit in IN (...) lists
+IN_CHUNK_SIZE = 500
+
+def load_user_bills(conn, user_id, bill_ids):
+    """Fetch the user's bills among bill_ids with one IN query per chunk: {id: row}
+
+    category_id comes back as None when it is not one of the user's
+    categories of the bill's kind, so it never reaches a payment entry.
+    """
+    ids = list(dict.fromkeys(bill_ids))
+    bills = {}
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        chunk = ids[start:start + IN_CHUNK_SIZE]
+        placeholders = ', '.join('?' for _ in chunk)
+        rows = conn.execute(f'''
+            SELECT b.id, b.account_id, c.id as category_id, b.type, b.amount, b.description, b.due_date_utc, b.status
+            FROM bills b
+            LEFT JOIN categories c ON c.id = b.category_id AND c.user_id = b.user_id
+                AND c.type = CASE b.type WHEN 'pagar' THEN 'despesa' ELSE 'receita' END
+            WHERE b.user_id = ? AND b.id IN ({placeholders})
+        ''', (user_id, *chunk)).fetchall()
+        bills.update({row['id']: row for row in rows})
+    return bills
+
+def _check_open(bill, seen, bill_id):
+    if bill_id in seen:
+        return 'Conta repetida na seleção'
+    if bill is None:
+        return 'Conta não encontrada'
+    if bill['status'] == 'pago':
+        return 'Conta já está paga'
+    return None
+
+def pay_bills(conn, user_id, items):
+    """Mark many bills as paid and create their entries, without committing
+
+    items: [(bill_id, paid_amount or None)]. Returns (results, earliest due date
+    among the paid bills); the caller commits once for the whole batch. The
+    update only takes a bill that is still open, so a bill paid by a
+    concurrent request since it was loaded gets an error and no entry.
+    """
+    bills = load_user_bills(conn, user_id, [bill_id for bill_id, _ in items])
+    paid_date_utc = datetime.now(timezone.utc).isoformat()
+    results, entries, seen = [], [], set()
+    earliest_due = None
+
+    for bill_id, paid_amount in items:
+        bill = bills.get(bill_id)
+        error = _check_open(bill, seen, bill_id)
+        seen.add(bill_id)
+        if error is None and paid_amount is not None and not (math.isfinite(paid_amount) and paid_amount > 0):
+            error = 'Valor deve ser maior que zero'
+        if error:
+            results.append({'id': bill_id, 'status': 'error', 'message': error})
+            continue
+
+        # Use original amount if no amount specified
+        if paid_amount is None:
+            paid_amount = bill['amount']
+        if conn.execute('''
+            UPDATE bills
+            SET status = 'pago', paid_date_utc = ?, paid_amount = ?
+            WHERE id = ? AND user_id = ? AND status != 'pago'
+        ''', (paid_date_utc, paid_amount, bill_id, user_id)).rowcount == 0:
+            results.append({'id': bill_id, 'status': 'error', 'message': 'Conta já está paga'})
+            continue
+        entry_type = 'despesa' if bill['type'] == 'pagar' else 'receita'
+        entries.append((user_id, bill['account_id'], bill['category_id'], entry_type, paid_amount,
+                        f"Pagamento: {bill['description']}", paid_date_utc, paid_date_utc))
+        earliest_due = min(earliest_due or bill['due_date_utc'], bill['due_date_utc'])
+        results.append({'id': bill_id, 'status': 'ok', 'paid_amount': paid_amount})
+
+    if entries:
+        insert_entries(conn, entries)
+    return results, earliest_due
+
+def reschedule_bills(conn, user_id, items):
+    """Move many open bills to new due dates, without committing
+
+    items: [(bill_id, due_date_utc)]. Returns (results, earliest of the old and
+    new due dates of the moved bills).
+    """
+    bills = load_user_bills(conn, user_id, [bill_id for bill_id, _ in items])
+    now_utc = datetime.now(timezone.utc).isoformat()
+    results, updates, seen = [], [], set()
+    earliest_due = None
+
+    for bill_id, due_date_utc in items:
+        bill = bills.get(bill_id)
+        error = _check_open(bill, seen, bill_id)
+        seen.add(bill_id)
+        if error:
+            results.append({'id': bill_id, 'status': 'error', 'message': error})
+            continue
+
+        status = 'vencido' if due_date_utc < now_utc else 'pendente'
+        updates.append((due_date_utc, status, bill_id, user_id))
+        earliest_due = min(earliest_due or due_date_utc, due_date_utc, bill['due_date_utc'])
+        results.append({'id': bill_id, 'status': 'ok', 'due_date_utc': due_date_utc})
+
+    if updates:
+        conn.executemany('''
+            UPDATE bills
+            SET due_date_utc = ?, status = ?
+            WHERE id = ? AND user_id = ?
+        ''', updates)
+    return results, earliest_due
+
+# Fields a bill edit may change; a paid bill only takes its texts (its entry is already written)
+BILL_FIELDS = ('amount', 'description', 'due_date_utc', 'account_id', 'category_id', 'notes', 'recurring')
+PAID_BILL_FIELDS = ('description', 'notes')
+
+def update_bill(conn, user_id, bill_id, changes):
+    """Apply `changes` ({field: value}) to a bill and return the old row, without committing
+
+    The status follows a new due date (vencido/pendente), and the search
+    trigger reindexes the description in the same transaction.
+    """
+    bill = conn.execute('SELECT * FROM bills WHERE id = ? AND user_id = ?', (bill_id, user_id)).fetchone()
+    if bill is None:
+        raise LookupError("Conta não encontrada")
+    allowed = PAID_BILL_FIELDS if bill['status'] == 'pago' else BILL_FIELDS
+    unknown = set(changes) - set(allowed)
+    if unknown:
+        if bill['status'] == 'pago':
+            raise ValueError("Conta já paga: só é possível alterar descrição e observações")
+        raise ValueError(f"Campo inválido: {sorted(unknown)[0]}")
+
+    if 'amount' in changes and not (math.isfinite(changes['amount']) and changes['amount'] > 0):
+        raise ValueError("Valor deve ser maior que zero")
+    if 'description' in changes and not changes['description']:
+        raise ValueError("Descrição é obrigatória")
+    if 'recurring' in changes and changes['recurring'] not in ('nao', 'mensal', 'anual'):
+        raise ValueError("Recorrência inválida")
+    if 'account_id' in changes and conn.execute('SELECT 1 FROM accounts WHERE id = ? AND user_id = ?',
+                                                (changes['account_id'], user_id)).fetchone() is None:
+        raise ValueError("Conta inválida")
+    if changes.get('category_id') is not None:
+        _check_category(conn, user_id, changes['category_id'], 'despesa' if bill['type'] == 'pagar' else 'receita')
+
+    values = dict(changes)
+    if 'due_date_utc' in values:
+        values['status'] = 'vencido' if values['due_date_utc'] < datetime.now(timezone.utc).isoformat() else 'pendente'
+    if values:
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        conn.execute(f'UPDATE bills SET {assignments} WHERE id = ? AND user_id = ?',
+                     (*values.values(), bill_id, user_id))
+    return bill
+
+def delete_bill(conn, user_id, bill_id):
+    """Delete a bill without committing and return it; the entry of a paid bill stays"""
+    bill = conn.execute('SELECT * FROM bills WHERE id = ? AND user_id = ?', (bill_id, user_id)).fetchone()
+    if bill is None:
+        raise LookupError("Conta não encontrada")
+    conn.execute('DELETE FROM bills WHERE id = ? AND user_id = ?', (bill_id, user_id))
+    return bill
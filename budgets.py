@@ -0,0 +1,88 @@
+import math
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from helpers import brl
+
+# Alert thresholds in percent of the monthly limit (the budget_spending triggers in schema.sql use the same)
+BUDGET_THRESHOLDS = (80, 100)
+
+BR_TZ = ZoneInfo('America/Sao_Paulo')
+
+def current_month():
+    return datetime.now(BR_TZ).strftime('%Y-%m')
+
+def set_budget(conn, user_id, category_id, monthly_limit):
+    """Create or change the monthly limit of one of the user's despesa categories, without committing
+
+    Alerts are only raised by later writes: setting a limit below what
+    was already spent this month does not queue one.
+    """
+    if not (math.isfinite(monthly_limit) and monthly_limit > 0):
+        raise ValueError("Limite deve ser maior que zero")
+    category = conn.execute('SELECT type FROM categories WHERE id = ? AND user_id = ?',
+                            (category_id, user_id)).fetchone()
+    if category is None or category['type'] != 'despesa':
+        raise ValueError("Escolha uma categoria de despesa")
+    conn.execute('''
+        INSERT INTO budgets (user_id, category_id, monthly_limit, created_at_utc) VALUES (?, ?, ?, ?)
+        ON CONFLICT(category_id) DO UPDATE SET monthly_limit = excluded.monthly_limit
+    ''', (user_id, category_id, monthly_limit, datetime.now(timezone.utc).isoformat()))
+
+def delete_budget(conn, user_id, category_id):
+    """Remove a category's limit (its spending counters stay); returns whether one existed"""
+    return conn.execute('DELETE FROM budgets WHERE user_id = ? AND category_id = ?',
+                        (user_id, category_id)).rowcount > 0
+
+def budget_status(conn, user_id, month=None):
+    """Limit, spent and percent per budgeted category for a month, most consumed first
+
+    Reads the budgets and their counter rows only: no entries scan.
+    """
+    month = month or current_month()
+    budgets = []
+    for row in conn.execute('''
+        SELECT b.category_id, c.name, b.monthly_limit, COALESCE(s.spent, 0) as spent
+        FROM budgets b
+        JOIN categories c ON c.id = b.category_id
+        LEFT JOIN budget_spending s ON s.category_id = b.category_id AND s.user_id = b.user_id AND s.month = ?
+        WHERE b.user_id = ?
+    ''', (month, user_id)).fetchall():
+        percent = row['spent'] / row['monthly_limit'] * 100
+        budgets.append({
+            'category_id': row['category_id'],
+            'name': row['name'],
+            'limit': row['monthly_limit'],
+            'spent': round(row['spent'], 2),
+            'remaining': round(row['monthly_limit'] - row['spent'], 2),
+            'percent': round(percent, 1),
+            'status': 'estourado' if percent >= BUDGET_THRESHOLDS[-1] else 'alerta' if percent >= BUDGET_THRESHOLDS[0] else 'ok',
+        })
+    return sorted(budgets, key=lambda budget: budget['percent'], reverse=True)
+
+def pending_alerts(conn, user_id=None, limit=100):
+    """Queued threshold crossings not yet notified, oldest first"""
+    sql = '''
+        SELECT a.id, a.user_id, a.category_id, c.name as category_name, a.month, a.threshold,
+               a.spent, a.monthly_limit, a.created_at_utc
+        FROM budget_alerts a
+        JOIN categories c ON c.id = a.category_id
+        WHERE a.notified_at_utc IS NULL
+    '''
+    params = []
+    if user_id is not None:
+        sql += ' AND a.user_id = ?'
+        params.append(user_id)
+    return [dict(row) for row in conn.execute(sql + ' ORDER BY a.id LIMIT ?', (*params, limit)).fetchall()]
+
+def mark_alerts_notified(conn, alert_ids):
+    """Take alerts off the queue, without committing"""
+    now_utc = datetime.now(timezone.utc).isoformat()
+    conn.executemany('UPDATE budget_alerts SET notified_at_utc = ? WHERE id = ?',
+                     [(now_utc, alert_id) for alert_id in alert_ids])
+
+def alert_message(alert):
+    """User-facing text of a threshold crossing"""
+    spent = f"{brl(alert['spent'])} de {brl(alert['monthly_limit'])}"
+    if alert['threshold'] >= BUDGET_THRESHOLDS[-1]:
+        return f"Orçamento de {alert['category_name']} estourado: {spent}"
+    return f"Orçamento de {alert['category_name']} atingiu {alert['threshold']}%: {spent}"
@@ -0,0 +1,292 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Cache configuration
+# CACHE_BACKEND=memory keeps an LRU per process; CACHE_BACKEND=redis shares it between workers
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+CACHE_URL = os.environ.get("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "4096"))
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "3600"))
+# Per-user version counters of the memory backend: CACHE_VERSIONS=sqlite shares them between the
+# workers on the host through a local file, so a write in one worker invalidates every worker's
+# entries (the answer cache and the forecast key off the same version);
+# CACHE_VERSIONS=memory keeps them per process (single worker / tests)
+CACHE_VERSIONS = os.environ.get("CACHE_VERSIONS", "sqlite").lower()
+CACHE_VERSIONS_PATH = os.environ.get("CACHE_VERSIONS_PATH", "./cache_versions.db")
+
+_MISSING = object()
+
+class MemoryCounters:
+    """Version counters of this process only"""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+
+class SQLiteCounters:
+    """Version counters in a local SQLite file, shared by all workers on the host"""
+
+    def __init__(self, path=CACHE_VERSIONS_PATH):
+        self.path = path
+        self._local = threading.local()
+        # The file is created on first use: building the store (at import) touches nothing
+        self._ready = False
+        self._setup_lock = threading.Lock()
+
+    def _setup(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # WAL is a property of the file: set once, so reads never wait for a bump
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.commit()
+        conn.close()
+
+    def _conn(self):
+        if not self._ready:
+            with self._setup_lock:
+                if not self._ready:
+                    self._setup()
+                    self._ready = True
+        # One connection per thread, reopened in a forked worker (connections do not survive fork)
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = sqlite3.connect(self.path, timeout=10)
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT value FROM counters WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key):
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT INTO counters (key, value) VALUES (?, 1) '
+                         'ON CONFLICT(key) DO UPDATE SET value = value + 1', (key,))
+            return conn.execute('SELECT value FROM counters WHERE key = ?', (key,)).fetchone()[0]
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM counters')
+
+def make_counters(kind=CACHE_VERSIONS):
+    """Build the configured version counter store"""
+    if kind == 'sqlite':
+        return SQLiteCounters()
+    return MemoryCounters()
+
+class LRUBackend:
+    """In-process LRU store - the default backend"""
+    name = 'memory'
+    process_local = True
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, counters=None):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        # Version counters live apart from the LRU so they are never evicted
+        self._counters = counters or MemoryCounters()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return _MISSING
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_counter(self, key):
+        return self._counters.get(key)
+
+    def incr(self, key):
+        return self._counters.incr(key)
+
+    def size(self):
+        return len(self._data)
+
+    def clear_entries(self):
+        """Drop the cached values only"""
+        with self._lock:
+            self._data.clear()
+
+    def clear(self):
+        self.clear_entries()
+        self._counters.clear()
+
+class LocalSharedBackend(LRUBackend):
+    """Local stand-in for a shared backend (used in tests).
+
+    Values round-trip through JSON like they would through Redis, and several
+    QueryCache instances can share one object to simulate separate workers.
+    """
+    name = 'local-shared'
+    process_local = False
+
+    def get(self, key):
+        value = super().get(key)
+        if value is _MISSING:
+            return _MISSING
+        return json.loads(value)
+
+    def set(self, key, value):
+        super().set(key, json.dumps(value))
+
+class RedisBackend:
+    """Shared backend for multi-worker deployments (requires the redis package)"""
+    name = 'redis'
+    process_local = False
+
+    def __init__(self, url=CACHE_URL, ttl=CACHE_TTL_SECONDS):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self._client.get(key)
+        if value is None:
+            return _MISSING
+        return json.loads(value)
+
+    def set(self, key, value):
+        self._client.set(key, json.dumps(value), ex=self.ttl)
+
+    def get_counter(self, key):
+        value = self._client.get(key)
+        return int(value) if value is not None else 0
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+    def size(self):
+        return None
+
+    def clear(self):
+        self._client.flushdb()
+
+class QueryCache:
+    """Per-user query result cache invalidated by a per-user version counter"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def user_version(self, user_id):
+        return self.backend.get_counter(f"v:{user_id}")
+
+    def bump_user(self, user_id):
+        """Invalidate every cached result of a user (called by write paths)"""
+        return self.backend.incr(f"v:{user_id}")
+
+    def _key(self, user_id, name, params):
+        version = self.user_version(user_id)
+        return f"q:{user_id}:{version}:{name}:{json.dumps(list(params), default=str)}"
+
+    def get_or_compute(self, user_id, name, params, compute):
+        """Return cached result for (user_id, name, params) or compute and store it"""
+        key = self._key(user_id, name, params)
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            with self._lock:
+                self.hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        self.backend.set(key, value)
+        return value
+
+    def get_or_stream(self, user_id, name, params, produce):
+        """get_or_compute for text produced in parts: yields the parts as they come, caches the joined text
+
+        A cached value comes out as a single part; a stream abandoned halfway is not cached.
+        """
+        key = self._key(user_id, name, params)
+        value = self.backend.get(key)
+        with self._lock:
+            if value is not _MISSING:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is not _MISSING:
+            yield value
+            return
+        parts = []
+        for part in produce():
+            parts.append(part)
+            yield part
+        self.backend.set(key, ''.join(parts))
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': self.backend.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'entries': self.backend.size(),
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+def make_backend(kind=CACHE_BACKEND):
+    """Build the configured cache backend"""
+    if kind == 'redis':
+        return RedisBackend()
+    if kind == 'local-shared':
+        return LocalSharedBackend()
+    return LRUBackend(counters=make_counters())
+
+query_cache = QueryCache(make_backend())
+
+def reset_worker_cache():
+    """Drop process-local entries (a forked worker must not trust the parent's copy)
+
+    The counters stay: other workers share them, and a counter that went
+    back to an old value would make their old entries current again.
+    """
+    if query_cache.backend.process_local:
+        query_cache.backend.clear_entries()
+
+def rows_to_dicts(rows):
+    """Convert DB rows into plain dicts so they can be cached/serialized"""
+    return [dict(row) for row in rows]
+
+def row_to_dict(row):
+    return dict(row) if row is not None else None
+
+def cached_query(user_id, name, params, compute):
+    return query_cache.get_or_compute(user_id, name, params, compute)
+
+def bump_user_version(user_id):
+    return query_cache.bump_user(user_id)
+
+def cache_stats():
+    return query_cache.stats()
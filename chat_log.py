@@ -0,0 +1,152 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from helpers import get_db_connection
+
+# Chat log configuration
+# Messages are buffered in memory and written in batches by a background thread,
+# so logging never adds a DB round-trip to the assistant request
+CHAT_LOG_ENABLED = os.environ.get("CHAT_LOG_ENABLED", "true").lower() == "true"
+CHAT_LOG_FLUSH_SECONDS = float(os.environ.get("CHAT_LOG_FLUSH_SECONDS", "2"))
+CHAT_LOG_BATCH_SIZE = int(os.environ.get("CHAT_LOG_BATCH_SIZE", "200"))
+CHAT_LOG_QUEUE_SIZE = int(os.environ.get("CHAT_LOG_QUEUE_SIZE", "10000"))
+CHAT_LOG_MAX_PER_USER = int(os.environ.get("CHAT_LOG_MAX_PER_USER", "500"))
+
+class ChatLogWriter:
+    """Buffered, batched writer for the append-only chat_messages table"""
+
+    def __init__(self, batch_size=CHAT_LOG_BATCH_SIZE, flush_seconds=CHAT_LOG_FLUSH_SECONDS,
+                 max_per_user=CHAT_LOG_MAX_PER_USER, queue_size=CHAT_LOG_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_per_user = max_per_user
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def record(self, user_id, intent, message, answer, latency_ms):
+        """Enqueue one exchange; never blocks the request (drops when the buffer is full)"""
+        row = (user_id, intent, message, answer, round(latency_ms, 2), datetime.now(timezone.utc).isoformat())
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='chat-log-writer', daemon=True)
+                self._thread.start()
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                continue
+            # Give concurrent requests a moment to join the batch
+            self._stopping.wait(min(self.flush_seconds, 0.25))
+            self._write(self._drain(first))
+
+    def flush(self):
+        """Write everything buffered so far (tests, shutdown)"""
+        if self._thread is not None and self._thread.is_alive() and not self._stopping.is_set():
+            # Let the writer thread finish, so rows keep their arrival order
+            self._queue.join()
+            return
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        with self._flush_lock:
+            conn = None
+            try:
+                conn = get_db_connection()
+                conn.executemany('''
+                    INSERT INTO chat_messages (user_id, intent, message, answer, latency_ms, created_at_utc)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', batch)
+
+                # Rolling retention: keep only the newest messages of each user touched by the batch
+                for user_id in {row[0] for row in batch}:
+                    conn.execute('''
+                        DELETE FROM chat_messages
+                        WHERE user_id = ? AND id <= (
+                            SELECT id FROM chat_messages WHERE user_id = ?
+                            ORDER BY id DESC LIMIT 1 OFFSET ?
+                        )
+                    ''', (user_id, user_id, self.max_per_user))
+
+                conn.commit()
+                self.written += len(batch)
+            except Exception as e:
+                logging.error(f"Error writing chat log: {e}")
+            finally:
+                if conn:
+                    conn.close()
+                for _ in batch:
+                    self._queue.task_done()
+
+    def reset(self, queue_size=CHAT_LOG_QUEUE_SIZE):
+        """Fresh buffer, locks and thread state (a forked worker inherits the parent's)"""
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+chat_log = ChatLogWriter()
+atexit.register(chat_log.stop)
+
+def record_chat(user_id, intent, message, answer, latency_ms):
+    if CHAT_LOG_ENABLED:
+        chat_log.record(user_id, intent, message, answer, latency_ms)
+
+def get_chat_history(conn, user_id, page=1, per_page=20):
+    """Newest-first page of the user's conversation"""
+    rows = conn.execute('''
+        SELECT id, intent, message, answer, latency_ms, created_at_utc
+        FROM chat_messages
+        WHERE user_id = ?
+        ORDER BY id DESC
+        LIMIT ? OFFSET ?
+    ''', (user_id, per_page + 1, (page - 1) * per_page)).fetchall()
+    messages = [dict(row) for row in rows[:per_page]]
+    return messages, len(rows) > per_page
+
+def get_intent_stats(conn):
+    """Intent frequency and latency across all users (from the chat_intent_stats view)"""
+    rows = conn.execute('SELECT * FROM chat_intent_stats ORDER BY total DESC').fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,26 @@
+import os
+
+def _env_bool(name, default):
+    return os.environ.get(name, default).lower() == "true"
+
+class Config:
+    """App settings read from the environment; create_app(overrides) replaces any of them"""
+    SECRET_KEY = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+
+    # Database (SQLite Cloud by default; USE_SQLITE_CLOUD=false uses DB_PATH)
+    USE_SQLITE_CLOUD = _env_bool("USE_SQLITE_CLOUD", "true")
+    DB_PATH = os.environ.get("DB_PATH", "./database.db")
+    SQLITECLOUD_URL = os.environ.get("SQLITECLOUD_URL")
+
+    # Server-side sessions (sqlite | memory)
+    SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite").lower()
+    SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "./sessions.db")
+
+    # Admin users (comma-separated emails) can see operational endpoints
+    ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get("ADMIN_EMAILS", "").split(',') if email.strip()}
+
+class TestConfig(Config):
+    """Local throwaway database and in-memory sessions"""
+    TESTING = True
+    USE_SQLITE_CLOUD = False
+    SESSION_STORE = 'memory'
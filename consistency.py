@@ -0,0 +1,151 @@
+import sys
+import logging
+from helpers import SIGNED_AMOUNT, get_db_connection
+from archive import entries_source
+from balances import month_end, next_month
+
+# Stored totals are float sums built up by deltas: differences below this are rounding
+TOLERANCE = 0.005
+
+def _user_filter(user_id):
+    return ('AND user_id = ?', (user_id,)) if user_id is not None else ('', ())
+
+def check_checkpoints(conn, user_id=None):
+    """Compare every monthly checkpoint with a full recompute from entries and archives"""
+    where, params = _user_filter(user_id)
+    monthly = {}
+    for row in conn.execute(f'''
+        SELECT account_id, substr(local_day, 1, 7) as month, SUM({SIGNED_AMOUNT}) as total
+        FROM {entries_source(conn)}
+        WHERE 1 = 1 {where}
+        GROUP BY account_id, month
+    ''', params).fetchall():
+        monthly.setdefault(row['account_id'], {})[row['month']] = row['total']
+
+    stored = {}
+    for row in conn.execute(f'''
+        SELECT account_id, month, closing_total FROM balance_checkpoints
+        WHERE 1 = 1 {where}
+        ORDER BY account_id, month
+    ''', params).fetchall():
+        stored.setdefault(row['account_id'], []).append((row['month'], row['closing_total']))
+
+    problems = []
+    for account_id, checkpoints in stored.items():
+        months = [month for month, _ in checkpoints]
+        for previous, current in zip(months, months[1:]):
+            if current != next_month(previous):
+                problems.append({'check': 'checkpoint_gap', 'account_id': account_id, 'month': next_month(previous)})
+        deltas = sorted(monthly.get(account_id, {}).items())
+        index, expected = 0, 0.0
+        for month, closing_total in checkpoints:
+            while index < len(deltas) and deltas[index][0] <= month:
+                expected += deltas[index][1]
+                index += 1
+            if abs(expected - closing_total) > TOLERANCE:
+                problems.append({'check': 'checkpoint', 'account_id': account_id, 'month': month,
+                                 'stored': closing_total, 'expected': round(expected, 2),
+                                 'through': month_end(month).isoformat()})
+    return problems
+
+def check_archived_totals(conn, user_id=None):
+    """accounts.archived_total against the sums of the archive tables"""
+    where, params = _user_filter(user_id)
+    expected = {}
+    for row in conn.execute('SELECT table_name FROM entry_archives').fetchall():
+        for total in conn.execute(f'''
+            SELECT account_id, SUM({SIGNED_AMOUNT}) as total FROM {row['table_name']}
+            WHERE 1 = 1 {where}
+            GROUP BY account_id
+        ''', params).fetchall():
+            expected[total['account_id']] = expected.get(total['account_id'], 0.0) + total['total']
+    return [{'check': 'archived_total', 'account_id': row['id'], 'stored': row['archived_total'],
+             'expected': round(expected.get(row['id'], 0.0), 2)}
+            for row in conn.execute(f'SELECT id, archived_total FROM accounts WHERE 1 = 1 {where}', params).fetchall()
+            if abs(expected.get(row['id'], 0.0) - row['archived_total']) > TOLERANCE]
+
+def check_budget_spending(conn, user_id=None):
+    """Budget counters against the despesa sums of the hot entries (archived months have no counters)"""
+    where, params = _user_filter(user_id)
+    expected = {(row['category_id'], row['month']): (row['user_id'], row['spent']) for row in conn.execute(f'''
+        SELECT user_id, category_id, substr(local_day, 1, 7) as month, SUM(amount) as spent FROM entries
+        WHERE type = 'despesa' AND category_id IS NOT NULL {where}
+        GROUP BY category_id, month
+    ''', params).fetchall()}
+    stored = {(row['category_id'], row['month']): (row['user_id'], row['spent']) for row in conn.execute(
+        f'SELECT user_id, category_id, month, spent FROM budget_spending WHERE 1 = 1 {where}', params).fetchall()}
+    problems = []
+    for key in expected.keys() | stored.keys():
+        owner, stored_spent = stored.get(key, (None, 0.0))
+        owner, expected_spent = expected.get(key, (owner, 0.0))
+        if abs(stored_spent - expected_spent) > TOLERANCE:
+            problems.append({'check': 'budget_spending', 'user_id': owner, 'category_id': key[0], 'month': key[1],
+                             'stored': stored_spent, 'expected': round(expected_spent, 2)})
+    return problems
+
+def check_search_index(conn):
+    """FTS5 integrity-check of each index against its content table"""
+    problems = []
+    for fts_table in ('entries_fts', 'bills_fts'):
+        try:
+            conn.execute(f"INSERT INTO {fts_table}({fts_table}, rank) VALUES ('integrity-check', 1)")
+        except Exception as e:
+            problems.append({'check': 'search_index', 'table': fts_table, 'error': str(e)})
+    # The check is an INSERT command: end the transaction it opened (it writes nothing)
+    conn.commit()
+    return problems
+
+def check_transfers(conn, user_id=None):
+    """Every transfer group has two legs that cancel out"""
+    where, params = _user_filter(user_id)
+    return [{'check': 'transfer', 'transfer_group': row['transfer_group'], 'legs': row['legs'], 'sum': row['total']}
+            for row in conn.execute(f'''
+                SELECT transfer_group, COUNT(*) as legs, SUM(amount) as total FROM entries
+                WHERE transfer_group IS NOT NULL {where}
+                GROUP BY transfer_group
+                HAVING COUNT(*) != 2 OR ABS(SUM(amount)) > {TOLERANCE}
+            ''', params).fetchall()]
+
+def check_consistency(conn, user_id=None, repair=False):
+    """Compare derived data with a full recompute; returns the problems found
+
+    With repair=True the derived stores are fixed in one transaction:
+    wrong checkpoints are dropped (rebuilt on the next balance read),
+    archived totals and budget counters are set to the recomputed sums
+    and the search indexes are rebuilt. Broken transfers are only reported.
+    """
+    problems = (check_checkpoints(conn, user_id) + check_archived_totals(conn, user_id)
+                + check_budget_spending(conn, user_id) + check_search_index(conn) + check_transfers(conn, user_id))
+    if repair and problems:
+        try:
+            for account_id in {p['account_id'] for p in problems if p['check'] in ('checkpoint', 'checkpoint_gap')}:
+                conn.execute('DELETE FROM balance_checkpoints WHERE account_id = ?', (account_id,))
+            for problem in problems:
+                if problem['check'] == 'archived_total':
+                    conn.execute('UPDATE accounts SET archived_total = ? WHERE id = ?',
+                                 (problem['expected'], problem['account_id']))
+                elif problem['check'] == 'budget_spending':
+                    conn.execute('''
+                        INSERT INTO budget_spending (user_id, category_id, month, spent) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(category_id, month) DO UPDATE SET spent = excluded.spent
+                    ''', (problem['user_id'], problem['category_id'], problem['month'], problem['expected']))
+                elif problem['check'] == 'search_index':
+                    conn.execute(f"INSERT INTO {problem['table']}({problem['table']}) VALUES ('rebuild')")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return problems
+
+if __name__ == '__main__':
+    # Periodic job or after an incident: python consistency.py [--repair]
+    logging.basicConfig(level=logging.INFO)
+    conn = get_db_connection()
+    try:
+        found = check_consistency(conn, repair='--repair' in sys.argv[1:])
+    finally:
+        conn.close()
+    for problem in found:
+        logging.error(f"Inconsistent derived data: {problem}")
+    logging.info(f"{len(found)} problem(s) found")
+    sys.exit(1 if found else 0)
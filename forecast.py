@@ -0,0 +1,290 @@
+import os
+import threading
+from calendar import monthrange
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+from helpers import get_db_connection, local_day_from_utc
+from cache import query_cache
+
+# Forecast configuration
+FORECAST_DAYS = int(os.environ.get("FORECAST_DAYS", "90"))
+RUN_RATE_DAYS = int(os.environ.get("FORECAST_RUN_RATE_DAYS", "90"))
+# Users whose state a worker keeps; the least recently read are dropped (and rebuilt when read again)
+FORECAST_MAX_USERS = int(os.environ.get("FORECAST_MAX_USERS", "1024"))
+
+BR_TZ = ZoneInfo('America/Sao_Paulo')
+
+# Entries created by pay_bill are already represented by the bills themselves
+BILL_PAYMENT_NOTE = 'Pagamento:%'
+
+def _today():
+    return datetime.now(BR_TZ).date()
+
+def _add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, monthrange(year, month)[1]))
+
+def bill_occurrences(due_day, recurring, today, horizon):
+    """Day offsets (from today) at which a pending bill hits the balance
+
+    An overdue bill is expected today; recurring bills repeat monthly or
+    yearly from their due date until the end of the horizon.
+    """
+    offsets = [max((due_day - today).days, 0)]
+    if recurring in ('mensal', 'anual'):
+        step = 1 if recurring == 'mensal' else 12
+        k = 1
+        while True:
+            offset = (_add_months(due_day, step * k) - today).days
+            if offset >= horizon:
+                break
+            if offset > offsets[-1]:
+                offsets.append(offset)
+            k += 1
+    return [offset for offset in offsets if offset < horizon]
+
+def _mark(state, entries, bills_from):
+    state['dirty_entries'] = state['dirty_entries'] or entries
+    if bills_from is not None:
+        current = state['dirty_bills_from']
+        state['dirty_bills_from'] = bills_from if current is None else min(current, bills_from)
+
+class ForecastEngine:
+    """Day-by-day projected balance per account, maintained incrementally
+
+    Per user it keeps the starting balances, the daily run-rate of each
+    account and the bill deltas of every day of the horizon. A write only
+    marks what changed: entries refresh balances/run-rates, bills refresh
+    the deltas from the earliest changed day onwards.
+
+    A stored state is never changed in place (only its write marks are):
+    builds and refreshes work on a new copy outside the lock and swap it in.
+    """
+
+    def __init__(self, horizon=FORECAST_DAYS, max_users=FORECAST_MAX_USERS):
+        self.horizon = horizon
+        self.max_users = max_users
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.full_builds = 0
+        self.partial_builds = 0
+
+    def notify_write(self, user_id, entries=False, bills_from=None):
+        """Record a write: entries changed and/or bills changed from a local day on"""
+        version = query_cache.user_version(user_id)
+        with self._lock:
+            state = self._states.get(user_id)
+            if state is None:
+                return
+            state['version'] = version
+            state['writes'] += 1
+            _mark(state, entries, bills_from)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+    def get(self, user_id):
+        """Up-to-date forecast state of a user (rebuilt only as far as needed)"""
+        today = _today()
+        version = query_cache.user_version(user_id)
+        with self._lock:
+            current = self._states.get(user_id)
+            writes = current['writes'] if current is not None else 0
+            if current is not None and current['today'] == today and current['version'] == version:
+                if not current['dirty_entries'] and current['dirty_bills_from'] is None:
+                    self._states.move_to_end(user_id)
+                    return current
+                # The marks move to the copy being refreshed: writes notified meanwhile mark `current` again
+                pending = (current['dirty_entries'], current['dirty_bills_from'])
+                state = dict(current, writes=0)
+                current['dirty_entries'], current['dirty_bills_from'] = False, None
+            else:
+                state = None
+
+        partial = state is not None
+        conn = get_db_connection()
+        try:
+            if partial:
+                state['accounts'] = self._copy_accounts(state['accounts'])
+                self._refresh(conn, user_id, state)
+            else:
+                state = self._build(conn, user_id, today, version)
+        except Exception:
+            if partial:
+                with self._lock:
+                    _mark(current, *pending)
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            if partial:
+                self.partial_builds += 1
+            else:
+                self.full_builds += 1
+            # Swapped in only over the state it started from (another reader may have stored a newer one)
+            if self._states.get(user_id) is current:
+                if current is not None and current['writes'] != writes:
+                    # Written while this one was built: those marks stay pending
+                    state['version'] = current['version']
+                    _mark(state, current['dirty_entries'], current['dirty_bills_from'])
+                self._store(user_id, state)
+        return state
+
+    def _store(self, user_id, state):
+        self._states[user_id] = state
+        self._states.move_to_end(user_id)
+        while len(self._states) > self.max_users:
+            self._states.popitem(last=False)
+
+    @staticmethod
+    def _copy_accounts(accounts):
+        return {account_id: dict(account, rates=dict(account['rates']), bills=list(account['bills']),
+                                 balance=list(account['balance']))
+                for account_id, account in accounts.items()}
+
+    def _build(self, conn, user_id, today, version):
+        state = {
+            'today': today,
+            'version': version,
+            'accounts': {},
+            'dirty_entries': False,
+            'dirty_bills_from': None,
+            'writes': 0,
+        }
+        self._load_balances(conn, user_id, state)
+        self._load_bills(conn, user_id, state, 0)
+        self._recompute(state, 0)
+        return state
+
+    def _refresh(self, conn, user_id, state):
+        start = self.horizon
+        if state['dirty_entries']:
+            known_accounts = set(state['accounts'])
+            self._load_balances(conn, user_id, state)
+            if set(state['accounts']) != known_accounts:
+                self._load_bills(conn, user_id, state, 0)
+            start = 0
+        if state['dirty_bills_from'] is not None:
+            offset = max((state['dirty_bills_from'] - state['today']).days, 0)
+            if offset < self.horizon:
+                self._load_bills(conn, user_id, state, offset)
+                start = min(start, offset)
+        if start < self.horizon:
+            self._recompute(state, start)
+        state['dirty_entries'] = False
+        state['dirty_bills_from'] = None
+
+    def _load_balances(self, conn, user_id, state):
+        """Starting balances and per-category daily run-rates of each account"""
+        accounts = conn.execute('''
+            SELECT a.id, a.name, a.initial_balance,
+                   a.archived_total + COALESCE(SUM(CASE
+                       WHEN e.type = 'receita' THEN e.amount
+                       WHEN e.type = 'despesa' THEN -e.amount
+                       WHEN e.type = 'transferencia' THEN e.amount
+                       ELSE 0
+                   END), 0) as transactions_total
+            FROM accounts a
+            LEFT JOIN entries e ON a.id = e.account_id
+            WHERE a.user_id = ?
+            GROUP BY a.id, a.name, a.initial_balance
+        ''', (user_id,)).fetchall()
+
+        since = (state['today'] - timedelta(days=RUN_RATE_DAYS)).isoformat()
+        rates = conn.execute('''
+            SELECT account_id, category_id,
+                   SUM(CASE WHEN type = 'receita' THEN amount WHEN type = 'despesa' THEN -amount ELSE 0 END) as total
+            FROM entries
+            WHERE user_id = ? AND local_day >= ? AND local_day < ?
+              AND (note IS NULL OR note NOT LIKE ?)
+            GROUP BY account_id, category_id
+        ''', (user_id, since, state['today'].isoformat(), BILL_PAYMENT_NOTE)).fetchall()
+
+        previous = state['accounts']
+        state['accounts'] = {}
+        for acc in accounts:
+            old = previous.get(acc['id'])
+            state['accounts'][acc['id']] = {
+                'name': acc['name'],
+                'start': acc['initial_balance'] + acc['transactions_total'],
+                'rates': {},
+                'bills': old['bills'] if old else [0.0] * self.horizon,
+                'balance': old['balance'] if old else [0.0] * self.horizon,
+            }
+        for row in rates:
+            account = state['accounts'].get(row['account_id'])
+            if account is not None:
+                account['rates'][row['category_id']] = row['total'] / RUN_RATE_DAYS
+
+    def _load_bills(self, conn, user_id, state, offset):
+        """Rebuild bill deltas for days >= offset"""
+        since_utc = (datetime(state['today'].year, state['today'].month, state['today'].day, tzinfo=BR_TZ)
+                     + timedelta(days=offset)).astimezone(timezone.utc).isoformat()
+        # Recurring bills due earlier can still land after the offset
+        bills = conn.execute('''
+            SELECT account_id, type, amount, due_date_utc, recurring
+            FROM bills
+            WHERE user_id = ? AND status != 'pago'
+              AND (due_date_utc >= ? OR recurring IN ('mensal', 'anual') OR ? = 0)
+        ''', (user_id, since_utc, offset)).fetchall()
+
+        for account in state['accounts'].values():
+            account['bills'][offset:] = [0.0] * (self.horizon - offset)
+        for bill in bills:
+            account = state['accounts'].get(bill['account_id'])
+            if account is None:
+                continue
+            amount = bill['amount'] if bill['type'] == 'receber' else -bill['amount']
+            due_day = datetime.fromisoformat(local_day_from_utc(bill['due_date_utc'])).date()
+            for day in bill_occurrences(due_day, bill['recurring'], state['today'], self.horizon):
+                if day >= offset:
+                    account['bills'][day] += amount
+
+    def _recompute(self, state, start):
+        """Prefix-sum balances from day `start` (earlier days are unchanged)"""
+        for account in state['accounts'].values():
+            rate = sum(account['rates'].values())
+            balance = account['start'] if start == 0 else account['balance'][start - 1]
+            for day in range(start, self.horizon):
+                balance += account['bills'][day] + (rate if day > 0 else 0.0)
+                account['balance'][day] = balance
+
+    def summary(self, user_id, days=30):
+        """Serializable projection for the dashboard, API and assistant"""
+        days = max(1, min(days, self.horizon))
+        state = self.get(user_id)
+        dates = [(state['today'] + timedelta(days=i)).isoformat() for i in range(days)]
+        accounts = [
+            {'id': account_id, 'name': account['name'], 'balances': [round(v, 2) for v in account['balance'][:days]],
+             'daily_run_rate': round(sum(account['rates'].values()), 2)}
+            for account_id, account in state['accounts'].items()
+        ]
+        total = [round(sum(account['balance'][i] for account in state['accounts'].values()), 2) for i in range(days)]
+        min_index = min(range(days), key=lambda i: total[i]) if total else 0
+        return {
+            'days': dates,
+            'accounts': accounts,
+            'total': total,
+            'start_total': round(sum(account['start'] for account in state['accounts'].values()), 2),
+            'end_total': total[-1] if total else 0.0,
+            'min_total': total[min_index] if total else 0.0,
+            'min_day': dates[min_index] if dates else None,
+        }
+
+forecast_engine = ForecastEngine()
+
+def forecast_summary(user_id, days=30):
+    return forecast_engine.summary(user_id, days)
+
+def notify_forecast_write(user_id, entries=False, bill_due_utc=None):
+    """Call after bump_user_version on writes that affect the projection"""
+    bills_from = datetime.fromisoformat(local_day_from_utc(bill_due_utc)).date() if bill_due_utc else None
+    forecast_engine.notify_write(user_id, entries=entries, bills_from=bills_from)
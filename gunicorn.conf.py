@@ -0,0 +1,29 @@
+"""Gunicorn settings: load the app once in the master and fork cheap workers"""
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+# Import app.py (and its dependencies) once; workers share the loaded code copy-on-write
+preload_app = True
+
+def on_starting(server):
+    # Create/migrate the schema before forking, so workers find it current
+    from main import app
+    from helpers import ensure_db
+    app.extensions['database'].activate()
+    ensure_db()
+    # Minify/fingerprint/precompress the static bundles once, before the workers serve them
+    from assets import build_assets
+    build_assets()
+
+def post_fork(server, worker):
+    # Thread pools and caches are not fork-safe: give each worker its own
+    from main import app
+    app.extensions['worker_resources'].start()
+
+def worker_exit(server, worker):
+    # Drain the assistant pool and flush the chat log before the worker goes away
+    from main import app
+    app.extensions['worker_resources'].stop()
@@ -1,6 +1,8 @@
 import sqlite3
-import sqlitecloud
 import os
+import zlib
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
@@ -9,6 +11,38 @@ SQLITECLOUD_URL = os.environ.get("SQLITECLOUD_URL", "sqlitecloud://cmq6frwshz.g4
 USE_SQLITE_CLOUD = os.environ.get("USE_SQLITE_CLOUD", "true").lower() == "true"
 DB_PATH = os.environ.get("DB_PATH", "./database.db")
 
+try:
+    import fcntl
+except ImportError:  # Windows: workers only get the in-process lock
+    fcntl = None
+
+class Database:
+    """Connection settings of one app (app.extensions['database']), defaults from the env
+
+    create_app builds one from its config; the app's 'database' worker
+    resource activates it, and get_db_connection then opens connections
+    to the active database (scripts without an app use the env defaults).
+    """
+
+    def __init__(self, db_path=DB_PATH, use_sqlite_cloud=USE_SQLITE_CLOUD, sqlitecloud_url=None):
+        self.db_path = db_path
+        self.use_sqlite_cloud = use_sqlite_cloud
+        self.sqlitecloud_url = sqlitecloud_url or SQLITECLOUD_URL
+        # Schema checked by ensure_db in this process
+        self.ready = False
+        self.ready_lock = threading.Lock()
+
+    def activate(self):
+        """Make this the database get_db_connection uses; returns the previous one"""
+        global _database
+        previous, _database = _database, self
+        return previous
+
+_database = Database()
+
+def current_database():
+    return _database
+
 def brl(value):
     """Format value as Brazilian currency"""
     if value is None:
@@ -85,6 +119,15 @@ def parse_br_datetime(datetime_str):
     except ValueError:
         raise ValueError("Formato de data inválido")
 
+# Effect of an entry on its account's balance (transfer legs are stored signed)
+SIGNED_AMOUNT = ("CASE WHEN type = 'receita' THEN amount WHEN type = 'despesa' THEN -amount "
+                 "WHEN type = 'transferencia' THEN amount ELSE 0 END")
+
+def local_day_from_utc(utc_iso_string):
+    """Local (São Paulo) calendar day of a UTC ISO timestamp, as YYYY-MM-DD"""
+    dt_utc = datetime.fromisoformat(utc_iso_string.replace('Z', '+00:00'))
+    return dt_utc.astimezone(ZoneInfo('America/Sao_Paulo')).date().isoformat()
+
 class DictRow:
     """Simple row class that acts like both dict and has attribute access"""
     def __init__(self, cursor, row):
@@ -110,39 +153,93 @@ class DictRow:
     def items(self):
         return self._data.items()
 
+# Callables run on every new connection (instrumentation, benchmarks)
+_connection_hooks = []
+
+def on_connect(hook):
+    """Register hook(conn), called for each connection get_db_connection opens
+
+    A hook may return a wrapper, which is then used in place of the connection.
+    """
+    if hook not in _connection_hooks:
+        _connection_hooks.append(hook)
+    return hook
+
+def remove_connect_hook(hook):
+    if hook in _connection_hooks:
+        _connection_hooks.remove(hook)
+
 def get_db_connection():
     """Get database connection with row factory"""
-    if USE_SQLITE_CLOUD:
-        # SQLite Cloud connection
-        conn = sqlitecloud.connect(SQLITECLOUD_URL)
+    database = _database
+    if database.use_sqlite_cloud:
+        # SQLite Cloud connection (driver imported on first use)
+        import sqlitecloud
+        conn = sqlitecloud.connect(database.sqlitecloud_url)
         # Custom row factory for SQLite Cloud compatibility
         conn.row_factory = DictRow
     else:
         # Local SQLite connection
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(database.db_path)
         conn.row_factory = sqlite3.Row
     
     conn.execute('PRAGMA foreign_keys = ON')
+    for hook in _connection_hooks:
+        conn = hook(conn) or conn
     return conn
 
-def init_db():
-    """Initialize database with schema"""
-    if USE_SQLITE_CLOUD:
-        print("Connecting to SQLite Cloud database...")
-    else:
-        if not os.path.exists(DB_PATH):
-            print("Creating local database...")
-        
-    conn = get_db_connection()
-    
+class LazyConnection:
+    """Opens the database connection only on first use (cached pages may not need it)"""
+    def __init__(self):
+        self._conn = None
+
+    def _get(self):
+        if self._conn is None:
+            self._conn = get_db_connection()
+        return self._conn
+
+    def execute(self, *args, **kwargs):
+        return self._get().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._get().executemany(*args, **kwargs)
+
+    def commit(self):
+        if self._conn is not None:
+            self._conn.commit()
+
+    def rollback(self):
+        if self._conn is not None:
+            self._conn.rollback()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+def split_sql_statements(sql):
+    """Split a SQL script into complete statements (triggers keep their inner ';')"""
+    statements = []
+    current = ''
+    for line in sql.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip():
+                statements.append(current.strip())
+            current = ''
+    if current.strip():
+        statements.append(current.strip())
+    return statements
+
+def execute_schema(conn):
+    """Run schema.sql (every statement is idempotent)"""
     # Read and execute schema
     with open('schema.sql', 'r', encoding='utf-8') as f:
         schema_sql = f.read()
     
     # For SQLite Cloud, we need to execute statements individually
-    if USE_SQLITE_CLOUD:
-        statements = [stmt.strip() for stmt in schema_sql.split(';') if stmt.strip()]
-        for statement in statements:
+    if _database.use_sqlite_cloud:
+        for statement in split_sql_statements(schema_sql):
             try:
                 conn.execute(statement)
             except Exception as e:
@@ -151,11 +248,231 @@ def init_db():
         conn.executescript(schema_sql)
     
     conn.commit()
+
+def init_db():
+    """Initialize database with schema"""
+    if _database.use_sqlite_cloud:
+        print("Connecting to SQLite Cloud database...")
+    else:
+        if not os.path.exists(_database.db_path):
+            print("Creating local database...")
+        
+    conn = get_db_connection()
+    
+    execute_schema(conn)
+    migrate_db(conn)
     conn.close()
     
-    db_type = "SQLite Cloud" if USE_SQLITE_CLOUD else "Local SQLite"
+    db_type = "SQLite Cloud" if _database.use_sqlite_cloud else "Local SQLite"
     print(f"{db_type} database initialized successfully!")
 
+def _column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f'PRAGMA table_info({table})').fetchall())
+
+def _migrate_entries_local_day(conn, batch_size=1000):
+    """entries.local_day: add the column, backfill it and index (user_id, local_day)"""
+    if not _column_exists(conn, 'entries', 'local_day'):
+        conn.execute('ALTER TABLE entries ADD COLUMN local_day TEXT')
+    
+    while True:
+        rows = conn.execute(
+            'SELECT id, when_utc FROM entries WHERE local_day IS NULL LIMIT ?', (batch_size,)
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany('UPDATE entries SET local_day = ? WHERE id = ?',
+                         [(local_day_from_utc(row[1]), row[0]) for row in rows])
+        conn.commit()
+    
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_user_local_day ON entries(user_id, local_day)')
+    conn.commit()
+
+def _migrate_entries_transfer_group(conn):
+    """entries.transfer_group: links the two legs of a transfer"""
+    if not _column_exists(conn, 'entries', 'transfer_group'):
+        conn.execute('ALTER TABLE entries ADD COLUMN transfer_group TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_transfer_group ON entries(transfer_group)')
+    conn.commit()
+
+def _migrate_accounts_archived_total(conn):
+    """accounts.archived_total: signed sum of the account's archived entries"""
+    if not _column_exists(conn, 'accounts', 'archived_total'):
+        conn.execute('ALTER TABLE accounts ADD COLUMN archived_total REAL NOT NULL DEFAULT 0')
+    conn.commit()
+
+def _migrate_checkpoint_delta_triggers(conn):
+    """Checkpoint triggers apply deltas now: drop the old ones that only invalidated"""
+    for trigger in ('balance_checkpoints_insert', 'balance_checkpoints_delete', 'balance_checkpoints_update'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    if not _table_exists(conn, 'balance_checkpoints_delta_insert'):
+        execute_schema(conn)
+    conn.commit()
+
+def _migrate_budget_spending(conn):
+    """budget_spending: backfill the per-category monthly spending of existing entries"""
+    if not _table_exists(conn, 'budget_spending'):
+        execute_schema(conn)
+    if conn.execute('SELECT 1 FROM budget_spending LIMIT 1').fetchone() is None:
+        conn.execute('''
+            INSERT INTO budget_spending (user_id, category_id, month, spent)
+            SELECT user_id, category_id, substr(local_day, 1, 7), SUM(amount) FROM entries
+            WHERE type = 'despesa' AND category_id IS NOT NULL
+            GROUP BY category_id, substr(local_day, 1, 7)
+        ''')
+    conn.commit()
+
+def _migrate_notifications(conn):
+    """notifications, bill_reminders and the (status, due date) index the reminder scheduler scans"""
+    if not _table_exists(conn, 'notifications') or not _table_exists(conn, 'idx_bills_status_due'):
+        execute_schema(conn)
+    conn.commit()
+
+def _migrate_budget_update_trigger(conn):
+    """budget_spending_update: recreate it with the prior spend counting the old amount"""
+    conn.execute('DROP TRIGGER IF EXISTS budget_spending_update')
+    execute_schema(conn)
+    conn.commit()
+
+def _migrate_budget_owner_triggers(conn):
+    """budget_spending_insert/update: recreate them with the alert join matching the budget's owner"""
+    conn.execute('DROP TRIGGER IF EXISTS budget_spending_insert')
+    conn.execute('DROP TRIGGER IF EXISTS budget_spending_update')
+    execute_schema(conn)
+    conn.commit()
+
+def _migrate_archived_search(conn):
+    """entries_fts: index archived entries too (archiving used to drop them from search)"""
+    from archive import refresh_search_source
+    refresh_search_source(conn)
+    indexed = conn.execute('SELECT COUNT(*) FROM entries_fts_docsize').fetchone()[0]
+    if indexed != conn.execute('SELECT COUNT(*) FROM entries_fts_source').fetchone()[0]:
+        conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+    conn.commit()
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone() is not None
+
+def _migrate_search_index(conn):
+    """FTS5 search tables: create them (with their triggers) and index existing rows"""
+    if not _table_exists(conn, 'entries_fts') or not _table_exists(conn, 'bills_fts'):
+        execute_schema(conn)
+    
+    for fts_table in ('entries_fts', 'bills_fts'):
+        indexed = conn.execute(f'SELECT COUNT(*) FROM {fts_table}_docsize').fetchone()[0]
+        total = conn.execute(f'SELECT COUNT(*) FROM {fts_table}_source').fetchone()[0]
+        if indexed != total:
+            conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+    conn.commit()
+
+_SEARCH_TRIGGERS = ('entries_fts_insert', 'entries_fts_delete', 'entries_fts_update',
+                    'bills_fts_insert', 'bills_fts_delete', 'bills_fts_update')
+
+def _migrate_search_owner(conn):
+    """FTS5 search tables: recreate them with the per-user owner column and reindex"""
+    if all(_column_exists(conn, fts_table, 'owner') for fts_table in ('entries_fts', 'bills_fts')):
+        return
+    for trigger in _SEARCH_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.execute('DROP TABLE IF EXISTS entries_fts')
+    conn.execute('DROP TABLE IF EXISTS bills_fts')
+    execute_schema(conn)
+    for fts_table in ('entries_fts', 'bills_fts'):
+        conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+    conn.commit()
+
+# Applied in order by migrate_db; each one must be idempotent
+MIGRATIONS = [
+    _migrate_entries_local_day,
+    _migrate_search_index,
+    _migrate_entries_transfer_group,
+    _migrate_accounts_archived_total,
+    _migrate_checkpoint_delta_triggers,
+    _migrate_budget_spending,
+    _migrate_notifications,
+    _migrate_budget_update_trigger,
+    _migrate_search_owner,
+    _migrate_budget_owner_triggers,
+    _migrate_archived_search,
+]
+
+def schema_version():
+    """Fingerprint of schema.sql plus the migration list, stored in PRAGMA user_version"""
+    with open('schema.sql', 'rb') as f:
+        fingerprint = f.read() + ','.join(migration.__name__ for migration in MIGRATIONS).encode()
+    return zlib.crc32(fingerprint) & 0x7fffffff
+
+def migrate_db(conn=None):
+    """Bring an existing database up to the current schema"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        for migration in MIGRATIONS:
+            migration(conn)
+        conn.execute(f'PRAGMA user_version = {schema_version()}')
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+@contextmanager
+def _init_file_lock():
+    """Serialize schema work between worker processes on this host"""
+    path = os.environ.get("DB_INIT_LOCK_PATH") or (
+        './.db_init.lock' if _database.use_sqlite_cloud else f'{_database.db_path}.init.lock')
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def ensure_db():
+    """Create/migrate the schema once: a no-op after the first call in a process,
+    and a single version check in workers that find it already current"""
+    database = _database
+    if database.ready:
+        return False
+    with database.ready_lock:
+        if database.ready:
+            return False
+        with _init_file_lock():
+            conn = get_db_connection()
+            try:
+                current = conn.execute('PRAGMA user_version').fetchone()[0]
+                changed = current != schema_version()
+                if changed:
+                    execute_schema(conn)
+                    migrate_db(conn)
+            finally:
+                conn.close()
+        database.ready = True
+        return changed
+
+def insert_entry(conn, user_id, account_id, category_id, entry_type, amount, note, when_utc, created_at_utc=None,
+                 transfer_group=None):
+    """Insert a lançamento, filling the derived local_day column"""
+    created_at_utc = created_at_utc or datetime.now(timezone.utc).isoformat()
+    return conn.execute('''
+        INSERT INTO entries (user_id, account_id, category_id, type, amount, note, when_utc, local_day, created_at_utc,
+                             transfer_group)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, account_id, category_id, entry_type, amount, note, when_utc,
+          local_day_from_utc(when_utc), created_at_utc, transfer_group))
+
+def insert_entries(conn, rows):
+    """Insert many lançamentos with one executemany
+
+    rows: (user_id, account_id, category_id, type, amount, note, when_utc, created_at_utc)
+    """
+    conn.executemany('''
+        INSERT INTO entries (user_id, account_id, category_id, type, amount, note, when_utc, local_day, created_at_utc)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(*row[:7], local_day_from_utc(row[6]), row[7]) for row in rows])
+
 def seed_categories(conn, user_id):
     """Create default categories for a user"""
     default_categories = [
@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from contextvars import ContextVar
+from flask import g, request
+from helpers import on_connect
+
+# SQL instrumentation configuration
+INSTRUMENTATION_ENABLED = os.environ.get("INSTRUMENTATION_ENABLED", "true").lower() == "true"
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+# Request duration histogram buckets (seconds)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+slow_query_logger = logging.getLogger('slow_query')
+
+# Statements of the request being served by the current thread/context
+_current = ContextVar('sql_request_stats', default=None)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+def normalize_sql(sql):
+    """Statement shape: literals become ?, IN lists collapse, whitespace is squeezed"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(?...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+class RequestStats:
+    """Statements recorded during one request"""
+
+    def __init__(self):
+        self.queries = []
+
+    def record(self, sql, duration, rows):
+        query = {'sql': sql, 'duration_ms': duration * 1000, 'rows': rows}
+        self.queries.append(query)
+        return query
+
+    @property
+    def db_ms(self):
+        return sum(query['duration_ms'] for query in self.queries)
+
+class InstrumentedCursor:
+    """Cursor proxy that adds fetch time and fetched rows to its statement record"""
+
+    def __init__(self, cursor, query):
+        self._cursor = cursor
+        self._query = query
+
+    def _fetched(self, start, rows):
+        self._query['duration_ms'] += (time.perf_counter() - start) * 1000
+        self._query['rows'] = max(self._query['rows'], 0) + rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(start, 1 if row is not None else 0)
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchmany(self, *args):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(*args)
+        self._fetched(start, len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._query['rows'] = max(self._query['rows'], 0) + 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class InstrumentedConnection:
+    """Connection proxy timing every statement into the current request's stats"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def _run(self, method, sql, *args):
+        stats = _current.get()
+        start = time.perf_counter()
+        cursor = getattr(self._conn, method)(sql, *args)
+        if stats is None:
+            return cursor
+        rowcount = getattr(cursor, 'rowcount', -1)
+        query = stats.record(normalize_sql(sql), time.perf_counter() - start, rowcount if rowcount is not None else -1)
+        return InstrumentedCursor(cursor, query)
+
+    def execute(self, sql, *args):
+        return self._run('execute', sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._run('executemany', sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class RouteMetrics:
+    """Per-route request/SQL aggregates, rendered in Prometheus text format"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, duration, stats, slow_queries):
+        with self._lock:
+            metrics = self._routes.setdefault(route, {
+                'requests': 0,
+                'duration_sum': 0.0,
+                'buckets': [0] * len(self.buckets),
+                'queries': 0,
+                'db_seconds': 0.0,
+                'rows': 0,
+                'slow_queries': 0,
+            })
+            metrics['requests'] += 1
+            metrics['duration_sum'] += duration
+            for index, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    metrics['buckets'][index] += 1
+            metrics['queries'] += len(stats.queries)
+            metrics['db_seconds'] += stats.db_ms / 1000
+            metrics['rows'] += sum(max(query['rows'], 0) for query in stats.queries)
+            metrics['slow_queries'] += slow_queries
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        with self._lock:
+            routes = {route: dict(metrics, buckets=list(metrics['buckets'])) for route, metrics in self._routes.items()}
+
+        lines = []
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        family('app_requests_total', 'counter', 'HTTP requests handled, per route')
+        for route, metrics in sorted(routes.items()):
+            lines.append(f'app_requests_total{{route="{route}"}} {metrics["requests"]}')
+
+        family('app_request_duration_seconds', 'histogram', 'Request duration, per route')
+        for route, metrics in sorted(routes.items()):
+            for bound, count in zip(self.buckets, metrics['buckets']):
+                lines.append(f'app_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {count}')
+            lines.append(f'app_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {metrics["requests"]}')
+            lines.append(f'app_request_duration_seconds_sum{{route="{route}"}} {metrics["duration_sum"]:.6f}')
+            lines.append(f'app_request_duration_seconds_count{{route="{route}"}} {metrics["requests"]}')
+
+        for name, key, help_text in (
+            ('app_db_queries_total', 'queries', 'SQL statements executed, per route'),
+            ('app_db_duration_seconds_total', 'db_seconds', 'Time spent in SQL statements, per route'),
+            ('app_db_rows_total', 'rows', 'Rows fetched or changed by SQL statements, per route'),
+            ('app_db_slow_queries_total', 'slow_queries', f'Statements slower than {SLOW_QUERY_MS:g} ms, per route'),
+        ):
+            family(name, 'counter', help_text)
+            for route, metrics in sorted(routes.items()):
+                value = metrics[key]
+                lines.append(f'{name}{{route="{route}"}} {value:.6f}' if isinstance(value, float)
+                             else f'{name}{{route="{route}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+route_metrics = RouteMetrics()
+
+def _wrap_connection(conn):
+    return InstrumentedConnection(conn)
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.sql_stats = RequestStats()
+    g.sql_stats_token = _current.set(g.sql_stats)
+
+def _after_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    duration = time.perf_counter() - g.pop('request_started')
+    route = request.endpoint or 'unmatched'
+
+    slow = [query for query in stats.queries if query['duration_ms'] >= SLOW_QUERY_MS]
+    for query in slow:
+        slow_query_logger.warning(json.dumps({
+            'event': 'slow_query',
+            'route': route,
+            'method': request.method,
+            'sql': query['sql'],
+            'duration_ms': round(query['duration_ms'], 2),
+            'rows': query['rows'],
+        }, ensure_ascii=False))
+
+    route_metrics.observe(route, duration, stats, len(slow))
+    response.headers.add('Server-Timing', f'db;dur={stats.db_ms:.2f};desc="{len(stats.queries)} queries"')
+    response.headers.add('Server-Timing', f'app;dur={duration * 1000:.2f}')
+    return response
+
+def _teardown_request(exc=None):
+    # Also runs when the view raised, so statements never leak into the next request
+    token = g.pop('sql_stats_token', None)
+    if token is not None:
+        _current.reset(token)
+
+def instrument_app(app):
+    """Record SQL statements per request: Server-Timing header, slow-query log, route metrics"""
+    if not INSTRUMENTATION_ENABLED:
+        return
+    on_connect(_wrap_connection)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
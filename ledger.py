@@ -0,0 +1,86 @@
+import math
+from helpers import local_day_from_utc
+
+# Fields a lançamento edit may change; transfer legs only take amount, when and note
+ENTRY_FIELDS = ('type', 'amount', 'account_id', 'category_id', 'note', 'when_utc')
+TRANSFER_FIELDS = ('amount', 'note', 'when_utc')
+
+def load_entry(conn, user_id, entry_id):
+    """The user's lançamento (hot table only: archived ones are read-only), or None"""
+    return conn.execute('SELECT * FROM entries WHERE id = ? AND user_id = ?', (entry_id, user_id)).fetchone()
+
+def _check_account(conn, user_id, account_id):
+    if conn.execute('SELECT 1 FROM accounts WHERE id = ? AND user_id = ?', (account_id, user_id)).fetchone() is None:
+        raise ValueError("Conta inválida")
+
+def category_matches(conn, user_id, category_id, entry_type):
+    """Whether category_id is one of the user's categories of entry_type (the budget counters key off it)"""
+    return conn.execute('SELECT 1 FROM categories WHERE id = ? AND user_id = ? AND type = ?',
+                        (category_id, user_id, entry_type)).fetchone() is not None
+
+def _check_category(conn, user_id, category_id, entry_type):
+    if not category_matches(conn, user_id, category_id, entry_type):
+        raise ValueError("Categoria inválida")
+
+def update_entry(conn, user_id, entry_id, changes):
+    """Apply `changes` ({field: value}) to a lançamento and return the old row, without committing
+
+    Derived data follows in the same transaction: the checkpoint triggers
+    add the old/new difference to the monthly closings and the search
+    triggers reindex the note. Editing a transfer leg edits both legs
+    (same amount and date, opposite signs); only its note is per leg.
+    """
+    entry = load_entry(conn, user_id, entry_id)
+    if entry is None:
+        raise LookupError("Lançamento não encontrado")
+    allowed = TRANSFER_FIELDS if entry['type'] == 'transferencia' else ENTRY_FIELDS
+    unknown = set(changes) - set(allowed)
+    if unknown:
+        if entry['type'] == 'transferencia':
+            raise ValueError("Em transferências só é possível alterar valor, data e descrição")
+        raise ValueError(f"Campo inválido: {sorted(unknown)[0]}")
+
+    if 'amount' in changes and not (math.isfinite(changes['amount']) and changes['amount'] > 0):
+        raise ValueError("Valor deve ser maior que zero")
+    if 'type' in changes and changes['type'] not in ('receita', 'despesa'):
+        raise ValueError("Tipo inválido")
+    if 'account_id' in changes:
+        _check_account(conn, user_id, changes['account_id'])
+    category_id = changes.get('category_id', entry['category_id'])
+    if category_id is not None and ('category_id' in changes or 'type' in changes):
+        _check_category(conn, user_id, category_id, changes.get('type', entry['type']))
+
+    if entry['type'] == 'transferencia':
+        if 'note' in changes:
+            conn.execute('UPDATE entries SET note = ? WHERE id = ?', (changes['note'], entry_id))
+        assignments, params = [], []
+        if 'amount' in changes:
+            # Each leg keeps its sign: the source negative, the destination positive
+            assignments.append('amount = CASE WHEN amount < 0 THEN -? ELSE ? END')
+            params += [changes['amount'], changes['amount']]
+        if 'when_utc' in changes:
+            assignments.append('when_utc = ?, local_day = ?')
+            params += [changes['when_utc'], local_day_from_utc(changes['when_utc'])]
+        if assignments:
+            conn.execute(f"UPDATE entries SET {', '.join(assignments)} WHERE user_id = ? AND transfer_group = ?",
+                         (*params, user_id, entry['transfer_group']))
+        return entry
+
+    values = dict(changes)
+    if 'when_utc' in values:
+        values['local_day'] = local_day_from_utc(values['when_utc'])
+    if values:
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        conn.execute(f'UPDATE entries SET {assignments} WHERE id = ? AND user_id = ?',
+                     (*values.values(), entry_id, user_id))
+    return entry
+
+def delete_entry(conn, user_id, entry_id):
+    """Delete a lançamento (both legs for a transfer) without committing; returns the rows deleted"""
+    entry = load_entry(conn, user_id, entry_id)
+    if entry is None:
+        raise LookupError("Lançamento não encontrado")
+    if entry['transfer_group']:
+        return conn.execute('DELETE FROM entries WHERE user_id = ? AND transfer_group = ?',
+                            (user_id, entry['transfer_group'])).rowcount
+    return conn.execute('DELETE FROM entries WHERE id = ? AND user_id = ?', (entry_id, user_id)).rowcount
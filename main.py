@@ -3,20 +3,15 @@
 Main entry point for the Brazilian Financial SaaS application.
 """
 
-import os
 from app import app
-from helpers import init_db
+from helpers import ensure_db
 
 if __name__ == '__main__':
-    # Initialize database if it doesn't exist
-    if not os.path.exists('./database.db'):
-        print("Database not found. Initializing...")
-        init_db()
-        print("Database initialized successfully!")
+    # Create or migrate the database schema if needed
+    app.extensions['database'].activate()
+    ensure_db()
     
     # Run in debug mode for development
     app.run(host='0.0.0.0', port=5000, debug=True)
-else:
-    # Production mode - initialize database if needed
-    if not os.path.exists('./database.db'):
-        init_db()
\ No newline at end of file
+# Production (gunicorn main:app): importing does no database work; the schema is
+# ensured once in the gunicorn master (gunicorn.conf.py) or on each worker's first request
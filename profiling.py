@@ -0,0 +1,168 @@
+import os
+import re
+import sys
+import gzip
+import time
+import random
+import marshal
+import cProfile
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from flask import g, request
+
+# Profiling configuration (nothing is hooked into the app unless PROFILE_ENABLED=true)
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED", "false").lower() == "true"
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "cprofile").lower()   # cprofile | sampling
+PROFILE_ROUTES = {route.strip() for route in os.environ.get("PROFILE_ROUTES", "").split(',') if route.strip()}
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+# Requests carrying "X-Profile: <PROFILE_TOKEN>" are always profiled
+PROFILE_HEADER = 'X-Profile'
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+# One cProfile at a time per process: from Python 3.12 a second enable() raises while
+# another thread's request is profiled (gunicorn threads), so that request runs unprofiled
+_cprofile_lock = threading.Lock()
+
+PROFILE_NAME_RE = re.compile(r'^(\d{8}T\d{6}\d{6})-([A-Za-z0-9_.]+)-(cprofile|sampling)\.(pstats|collapsed)\.gz$')
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval into collapsed-stack counts
+
+    The output ("root;caller;leaf count" per line) is what flamegraph tools read.
+    """
+
+    def __init__(self, thread_id, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+def should_profile(endpoint, header_value=None):
+    if PROFILE_TOKEN and header_value == PROFILE_TOKEN:
+        return True
+    if endpoint in PROFILE_ROUTES:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def save_profile(endpoint, mode, payload, directory=None, max_files=None):
+    """Write a gzip'd profile and trim the directory to the newest max_files"""
+    directory = directory or PROFILE_DIR
+    max_files = max_files or PROFILE_MAX_FILES
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    endpoint = re.sub(r'[^A-Za-z0-9_.]', '_', endpoint or 'unmatched')
+    extension = 'pstats' if mode == 'cprofile' else 'collapsed'
+    name = f"{stamp}-{endpoint}-{mode}.{extension}.gz"
+    with gzip.open(os.path.join(directory, name), 'wb') as f:
+        f.write(payload)
+
+    # Ring buffer: names start with the timestamp, so sorting is chronological
+    names = sorted(entry for entry in os.listdir(directory) if PROFILE_NAME_RE.match(entry))
+    for old in names[:-max_files]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except OSError:
+            pass
+    return name
+
+def list_profiles(directory=None):
+    """Stored profiles, newest first"""
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        match = PROFILE_NAME_RE.match(name)
+        if not match:
+            continue
+        created = datetime.strptime(match.group(1), '%Y%m%dT%H%M%S%f').replace(tzinfo=timezone.utc)
+        profiles.append({
+            'name': name,
+            'route': match.group(2),
+            'mode': match.group(3),
+            'format': match.group(4),
+            'size_bytes': os.path.getsize(os.path.join(directory, name)),
+            'created_at_utc': created.isoformat(),
+        })
+    return profiles
+
+def profile_path(name, directory=None):
+    """Absolute path of a stored profile, or None for unknown/unsafe names"""
+    if not PROFILE_NAME_RE.match(name or ''):
+        return None
+    path = os.path.join(directory or PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+def _before_request():
+    if not should_profile(request.endpoint, request.headers.get(PROFILE_HEADER)):
+        return
+    g.profile_started = time.perf_counter()
+    if PROFILE_MODE == 'sampling':
+        g.profiler = StackSampler(threading.get_ident())
+        g.profiler.start()
+    elif _cprofile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiling tool (debugger, coverage) owns the hook
+            _cprofile_lock.release()
+            logging.info(f"Profiling skipped: {e}")
+            return
+        g.profiler = profiler
+
+def _teardown_request(exc=None):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    try:
+        if isinstance(profiler, StackSampler):
+            profiler.stop()
+            name = save_profile(request.endpoint, 'sampling', profiler.collapsed().encode('utf-8'))
+        else:
+            try:
+                profiler.disable()
+            finally:
+                _cprofile_lock.release()
+            profiler.create_stats()
+            # Same bytes as Profile.dump_stats, readable with pstats after gunzip
+            name = save_profile(request.endpoint, 'cprofile', marshal.dumps(profiler.stats))
+        elapsed_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+        logging.info(f"Profile saved: {name} ({elapsed_ms:.1f} ms)")
+    except Exception as e:
+        logging.error(f"Error saving profile: {e}")
+
+def profile_app(app):
+    """Hook request profiling into the app; a no-op (no hooks at all) when disabled"""
+    if not PROFILE_ENABLED:
+        return False
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+    return True
@@ -0,0 +1,312 @@
+import os
+import heapq
+import smtplib
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from email.message import EmailMessage
+from helpers import brl, br_datetime, LazyConnection
+from budgets import pending_alerts, alert_message
+
+# Due-date reminders. Each worker keeps a min-heap of the reminders about to fire, filled by
+# range scans of bills(status, due_date_utc) over a sliding window and refreshed per user on
+# bill writes, so the bills table is never polled as a whole.
+REMINDERS_ENABLED = os.environ.get("REMINDERS_ENABLED", "true").lower() == "true"
+# Hours before the due date at which to remind (0 = at the due time itself)
+REMINDER_LEAD_HOURS = tuple(sorted({float(h) for h in os.environ.get("REMINDER_LEAD_HOURS", "72,24,0").split(',')
+                                    if h.strip()}, reverse=True))
+# inapp (notifications table), email (SMTP) or both: "inapp,email"
+REMINDER_CHANNELS = tuple(c.strip() for c in os.environ.get("REMINDER_CHANNELS", "inapp").split(',') if c.strip())
+# Bills due up to this many hours past the largest lead time are loaded; the window slides forward
+REMINDER_WINDOW_HOURS = float(os.environ.get("REMINDER_WINDOW_HOURS", "24"))
+# A reminder whose delivery failed is tried again after this long
+REMINDER_RETRY_SECONDS = float(os.environ.get("REMINDER_RETRY_SECONDS", "300"))
+# Queued budget alerts (budget_alerts) go out through the same channels at this interval
+BUDGET_ALERT_POLL_SECONDS = float(os.environ.get("BUDGET_ALERT_POLL_SECONDS", "30"))
+# Local SMTP stand-in by default, e.g. `python -m aiosmtpd -n -l localhost:1025`
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "1025"))
+REMINDER_EMAIL_FROM = os.environ.get("REMINDER_EMAIL_FROM", "lembretes@financeiro.local")
+
+def _utc(iso_string):
+    dt = datetime.fromisoformat(iso_string)
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+def reminder_message(bill):
+    """User-facing text of a due-date reminder"""
+    action = 'pagar' if bill['type'] == 'pagar' else 'receber'
+    return f"Conta a {action}: {bill['description']} ({brl(bill['amount'])}) vence em {br_datetime(bill['due_date_utc'])}"
+
+class Notifier:
+    """Delivers a message to a user on the configured channels"""
+
+    def __init__(self, channels=REMINDER_CHANNELS, smtp_host=SMTP_HOST, smtp_port=SMTP_PORT, sender=REMINDER_EMAIL_FROM):
+        self.channels = channels
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.sender = sender
+
+    def record(self, conn, user_id, kind, subject, message):
+        """In-app row inside the caller's transaction; returns (notification id, email to send after commit)"""
+        notification_id = None
+        if 'inapp' in self.channels:
+            notification_id = conn.execute('''
+                INSERT INTO notifications (user_id, kind, message, created_at_utc) VALUES (?, ?, ?, ?)
+            ''', (user_id, kind, message, datetime.now(timezone.utc).isoformat())).lastrowid
+        email = None
+        if 'email' in self.channels:
+            user = conn.execute('SELECT email FROM users WHERE id = ?', (user_id,)).fetchone()
+            if user:
+                email = (user['email'], subject, message)
+        return notification_id, email
+
+    def send_email(self, to, subject, message):
+        email = EmailMessage()
+        email['Subject'] = subject
+        email['From'] = self.sender
+        email['To'] = to
+        email.set_content(message)
+        with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=10) as smtp:
+            smtp.send_message(email)
+
+class ReminderScheduler:
+    """Min-heap of upcoming bill reminders, fired by one background thread per worker
+
+    Heap items are (fire_at, bill_id, lead_hours, due_date_utc, user_id, version).
+    A bill write only marks its user dirty: the thread rescans that user's pending
+    bills in the window under a new version, and older items of the user are
+    dropped as they surface. Every worker holds the bills it loaded or saw written;
+    the bill_reminders primary key makes sure only one of them sends each reminder.
+    """
+
+    def __init__(self, lead_hours=REMINDER_LEAD_HOURS, window_hours=REMINDER_WINDOW_HOURS,
+                 notifier=None, enabled=REMINDERS_ENABLED, clock=None):
+        self.lead_hours = lead_hours
+        self.max_lead = timedelta(hours=max(lead_hours, default=0))
+        self.window = self.max_lead + timedelta(hours=window_hours)
+        self.notifier = notifier or Notifier()
+        self.enabled = enabled
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+        self.reset()
+
+    def reset(self):
+        """Empty heap, thread state and counters (a forked worker inherits the parent's)"""
+        self._heap = []
+        self._versions = {}
+        self._dirty = set()
+        self._loaded_until = None
+        self._next_alert_poll = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = threading.Event()
+        self.scans = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def notify_bill_write(self, user_id):
+        """Call after a committed write to the user's bills; the rescan happens off the request"""
+        if not self.enabled:
+            return
+        with self._cond:
+            self._dirty.add(user_id)
+            self._cond.notify()
+
+    def _push_bill(self, bill, now):
+        """Queue the bill's reminders still ahead; of those already missed, only the latest, right away"""
+        due = _utc(bill['due_date_utc'])
+        version = self._versions.get(bill['user_id'], 0)
+        missed = None
+        for lead in self.lead_hours:
+            fire_at = due - timedelta(hours=lead)
+            if fire_at > now:
+                heapq.heappush(self._heap, (fire_at, bill['id'], lead, bill['due_date_utc'], bill['user_id'], version))
+            else:
+                missed = lead
+        if missed is not None:
+            heapq.heappush(self._heap, (now, bill['id'], missed, bill['due_date_utc'], bill['user_id'], version))
+
+    def _scan(self, conn, start, end, user_id=None):
+        """Range scan of pending bills due in [start, end) (one user's, on a rescan)"""
+        sql = '''
+            SELECT id, user_id, due_date_utc FROM bills
+            WHERE status = 'pendente' AND due_date_utc >= ? AND due_date_utc < ?
+        '''
+        params = [start.isoformat(), end.isoformat()]
+        if user_id is not None:
+            sql += ' AND user_id = ?'
+            params.append(user_id)
+        self.scans += 1
+        return conn.execute(sql + ' ORDER BY due_date_utc', params).fetchall()
+
+    def _send_claimed(self, conn, user_id, kind, subject, message, unclaim):
+        """Record the in-app row with the claim and commit; the email goes out after, outside any transaction
+
+        A failed email undoes the claim (and the in-app row), so the next attempt sends both.
+        """
+        notification_id, email = self.notifier.record(conn, user_id, kind, subject, message)
+        conn.commit()
+        if email is None:
+            return
+        try:
+            self.notifier.send_email(*email)
+        except Exception:
+            conn.execute(*unclaim)
+            if notification_id is not None:
+                conn.execute('DELETE FROM notifications WHERE id = ?', (notification_id,))
+            conn.commit()
+            raise
+
+    def _fire(self, conn, item, now):
+        """Send one reminder if its bill is still pending with that due date and no worker sent it yet"""
+        fire_at, bill_id, lead, due_date_utc, user_id, version = item
+        try:
+            bill = conn.execute('''
+                SELECT id, user_id, type, amount, description, due_date_utc FROM bills
+                WHERE id = ? AND status = 'pendente' AND due_date_utc = ?
+            ''', (bill_id, due_date_utc)).fetchone()
+            claimed = bill is not None and conn.execute('''
+                INSERT OR IGNORE INTO bill_reminders (bill_id, due_date_utc, lead_hours, sent_at_utc) VALUES (?, ?, ?, ?)
+            ''', (bill_id, due_date_utc, lead, now.isoformat())).rowcount == 1
+            if claimed:
+                unclaim = ('DELETE FROM bill_reminders WHERE bill_id = ? AND due_date_utc = ? AND lead_hours = ?',
+                           (bill_id, due_date_utc, lead))
+                self._send_claimed(conn, user_id, 'vencimento', 'Lembrete de vencimento', reminder_message(bill), unclaim)
+            else:
+                conn.commit()
+        except Exception as e:
+            logging.error(f"Error sending reminder for bill {bill_id}: {e}")
+            conn.rollback()
+            self.failed += 1
+            with self._cond:
+                heapq.heappush(self._heap, (now + timedelta(seconds=REMINDER_RETRY_SECONDS),) + item[1:])
+            return
+        if claimed:
+            self.sent += 1
+        else:
+            self.skipped += 1
+
+    def deliver_budget_alerts(self, conn):
+        """Send the queued budget alerts; the conditional update keeps other workers from sending them too"""
+        for alert in pending_alerts(conn):
+            try:
+                if conn.execute('UPDATE budget_alerts SET notified_at_utc = ? WHERE id = ? AND notified_at_utc IS NULL',
+                                (datetime.now(timezone.utc).isoformat(), alert['id'])).rowcount:
+                    unclaim = ('UPDATE budget_alerts SET notified_at_utc = NULL WHERE id = ?', (alert['id'],))
+                    self._send_claimed(conn, alert['user_id'], 'orcamento', 'Alerta de orçamento',
+                                       alert_message(alert), unclaim)
+                else:
+                    conn.commit()
+            except Exception as e:
+                logging.error(f"Error sending budget alert {alert['id']}: {e}")
+                conn.rollback()
+                # Left queued, it is retried on the next poll
+                self.failed += 1
+                return
+
+    def tick(self, now=None):
+        """One pass: slide the window, rescan dirty users, fire what is due; returns seconds until the next pass"""
+        now = now or self.clock()
+        conn = LazyConnection()
+        try:
+            with self._cond:
+                dirty, self._dirty = self._dirty, set()
+                loaded_until = self._loaded_until
+            # Scans run outside the lock: bill writes calling notify_bill_write never wait on them
+            bills = []
+            if loaded_until is None:
+                bills = self._scan(conn, now, now + self.window)
+                loaded_until = now + self.window
+            elif loaded_until - now <= self.max_lead:
+                # Keep every bill whose earliest reminder could fire before the next slide in the heap
+                bills = self._scan(conn, loaded_until, now + self.window)
+                loaded_until = now + self.window
+            # A dirty user's bills all come from the rescan (the whole window, under a new version)
+            bills = [bill for bill in bills if bill['user_id'] not in dirty]
+            for user_id in dirty:
+                bills += self._scan(conn, now, loaded_until, user_id)
+            with self._cond:
+                self._loaded_until = loaded_until
+                for user_id in dirty:
+                    self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                for bill in bills:
+                    self._push_bill(bill, now)
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    item = heapq.heappop(self._heap)
+                    if item[5] == self._versions.get(item[4], 0):
+                        due.append(item)
+            for item in due:
+                self._fire(conn, item, now)
+
+            if self._next_alert_poll is None or now >= self._next_alert_poll:
+                self.deliver_budget_alerts(conn)
+                self._next_alert_poll = now + timedelta(seconds=BUDGET_ALERT_POLL_SECONDS)
+        finally:
+            conn.close()
+
+        with self._cond:
+            wake = [self._loaded_until - self.max_lead, self._next_alert_poll]
+            if self._heap:
+                wake.append(self._heap[0][0])
+        return max(0.0, (min(wake) - now).total_seconds())
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                wait = self.tick()
+            except Exception as e:
+                logging.error(f"Error in reminder scheduler: {e}")
+                wait = REMINDER_RETRY_SECONDS
+            with self._cond:
+                if not self._dirty and not self._stopping.is_set():
+                    # Capped so a clock change cannot put the thread to sleep for days
+                    self._cond.wait(timeout=min(wait, 300))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'queued': len(self._heap),
+                'loaded_until': self._loaded_until.isoformat() if self._loaded_until else None,
+                'scans': self.scans,
+                'sent': self.sent,
+                'skipped': self.skipped,
+                'failed': self.failed,
+            }
+
+    def start(self):
+        self.reset()
+        if not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+reminder_scheduler = ReminderScheduler()
+
+def unread_notifications(conn, user_id, limit=20):
+    """The user's unread notifications, newest first"""
+    return [dict(row) for row in conn.execute('''
+        SELECT id, kind, message, created_at_utc FROM notifications
+        WHERE user_id = ? AND read_at_utc IS NULL
+        ORDER BY id DESC LIMIT ?
+    ''', (user_id, limit)).fetchall()]
+
+def mark_notifications_read(conn, user_id, notification_ids=None):
+    """Mark the given (or all) unread notifications read, without committing; returns how many"""
+    sql = 'UPDATE notifications SET read_at_utc = ? WHERE user_id = ? AND read_at_utc IS NULL'
+    params = [datetime.now(timezone.utc).isoformat(), user_id]
+    if notification_ids is not None:
+        if not notification_ids:
+            return 0
+        sql += f" AND id IN ({','.join('?' * len(notification_ids))})"
+        params += list(notification_ids)
+    return conn.execute(sql, params).rowcount
@@ -0,0 +1,183 @@
+from array import array
+from collections import defaultdict
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+from archive import entries_source
+
+BR_TZ = ZoneInfo('America/Sao_Paulo')
+
+GRANULARITIES = ('dia', 'semana', 'mes')
+
+# Entry type codes used in the type column
+RECEITA = 1
+DESPESA = 2
+TRANSFERENCIA = 0
+TYPE_CODES = {'receita': RECEITA, 'despesa': DESPESA, 'transferencia': TRANSFERENCIA}
+
+MONTH_NAMES = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+class EntryColumns:
+    """Entries of a period stored column-wise as compact typed arrays
+
+    Rows may be per-entry or pre-aggregated per (local day, type, category);
+    every aggregation below only sums amounts, so both give the same result.
+    """
+
+    def __init__(self):
+        self.entries = 0             # number of underlying entries
+        self.day = array('l')        # local (São Paulo) day as date ordinal
+        self.month = array('l')      # year * 12 + month - 1
+        self.type = array('b')       # TYPE_CODES
+        self.category = array('l')   # category id, -1 when uncategorized
+        self.amount = array('d')
+
+    def __len__(self):
+        return len(self.amount)
+
+    def append(self, local_day, entry_type, category_id, amount, count=1):
+        self.entries += count
+        self.day.append(local_day.toordinal())
+        self.month.append(local_day.year * 12 + local_day.month - 1)
+        self.type.append(TYPE_CODES.get(entry_type, TRANSFERENCIA))
+        self.category.append(category_id if category_id is not None else -1)
+        self.amount.append(amount)
+
+def parse_report_date(value):
+    """Parse a report boundary: YYYY-MM-DD (date input) or DD/MM/YYYY"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError("Formato de data inválido")
+
+def load_entry_columns(conn, user_id, start_day, end_day):
+    """Pull per-day (type, category, amount) sums of [start_day, end_day] into arrays
+
+    Grouping by the precomputed entries.local_day runs on the
+    (user_id, local_day) index, so days follow São Paulo time.
+    """
+    columns = EntryColumns()
+    cursor = conn.execute(f'''
+        SELECT local_day, type, category_id, SUM(amount) as total, COUNT(*) as entries
+        FROM {entries_source(conn, start_day, end_day)}
+        WHERE user_id = ? AND local_day BETWEEN ? AND ?
+        GROUP BY local_day, type, category_id
+    ''', (user_id, start_day.isoformat(), end_day.isoformat()))
+    for row in cursor.fetchall():
+        columns.append(date.fromisoformat(row[0]), row[1], row[2], row[3], row[4])
+    return columns
+
+def _month_key(day):
+    return day.year * 12 + day.month - 1
+
+def _month_label(key):
+    return f"{MONTH_NAMES[key % 12]}/{key // 12}"
+
+def _bucket_keys(columns, granularity):
+    if granularity == 'mes':
+        return columns.month
+    if granularity == 'semana':
+        # Monday-based weeks: date.fromordinal(1) is a Monday
+        return array('l', (day - (day - 1) % 7 for day in columns.day))
+    return columns.day
+
+def _bucket_label(key, granularity):
+    if granularity == 'mes':
+        return _month_label(key)
+    if granularity == 'semana':
+        return f"Semana de {date.fromordinal(key).strftime('%d/%m/%Y')}"
+    return date.fromordinal(key).strftime('%d/%m/%Y')
+
+def group_sums(keys, columns):
+    """Group-by over the key column: returns {key: [receitas, despesas]}"""
+    totals = defaultdict(lambda: [0.0, 0.0])
+    for key, entry_type, amount in zip(keys, columns.type, columns.amount):
+        if entry_type == RECEITA:
+            totals[key][0] += amount
+        elif entry_type == DESPESA:
+            totals[key][1] += amount
+    return totals
+
+def flow_buckets(columns, granularity):
+    """Receitas/despesas per day, week or month (non-empty buckets, in order)"""
+    totals = group_sums(_bucket_keys(columns, granularity), columns)
+    return [
+        {
+            'day': _bucket_label(key, granularity),
+            'receitas': receitas,
+            'despesas': despesas,
+            'saldo': receitas - despesas,
+        }
+        for key, (receitas, despesas) in sorted(totals.items())
+    ]
+
+def category_shares(columns, category_names, limit=None):
+    """Totals per (type, category) with their share of the type total"""
+    totals = group_sums(columns.category, columns)
+    type_totals = {'receita': 0.0, 'despesa': 0.0}
+    rows = []
+    for category_id, (receitas, despesas) in totals.items():
+        type_totals['receita'] += receitas
+        type_totals['despesa'] += despesas
+        name = category_names.get(category_id, 'Sem categoria')
+        if receitas:
+            rows.append({'category_name': name, 'type': 'receita', 'total': receitas})
+        if despesas:
+            rows.append({'category_name': name, 'type': 'despesa', 'total': despesas})
+    for row in rows:
+        row['share'] = round(row['total'] / type_totals[row['type']] * 100, 1) if type_totals[row['type']] else 0.0
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows[:limit] if limit else rows
+
+def month_over_month(columns, start_day, end_day):
+    """Monthly totals (every month in range) with deltas against the previous month"""
+    totals = group_sums(columns.month, columns)
+    months = []
+    previous = None
+    for key in range(_month_key(start_day), _month_key(end_day) + 1):
+        receitas, despesas = totals.get(key, (0.0, 0.0))
+        row = {
+            'month': _month_label(key),
+            'receitas': receitas,
+            'despesas': despesas,
+            'resultado': receitas - despesas,
+            'delta_receitas': None,
+            'delta_despesas': None,
+            'delta_despesas_pct': None,
+        }
+        if previous is not None:
+            row['delta_receitas'] = receitas - previous['receitas']
+            row['delta_despesas'] = despesas - previous['despesas']
+            if previous['despesas']:
+                row['delta_despesas_pct'] = round((despesas - previous['despesas']) / previous['despesas'] * 100, 1)
+        months.append(row)
+        previous = row
+    return months
+
+def build_report(columns, start_day, end_day, granularity, category_names):
+    """Aggregate a loaded period into everything the Relatórios page shows"""
+    receitas = despesas = 0.0
+    for entry_type, amount in zip(columns.type, columns.amount):
+        if entry_type == RECEITA:
+            receitas += amount
+        elif entry_type == DESPESA:
+            despesas += amount
+
+    return {
+        'entries_count': columns.entries,
+        'total_receitas': receitas,
+        'total_despesas': despesas,
+        'resultado': receitas - despesas,
+        'flow': flow_buckets(columns, granularity),
+        'top_categories': category_shares(columns, category_names, limit=10),
+        'monthly': month_over_month(columns, start_day, end_day),
+    }
+
+def default_period(today=None):
+    """Current month (1st to today, São Paulo time)"""
+    today = today or datetime.now(BR_TZ).date()
+    return today.replace(day=1), today
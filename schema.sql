@@ -28,6 +28,7 @@ CREATE TABLE IF NOT EXISTS accounts (
   user_id INTEGER NOT NULL,
   name TEXT NOT NULL,
   initial_balance REAL NOT NULL DEFAULT 0,
+  archived_total REAL NOT NULL DEFAULT 0,
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -40,6 +41,8 @@ CREATE TABLE IF NOT EXISTS entries (
   amount REAL NOT NULL,
   note TEXT,
   when_utc TEXT NOT NULL,
+  local_day TEXT,
+  transfer_group TEXT,
   created_at_utc TEXT NOT NULL,
   FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
   FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE,
@@ -67,6 +70,224 @@ CREATE TABLE IF NOT EXISTS bills (
   FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
 );
 
+-- Histórico do assistente (append-only, com limite por usuário)
+CREATE TABLE IF NOT EXISTS chat_messages (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  intent TEXT NOT NULL,
+  message TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  latency_ms REAL NOT NULL,
+  created_at_utc TEXT NOT NULL,
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE VIEW IF NOT EXISTS chat_intent_stats AS
+  SELECT intent,
+         COUNT(*) as total,
+         AVG(latency_ms) as avg_latency_ms,
+         MAX(latency_ms) as max_latency_ms
+  FROM chat_messages
+  GROUP BY intent;
+
+-- Saldos de fechamento mensais por conta (soma dos lancamentos ate o fim do mes, sem o saldo inicial);
+-- um lancamento incluido, alterado ou excluido soma a diferenca nos fechamentos do seu mes em diante.
+-- Antes do primeiro fechamento da conta faltariam meses: ai os fechamentos sao apagados (refeitos na proxima leitura)
+CREATE TABLE IF NOT EXISTS balance_checkpoints (
+  account_id INTEGER NOT NULL,
+  user_id INTEGER NOT NULL,
+  month TEXT NOT NULL,
+  closing_total REAL NOT NULL,
+  PRIMARY KEY (account_id, month),
+  FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE,
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TRIGGER IF NOT EXISTS balance_checkpoints_delta_insert AFTER INSERT ON entries BEGIN
+  DELETE FROM balance_checkpoints WHERE account_id = new.account_id
+    AND substr(new.local_day, 1, 7) < (SELECT MIN(month) FROM balance_checkpoints WHERE account_id = new.account_id);
+  UPDATE balance_checkpoints
+  SET closing_total = closing_total + CASE new.type WHEN 'despesa' THEN -new.amount ELSE new.amount END
+  WHERE account_id = new.account_id AND month >= substr(new.local_day, 1, 7);
+END;
+
+CREATE TRIGGER IF NOT EXISTS balance_checkpoints_delta_delete AFTER DELETE ON entries BEGIN
+  UPDATE balance_checkpoints
+  SET closing_total = closing_total - CASE old.type WHEN 'despesa' THEN -old.amount ELSE old.amount END
+  WHERE account_id = old.account_id AND month >= substr(old.local_day, 1, 7);
+END;
+
+CREATE TRIGGER IF NOT EXISTS balance_checkpoints_delta_update AFTER UPDATE OF account_id, type, amount, local_day ON entries BEGIN
+  UPDATE balance_checkpoints
+  SET closing_total = closing_total - CASE old.type WHEN 'despesa' THEN -old.amount ELSE old.amount END
+  WHERE account_id = old.account_id AND month >= substr(old.local_day, 1, 7);
+  DELETE FROM balance_checkpoints WHERE account_id = new.account_id
+    AND substr(new.local_day, 1, 7) < (SELECT MIN(month) FROM balance_checkpoints WHERE account_id = new.account_id);
+  UPDATE balance_checkpoints
+  SET closing_total = closing_total + CASE new.type WHEN 'despesa' THEN -new.amount ELSE new.amount END
+  WHERE account_id = new.account_id AND month >= substr(new.local_day, 1, 7);
+END;
+
+-- Orcamentos mensais por categoria de despesa. budget_spending guarda o gasto de cada categoria/mes
+-- (mantido pelos triggers a cada lancamento); budget_alerts e a fila de avisos de 80% e 100% do limite
+CREATE TABLE IF NOT EXISTS budgets (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  category_id INTEGER NOT NULL UNIQUE,
+  monthly_limit REAL NOT NULL CHECK(monthly_limit > 0),
+  created_at_utc TEXT NOT NULL,
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+  FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS budget_spending (
+  user_id INTEGER NOT NULL,
+  category_id INTEGER NOT NULL,
+  month TEXT NOT NULL,
+  spent REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (category_id, month),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+  FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS budget_alerts (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  category_id INTEGER NOT NULL,
+  month TEXT NOT NULL,
+  threshold INTEGER NOT NULL,
+  spent REAL NOT NULL,
+  monthly_limit REAL NOT NULL,
+  created_at_utc TEXT NOT NULL,
+  notified_at_utc TEXT,
+  UNIQUE (category_id, month, threshold),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+  FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE CASCADE
+);
+
+CREATE TRIGGER IF NOT EXISTS budget_spending_insert AFTER INSERT ON entries
+WHEN new.type = 'despesa' AND new.category_id IS NOT NULL BEGIN
+  INSERT INTO budget_spending (user_id, category_id, month, spent)
+  VALUES (new.user_id, new.category_id, substr(new.local_day, 1, 7), new.amount)
+  ON CONFLICT(category_id, month) DO UPDATE SET spent = spent + excluded.spent;
+  INSERT OR IGNORE INTO budget_alerts (user_id, category_id, month, threshold, spent, monthly_limit, created_at_utc)
+  SELECT b.user_id, b.category_id, s.month, t.threshold, s.spent, b.monthly_limit, strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now')
+  FROM budgets b
+  JOIN budget_spending s ON s.category_id = b.category_id AND s.user_id = b.user_id
+    AND s.month = substr(new.local_day, 1, 7)
+  JOIN (SELECT 80 AS threshold UNION ALL SELECT 100) t
+  WHERE b.category_id = new.category_id
+    AND s.spent >= b.monthly_limit * t.threshold / 100.0
+    AND s.spent - new.amount < b.monthly_limit * t.threshold / 100.0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS budget_spending_delete AFTER DELETE ON entries
+WHEN old.type = 'despesa' AND old.category_id IS NOT NULL BEGIN
+  UPDATE budget_spending SET spent = spent - old.amount
+  WHERE category_id = old.category_id AND month = substr(old.local_day, 1, 7);
+END;
+
+CREATE TRIGGER IF NOT EXISTS budget_spending_update AFTER UPDATE OF type, amount, category_id, local_day ON entries BEGIN
+  UPDATE budget_spending SET spent = spent - old.amount
+  WHERE old.type = 'despesa' AND category_id = old.category_id AND month = substr(old.local_day, 1, 7);
+  INSERT INTO budget_spending (user_id, category_id, month, spent)
+  SELECT new.user_id, new.category_id, substr(new.local_day, 1, 7), new.amount
+  WHERE new.type = 'despesa' AND new.category_id IS NOT NULL
+  ON CONFLICT(category_id, month) DO UPDATE SET spent = spent + excluded.spent;
+  INSERT OR IGNORE INTO budget_alerts (user_id, category_id, month, threshold, spent, monthly_limit, created_at_utc)
+  SELECT b.user_id, b.category_id, s.month, t.threshold, s.spent, b.monthly_limit, strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now')
+  FROM budgets b
+  JOIN budget_spending s ON s.category_id = b.category_id AND s.user_id = b.user_id
+    AND s.month = substr(new.local_day, 1, 7)
+  JOIN (SELECT 80 AS threshold UNION ALL SELECT 100) t
+  WHERE new.type = 'despesa' AND b.category_id = new.category_id
+    AND s.spent >= b.monthly_limit * t.threshold / 100.0
+    -- Spending before the edit: the old amount counted here too if it was in the same category and month
+    AND s.spent - new.amount + CASE WHEN old.type = 'despesa' AND old.category_id = new.category_id
+                                     AND substr(old.local_day, 1, 7) = substr(new.local_day, 1, 7)
+                                    THEN old.amount ELSE 0 END
+        < b.monthly_limit * t.threshold / 100.0;
+END;
+
+-- Avisos ao usuario (lembretes de vencimento e alertas de orcamento). bill_reminders registra cada
+-- lembrete enviado (conta, vencimento, antecedencia): o INSERT OR IGNORE garante um envio so entre workers
+CREATE TABLE IF NOT EXISTS notifications (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  kind TEXT NOT NULL,
+  message TEXT NOT NULL,
+  created_at_utc TEXT NOT NULL,
+  read_at_utc TEXT,
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS bill_reminders (
+  bill_id INTEGER NOT NULL,
+  due_date_utc TEXT NOT NULL,
+  lead_hours REAL NOT NULL,
+  sent_at_utc TEXT NOT NULL,
+  PRIMARY KEY (bill_id, due_date_utc, lead_hours),
+  FOREIGN KEY (bill_id) REFERENCES bills(id) ON DELETE CASCADE
+);
+
+-- Arquivo frio: lancamentos antigos ficam em entries_archive_<ano>; archived_before marca ate onde o ano foi movido
+CREATE TABLE IF NOT EXISTS entry_archives (
+  year INTEGER PRIMARY KEY,
+  table_name TEXT NOT NULL,
+  rows INTEGER NOT NULL DEFAULT 0,
+  archived_before TEXT NOT NULL
+);
+
+-- Busca textual (FTS5 sobre lancamentos e contas; acentos ignorados)
+-- owner guarda o token 'u<user_id>': a busca casa owner e texto no proprio indice, so nas linhas do usuario
+CREATE VIEW IF NOT EXISTS entries_fts_source AS
+  SELECT id, note, 'u' || user_id AS owner FROM entries;
+
+CREATE VIEW IF NOT EXISTS bills_fts_source AS
+  SELECT id, description, 'u' || user_id AS owner FROM bills;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+  note,
+  owner,
+  content='entries_fts_source',
+  content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS bills_fts USING fts5(
+  description,
+  owner,
+  content='bills_fts_source',
+  content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+  INSERT INTO entries_fts(rowid, note, owner) VALUES (new.id, new.note, 'u' || new.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+  INSERT INTO entries_fts(entries_fts, rowid, note, owner) VALUES ('delete', old.id, old.note, 'u' || old.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE OF note ON entries BEGIN
+  INSERT INTO entries_fts(entries_fts, rowid, note, owner) VALUES ('delete', old.id, old.note, 'u' || old.user_id);
+  INSERT INTO entries_fts(rowid, note, owner) VALUES (new.id, new.note, 'u' || new.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS bills_fts_insert AFTER INSERT ON bills BEGIN
+  INSERT INTO bills_fts(rowid, description, owner) VALUES (new.id, new.description, 'u' || new.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS bills_fts_delete AFTER DELETE ON bills BEGIN
+  INSERT INTO bills_fts(bills_fts, rowid, description, owner) VALUES ('delete', old.id, old.description, 'u' || old.user_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS bills_fts_update AFTER UPDATE OF description ON bills BEGIN
+  INSERT INTO bills_fts(bills_fts, rowid, description, owner) VALUES ('delete', old.id, old.description, 'u' || old.user_id);
+  INSERT INTO bills_fts(rowid, description, owner) VALUES (new.id, new.description, 'u' || new.user_id);
+END;
+
 -- Indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_entries_user_id ON entries(user_id);
 CREATE INDEX IF NOT EXISTS idx_entries_when_utc ON entries(when_utc);
@@ -77,3 +298,8 @@ CREATE INDEX IF NOT EXISTS idx_bills_user_id ON bills(user_id);
 CREATE INDEX IF NOT EXISTS idx_bills_due_date ON bills(due_date_utc);
 CREATE INDEX IF NOT EXISTS idx_bills_status ON bills(status);
 CREATE INDEX IF NOT EXISTS idx_bills_type ON bills(type);
+CREATE INDEX IF NOT EXISTS idx_bills_status_due ON bills(status, due_date_utc);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_user_id ON chat_messages(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_budget_spending_user_month ON budget_spending(user_id, month);
+CREATE INDEX IF NOT EXISTS idx_budget_alerts_pending ON budget_alerts(notified_at_utc, id);
+CREATE INDEX IF NOT EXISTS idx_notifications_user_unread ON notifications(user_id, read_at_utc, id);
@@ -0,0 +1,68 @@
+import re
+from archive import archived_tables
+
+# Search configuration
+SEARCH_MAX_TERMS = 8
+SEARCH_SCOPES = ('todos', 'lancamentos', 'contas')
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def build_match_query(term):
+    """Turn free text into an FTS5 query: every word must match, as a prefix
+
+    Words are quoted, so FTS5 operators typed by the user are searched as text.
+    Returns None when nothing searchable is left.
+    """
+    tokens = _TOKEN_RE.findall((term or '').lower())[:SEARCH_MAX_TERMS]
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def _user_match(column, user_id, match):
+    """Restrict a match to the user's rows inside the index (owner token 'u<user_id>')"""
+    return f'owner : "u{int(user_id)}" AND {column} : ({match})'
+
+def search_entries(conn, user_id, term, page=1, per_page=20):
+    """Lançamentos (archived ones too) whose note matches, best match first; returns (rows, has_more)
+
+    The index is matched once; the hot table and each archive table are
+    then read by id (a join on a UNION ALL of them would copy every entry).
+    """
+    match = build_match_query(term)
+    if match is None:
+        return [], False
+    tables = ['entries', *archived_tables(conn)]
+    selects = [f'''
+        SELECT e.id, e.type, e.amount, e.note, e.when_utc,
+               a.name as account_name, c.name as category_name, m.rank
+        FROM matches m
+        JOIN {table} e ON e.id = m.rowid
+        JOIN accounts a ON e.account_id = a.id
+        LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.user_id = ?
+    ''' for table in tables]
+    rows = conn.execute(f'''
+        WITH matches AS (SELECT rowid, rank FROM entries_fts WHERE entries_fts MATCH ?)
+        {' UNION ALL '.join(selects)}
+        ORDER BY rank, when_utc DESC
+        LIMIT ? OFFSET ?
+    ''', (_user_match('note', user_id, match), *[user_id] * len(tables), per_page + 1, (page - 1) * per_page)).fetchall()
+    return [{key: row[key] for key in row.keys() if key != 'rank'} for row in rows[:per_page]], len(rows) > per_page
+
+def search_bills(conn, user_id, term, page=1, per_page=20):
+    """Contas whose description matches, best match first; returns (rows, has_more)"""
+    match = build_match_query(term)
+    if match is None:
+        return [], False
+    rows = conn.execute('''
+        SELECT b.id, b.type, b.amount, b.description, b.due_date_utc, b.status,
+               a.name as account_name, c.name as category_name
+        FROM bills_fts
+        JOIN bills b ON b.id = bills_fts.rowid
+        JOIN accounts a ON b.account_id = a.id
+        LEFT JOIN categories c ON b.category_id = c.id
+        WHERE bills_fts MATCH ? AND b.user_id = ?
+        ORDER BY bills_fts.rank, b.due_date_utc ASC
+        LIMIT ? OFFSET ?
+    ''', (_user_match('description', user_id, match), user_id, per_page + 1, (page - 1) * per_page)).fetchall()
+    return [dict(row) for row in rows[:per_page]], len(rows) > per_page
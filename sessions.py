@@ -0,0 +1,239 @@
+import os
+import json
+import random
+import sqlite3
+import secrets
+import threading
+from datetime import datetime, timezone, timedelta
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Session store configuration
+# SESSION_STORE=sqlite keeps sessions in a local SQLite file (shared by all workers on the host)
+# SESSION_STORE=memory keeps them in-process (single worker / tests)
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite").lower()
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "./sessions.db")
+PROFILE_TTL_SECONDS = int(os.environ.get("PROFILE_TTL_SECONDS", "300"))
+# Share of session saves that also delete the expired sessions (an abandoned one is never loaded again)
+SESSION_PURGE_SAMPLE_RATE = float(os.environ.get("SESSION_PURGE_SAMPLE_RATE", "0.01"))
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict whose contents live on the server; the cookie only holds the id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+    def regenerate(self):
+        """Issue a new session id (on login) to avoid session fixation"""
+        self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+class MemorySessionStore:
+    """In-process session store"""
+
+    def __init__(self, purge_rate=SESSION_PURGE_SAMPLE_RATE):
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.purge_rate = purge_rate
+
+    def load(self, sid):
+        with self._lock:
+            record = self._sessions.get(sid)
+        if not record:
+            return None
+        user_id, data, expires_at = record
+        if expires_at < datetime.now(timezone.utc):
+            self.delete(sid)
+            return None
+        return dict(data)
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._sessions[sid] = (data.get('user_id'), dict(data), expires_at)
+        if random.random() < self.purge_rate:
+            self.purge_expired()
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def revoke_user(self, user_id):
+        """Drop every session of a user"""
+        with self._lock:
+            sids = [sid for sid, record in self._sessions.items() if record[0] == user_id]
+            for sid in sids:
+                del self._sessions[sid]
+        return len(sids)
+
+    def purge_expired(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            sids = [sid for sid, record in self._sessions.items() if record[2] < now]
+            for sid in sids:
+                del self._sessions[sid]
+        return len(sids)
+
+class SQLiteSessionStore:
+    """Session store backed by a local SQLite table"""
+
+    def __init__(self, path=SESSION_DB_PATH, purge_rate=SESSION_PURGE_SAMPLE_RATE):
+        self.path = path
+        self.purge_rate = purge_rate
+        # The file is created on first use: building the store (at app import) touches nothing
+        self._ready = False
+        self._setup_lock = threading.Lock()
+
+    def _setup(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        # WAL is a property of the file: set once here, not on every connection
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sessions (
+              id TEXT PRIMARY KEY,
+              user_id INTEGER,
+              data TEXT NOT NULL,
+              expires_at_utc TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at_utc);
+        ''')
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        if not self._ready:
+            with self._setup_lock:
+                if not self._ready:
+                    self._setup()
+                    self._ready = True
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self, sid):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT data, expires_at_utc FROM sessions WHERE id = ?', (sid,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        if row[1] < datetime.now(timezone.utc).isoformat():
+            self.delete(sid)
+            return None
+        return json.loads(row[0])
+
+    def save(self, sid, data, expires_at):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (id, user_id, data, expires_at_utc) VALUES (?, ?, ?, ?)',
+                (sid, data.get('user_id'), json.dumps(data), expires_at.isoformat())
+            )
+            conn.commit()
+            if random.random() < self.purge_rate:
+                self._purge_expired(conn)
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def revoke_user(self, user_id):
+        """Drop every session of a user"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def _purge_expired(self, conn):
+        cursor = conn.execute('DELETE FROM sessions WHERE expires_at_utc < ?', (datetime.now(timezone.utc).isoformat(),))
+        conn.commit()
+        return cursor.rowcount
+
+    def purge_expired(self):
+        conn = self._connect()
+        try:
+            return self._purge_expired(conn)
+        finally:
+            conn.close()
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface that keeps session data in a server-side store"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        previous_sid = getattr(session, 'previous_sid', None)
+        if previous_sid:
+            self.store.delete(previous_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+
+        expires_at = datetime.now(timezone.utc) + app.permanent_session_lifetime
+        self.store.save(session.sid, dict(session), expires_at)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+def make_session_store(kind=SESSION_STORE, path=SESSION_DB_PATH):
+    """Build the configured session store"""
+    if kind == 'memory':
+        return MemorySessionStore()
+    return SQLiteSessionStore(path)
+
+def load_profile(conn, user_id):
+    """Load the user profile snapshot cached in the session"""
+    user = conn.execute('''
+        SELECT id, name, email, trial_start_utc, subscribed, subscription_plan,
+               subscription_price, subscription_date, profile_photo, created_at_utc
+        FROM users WHERE id = ?
+    ''', (user_id,)).fetchone()
+    if not user:
+        return None
+    profile = dict(user)
+    profile['loaded_at_utc'] = datetime.now(timezone.utc).isoformat()
+    return profile
+
+def profile_is_stale(profile):
+    loaded_at = datetime.fromisoformat(profile['loaded_at_utc'])
+    return datetime.now(timezone.utc) - loaded_at > timedelta(seconds=PROFILE_TTL_SECONDS)
@@ -0,0 +1,4 @@
+function checkout(plan, price) {
+    // Redireciona para página de checkout com os parâmetros do plano
+    window.location.href = `/checkout?plan=${plan}&price=${price}`;
+}
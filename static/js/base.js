@@ -0,0 +1,249 @@
+// Sidebar functionality
+document.addEventListener('DOMContentLoaded', function() {
+    const hamburgerBtn = document.getElementById('hamburgerBtn');
+    const sidebar = document.getElementById('sidebar');
+    const sidebarOverlay = document.getElementById('sidebarOverlay');
+
+    function toggleSidebar() {
+        if (hamburgerBtn && sidebar && sidebarOverlay) {
+            hamburgerBtn.classList.toggle('active');
+            sidebar.classList.toggle('active');
+            sidebarOverlay.classList.toggle('active');
+
+            if (window.innerWidth < 1024) {
+                document.body.style.overflow = sidebar.classList.contains('active') ? 'hidden' : '';
+            }
+        }
+    }
+
+    function closeSidebar() {
+        if (hamburgerBtn && sidebar && sidebarOverlay) {
+            hamburgerBtn.classList.remove('active');
+            sidebar.classList.remove('active');
+            sidebarOverlay.classList.remove('active');
+            document.body.style.overflow = '';
+        }
+    }
+
+    if (hamburgerBtn) {
+        hamburgerBtn.addEventListener('click', toggleSidebar);
+    }
+
+    if (sidebarOverlay) {
+        sidebarOverlay.addEventListener('click', closeSidebar);
+    }
+
+    // Auto-open sidebar on desktop
+    if (window.innerWidth >= 1024 && sidebar) {
+        sidebar.classList.add('active');
+    }
+
+    // Handle window resize
+    window.addEventListener('resize', function() {
+        if (window.innerWidth >= 1024 && sidebar && sidebarOverlay) {
+            sidebar.classList.add('active');
+            sidebarOverlay.classList.remove('active');
+            document.body.style.overflow = '';
+        } else {
+            if (hamburgerBtn && !hamburgerBtn.classList.contains('active') && sidebar) {
+                sidebar.classList.remove('active');
+            }
+        }
+    });
+
+    // Close sidebar when clicking on nav links (mobile only)
+    const navLinks = document.querySelectorAll('.sidebar .nav-link');
+    if (navLinks.length > 0) {
+        navLinks.forEach(link => {
+            link.addEventListener('click', function() {
+                if (window.innerWidth < 1024) {
+                    closeSidebar();
+                }
+            });
+        });
+    }
+});
+
+// Brazilian currency input formatting
+function formatCurrencyInput(input) {
+    let value = input.value.replace(/\D/g, '');
+    value = (value / 100).toFixed(2);
+    value = value.replace('.', ',');
+    value = value.replace(/(\d)(?=(\d{3})+(?!\d))/g, '$1.');
+    input.value = value;
+}
+
+// Apply formatting to inputs
+document.addEventListener('DOMContentLoaded', function() {
+    const currencyInputs = document.querySelectorAll('input[data-currency]');
+    currencyInputs.forEach(input => {
+        input.addEventListener('input', () => formatCurrencyInput(input));
+    });
+});
+
+// Assistente Flutuante JavaScript
+document.addEventListener('DOMContentLoaded', function() {
+    const assistantToggle = document.getElementById('assistantToggle');
+    const assistantBubble = document.getElementById('assistantBubble');
+    const assistantClose = document.getElementById('assistantClose');
+    const assistantInput = document.getElementById('assistantInput');
+    const assistantSend = document.getElementById('assistantSend');
+    const assistantBody = document.getElementById('assistantBody');
+
+    let isOpen = false;
+
+    function toggleAssistant() {
+        isOpen = !isOpen;
+        if (isOpen) {
+            assistantBubble.classList.add('active');
+            assistantInput.focus();
+        } else {
+            assistantBubble.classList.remove('active');
+        }
+    }
+
+    function closeAssistant() {
+        isOpen = false;
+        assistantBubble.classList.remove('active');
+    }
+
+    function addMessage(content, isUser = false) {
+        const messageDiv = document.createElement('div');
+        messageDiv.className = `assistant-message ${isUser ? 'user-message' : 'assistant-response'}`;
+
+        const messageContent = document.createElement('div');
+        messageContent.className = 'message-content';
+        messageContent.innerHTML = content;
+
+        messageDiv.appendChild(messageContent);
+        assistantBody.appendChild(messageDiv);
+
+        // Scroll to bottom
+        assistantBody.scrollTop = assistantBody.scrollHeight;
+    }
+
+    function handleQuickAction(action) {
+        let response = '';
+
+        switch(action) {
+            case 'tutorial':
+                response = `
+                    <strong>🎓 Tutorial do Sistema</strong><br><br>
+                    <div style="text-align: left;">
+                    <strong>1. Dashboard</strong> - Visão geral das suas finanças<br>
+                    <strong>2. Lançamentos</strong> - Adicione receitas e despesas<br>
+                    <strong>3. Contas a Pagar/Receber</strong> - Gerencie vencimentos<br>
+                    <strong>4. Relatórios</strong> - Análises detalhadas<br><br>
+
+                    💡 <strong>Dicas:</strong><br>
+                    • Use categorias para organizar melhor<br>
+                    • Configure lembretes para vencimentos<br>
+                    • Consulte relatórios mensalmente<br><br>
+
+                    Quer saber mais sobre alguma funcionalidade específica?
+                    </div>
+                `;
+                break;
+
+            case 'financial':
+                response = `
+                    <strong>💰 Consultas Financeiras</strong><br><br>
+                    <div style="text-align: left;">
+                    Você pode me perguntar:<br><br>
+
+                    <strong>💵 Saldo e Patrimônio:</strong><br>
+                    • "saldo total" ou "quanto tenho"<br><br>
+
+                    <strong>📈 Receitas:</strong><br>
+                    • "receitas deste mês"<br>
+                    • "faturamento hoje"<br><br>
+
+                    <strong>💸 Despesas:</strong><br>
+                    • "despesas hoje"<br>
+                    • "gastos desta semana"<br><br>
+
+                    <strong>📊 Relatórios:</strong><br>
+                    • "resumo mensal"<br>
+                    • "top 5 despesas"<br><br>
+
+                    Digite sua pergunta abaixo!
+                    </div>
+                `;
+                break;
+
+            case 'features':
+                response = `
+                    <strong>💡 Funcionalidades Principais</strong><br><br>
+                    <div style="text-align: left;">
+                    <strong>🏠 Dashboard</strong><br>
+                    • Visão geral das finanças<br>
+                    • Gráficos e estatísticas<br><br>
+
+                    <strong>💰 Lançamentos</strong><br>
+                    • Adicionar receitas e despesas<br>
+                    • Categorizar transações<br>
+                    • Anexar comprovantes<br><br>
+
+                    <strong>📅 Contas</strong><br>
+                    • Controle de vencimentos<br>
+                    • Alertas automáticos<br>
+                    • Status de pagamento<br><br>
+
+                    <strong>📊 Relatórios</strong><br>
+                    • Análises detalhadas<br>
+                    • Exportar dados<br>
+                    • Comparativos mensais<br><br>
+
+                    Precisa de ajuda com alguma funcionalidade?
+                    </div>
+                `;
+                break;
+        }
+
+        addMessage(response);
+    }
+
+    async function sendMessage() {
+        const message = assistantInput.value.trim();
+        if (!message) return;
+
+        // Mostrar mensagem do usuário
+        addMessage(message, true);
+        assistantInput.value = '';
+
+        // Enviar para o backend
+        try {
+            const response = await fetch('/chat-assistant', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ message: message })
+            });
+
+            const data = await response.json();
+            addMessage(data.response);
+        } catch (error) {
+            addMessage('❌ Erro ao processar mensagem. Tente novamente.');
+        }
+    }
+
+    // Event listeners
+    assistantToggle.addEventListener('click', toggleAssistant);
+    assistantClose.addEventListener('click', closeAssistant);
+    assistantSend.addEventListener('click', sendMessage);
+
+    assistantInput.addEventListener('keypress', function(e) {
+        if (e.key === 'Enter') {
+            sendMessage();
+        }
+    });
+
+    // Quick action buttons
+    document.addEventListener('click', function(e) {
+        if (e.target.classList.contains('quick-btn')) {
+            const action = e.target.dataset.action;
+            handleQuickAction(action);
+        }
+    });
+});
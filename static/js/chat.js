@@ -0,0 +1,248 @@
+let isLoading = false;
+
+// Elements
+const messageInput = document.getElementById('messageInput');
+const sendButton = document.getElementById('sendButton');
+const chatMessages = document.getElementById('chatMessages');
+const quickQuestions = document.querySelectorAll('.quick-question');
+
+// Send message function
+async function sendMessage(message) {
+    if (!message.trim() || isLoading) return;
+
+    // Add user message to chat
+    addMessageToChat('user', message);
+
+    // Clear input but keep focus
+    messageInput.value = '';
+
+    // Show loading
+    setLoading(true);
+    addLoadingMessage();
+
+    try {
+        const response = await fetch('/api/assistant/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ message: message })
+        });
+
+        // Stream the answer (Server-Sent Events) as chunks arrive
+        let answer = '';
+        let error = null;
+        let contentDiv = null;
+        await readEventStream(response, (event, data) => {
+            if (event === 'error') {
+                error = data.message;
+            } else if (data.chunk !== undefined) {
+                answer += data.chunk;
+                if (!contentDiv) {
+                    removeLoadingMessage();
+                    contentDiv = addMessageToChat('assistant', '');
+                }
+                contentDiv.innerHTML = formatAssistantMessage(answer);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+        });
+
+        // Remove loading message
+        removeLoadingMessage();
+
+        if (error) {
+            addMessageToChat('assistant', 'Desculpe, ocorreu um erro: ' + error);
+        } else if (!contentDiv) {
+            addMessageToChat('assistant', 'Desculpe, ocorreu um erro: Erro desconhecido');
+        }
+
+    } catch (error) {
+        console.error('Error:', error);
+        removeLoadingMessage();
+        addMessageToChat('assistant', 'Desculpe, não foi possível processar sua mensagem. Tente novamente.');
+    } finally {
+        setLoading(false);
+        // Ensure input stays focused and visible
+        setTimeout(() => {
+            messageInput.focus();
+        }, 100);
+    }
+}
+
+// Read a text/event-stream response, calling onEvent(event, data) for each message
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+function formatAssistantMessage(message) {
+    // Support markdown-like formatting
+    const formattedMessage = message
+        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
+        .replace(/\n/g, '<br>');
+    return `<strong>🤖 Agente Layon:</strong><br>${formattedMessage}`;
+}
+
+// Add message to chat
+function addMessageToChat(sender, message) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `chat-message ${sender}`;
+
+    const contentDiv = document.createElement('div');
+    contentDiv.className = 'message-content';
+
+    if (sender === 'user') {
+        contentDiv.innerHTML = `<strong>Você:</strong><br>${message}`;
+    } else {
+        contentDiv.innerHTML = formatAssistantMessage(message);
+    }
+
+    messageDiv.appendChild(contentDiv);
+    chatMessages.appendChild(messageDiv);
+
+    // Scroll to bottom and ensure input remains visible
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+
+    // Ensure input stays focused and visible
+    if (!isLoading && document.activeElement !== messageInput) {
+        setTimeout(() => {
+            messageInput.focus();
+        }, 50);
+    }
+
+    return contentDiv;
+}
+
+// Loading states
+function setLoading(loading) {
+    isLoading = loading;
+    sendButton.disabled = loading;
+
+    // Don't disable input to keep it visible and focusable
+    if (loading) {
+        messageInput.style.opacity = '0.7';
+        sendButton.innerHTML = '<div class="spinner"></div>';
+    } else {
+        messageInput.style.opacity = '1';
+        messageInput.disabled = false;
+        sendButton.innerHTML = '<i class="fas fa-paper-plane"></i>';
+    }
+}
+
+function addLoadingMessage() {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'chat-message assistant loading-message';
+    messageDiv.id = 'loadingMessage';
+
+    const contentDiv = document.createElement('div');
+    contentDiv.className = 'message-content';
+    contentDiv.innerHTML = '<strong>🤖 Assistente:</strong><br><div class="spinner"></div> Processando...';
+
+    messageDiv.appendChild(contentDiv);
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+function removeLoadingMessage() {
+    const loadingMessage = document.getElementById('loadingMessage');
+    if (loadingMessage) {
+        loadingMessage.remove();
+    }
+}
+
+// Event listeners
+sendButton.addEventListener('click', () => {
+    sendMessage(messageInput.value);
+});
+
+messageInput.addEventListener('keypress', (e) => {
+    if (e.key === 'Enter' && !e.shiftKey) {
+        e.preventDefault();
+        sendMessage(messageInput.value);
+    }
+});
+
+// Quick questions
+quickQuestions.forEach(button => {
+    button.addEventListener('click', () => {
+        const question = button.getAttribute('data-question');
+        sendMessage(question);
+    });
+});
+
+// Restore the latest messages of the conversation
+async function loadHistory() {
+    try {
+        const response = await fetch('/api/chat/history?per_page=10');
+        const data = await response.json();
+        if (data.status !== 'ok') return;
+
+        data.messages.reverse().forEach(item => {
+            addMessageToChat('user', item.message);
+            addMessageToChat('assistant', item.answer);
+        });
+    } catch (error) {
+        console.error('Error loading history:', error);
+    }
+}
+
+loadHistory();
+
+// Focus on input
+messageInput.focus();
+
+// Handle mobile keyboard viewport issues
+function handleViewportChange() {
+    const vh = window.innerHeight * 0.01;
+    document.documentElement.style.setProperty('--vh', `${vh}px`);
+}
+
+// Handle input focus for mobile keyboards
+messageInput.addEventListener('focus', function() {
+    setTimeout(() => {
+        if (window.innerWidth <= 768) {
+            // Ensure input is always visible
+            this.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+            // Scroll chat to bottom
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+    }, 300);
+});
+
+// Prevent input from being hidden
+messageInput.addEventListener('blur', function(e) {
+    // Only refocus if blur wasn't caused by clicking send button
+    if (e.relatedTarget !== sendButton && !isLoading) {
+        setTimeout(() => {
+            this.focus();
+        }, 150);
+    }
+});
+
+// Update viewport height on resize (for mobile keyboards)
+window.addEventListener('resize', handleViewportChange);
+window.addEventListener('orientationchange', handleViewportChange);
+
+// Initial call
+handleViewportChange();
@@ -0,0 +1,42 @@
+function toggleToken() {
+    const tokenInput = document.getElementById('mp_token');
+    const toggleIcon = document.getElementById('toggleIcon');
+
+    if (tokenInput.type === 'password') {
+        tokenInput.type = 'text';
+        toggleIcon.className = 'fas fa-eye-slash';
+    } else {
+        tokenInput.type = 'password';
+        toggleIcon.className = 'fas fa-eye';
+    }
+}
+
+document.getElementById('payment-form').addEventListener('submit', function(e) {
+    const submitBtn = document.getElementById('submitBtn');
+    submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Processando...';
+    submitBtn.disabled = true;
+});
+
+// Máscara para telefone
+document.getElementById('customer_phone').addEventListener('input', function(e) {
+    let value = e.target.value.replace(/\D/g, '');
+    value = value.replace(/^(\d{2})(\d)/g, '($1) $2');
+    value = value.replace(/(\d)(\d{4})$/, '$1-$2');
+    e.target.value = value;
+});
+
+// Máscara para CPF
+document.getElementById('customer_document').addEventListener('input', function(e) {
+    let value = e.target.value.replace(/\D/g, '');
+    if (value.length <= 11) {
+        value = value.replace(/(\d{3})(\d)/, '$1.$2');
+        value = value.replace(/(\d{3})(\d)/, '$1.$2');
+        value = value.replace(/(\d{3})(\d{1,2})$/, '$1-$2');
+    } else {
+        value = value.replace(/^(\d{2})(\d)/, '$1.$2');
+        value = value.replace(/^(\d{2})\.(\d{3})(\d)/, '$1.$2.$3');
+        value = value.replace(/\.(\d{3})(\d)/, '.$1/$2');
+        value = value.replace(/(\d{4})(\d)/, '$1-$2');
+    }
+    e.target.value = value;
+});
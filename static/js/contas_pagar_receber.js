@@ -0,0 +1,136 @@
+let currentBillId = null;
+
+// Set default datetime to now + 1 day
+document.addEventListener('DOMContentLoaded', function() {
+    const dueDateInput = document.getElementById('due_date');
+    if (dueDateInput) {
+        const tomorrow = new Date();
+        tomorrow.setDate(tomorrow.getDate() + 1);
+        tomorrow.setHours(12, 0, 0, 0); // Set to noon
+
+        // Format to YYYY-MM-DDTHH:MM
+        const year = tomorrow.getFullYear();
+        const month = String(tomorrow.getMonth() + 1).padStart(2, '0');
+        const day = String(tomorrow.getDate()).padStart(2, '0');
+        const hours = String(tomorrow.getHours()).padStart(2, '0');
+        const minutes = String(tomorrow.getMinutes()).padStart(2, '0');
+
+        dueDateInput.value = `${year}-${month}-${day}T${hours}:${minutes}`;
+    }
+});
+
+// Update category options based on bill type
+document.getElementById('type').addEventListener('change', function() {
+    const categorySelect = document.getElementById('category_id');
+    const optgroups = categorySelect.querySelectorAll('optgroup');
+
+    // Show all optgroups first
+    optgroups.forEach(group => group.style.display = 'block');
+
+    if (this.value === 'receber') {
+        // Hide expense categories
+        optgroups.forEach(group => {
+            if (group.label === 'Despesas') {
+                group.style.display = 'none';
+            }
+        });
+    } else if (this.value === 'pagar') {
+        // Hide income categories
+        optgroups.forEach(group => {
+            if (group.label === 'Receitas') {
+                group.style.display = 'none';
+            }
+        });
+    }
+
+    // Reset category selection
+    categorySelect.value = '';
+});
+
+// Filter bills
+function filterBills() {
+    const status = document.getElementById('statusFilter').value;
+    const type = document.getElementById('typeFilter').value;
+
+    const params = new URLSearchParams();
+    if (status !== 'all') params.append('status', status);
+    if (type !== 'all') params.append('type', type);
+
+    const url = window.location.pathname + (params.toString() ? '?' + params.toString() : '');
+    window.location.href = url;
+}
+
+// Mark bill as paid
+function markAsPaid(billId, description, amount) {
+    currentBillId = billId;
+    document.getElementById('billDescription').textContent = description;
+    document.getElementById('billAmount').textContent = new Intl.NumberFormat('pt-BR', {
+        style: 'currency',
+        currency: 'BRL'
+    }).format(amount);
+
+    // Clear previous value
+    document.getElementById('paid_amount').value = '';
+
+    const modal = new bootstrap.Modal(document.getElementById('paymentModal'));
+    modal.show();
+}
+
+// Submit payment
+function submitPayment() {
+    if (!currentBillId) return;
+
+    const form = document.getElementById('paymentForm');
+    form.action = `/bill/${currentBillId}/pay`;
+    form.submit();
+}
+
+// Bulk pay / reschedule of the selected bills
+const selectAllBills = document.getElementById('selectAllBills');
+if (selectAllBills) {
+    selectAllBills.addEventListener('change', function() {
+        document.querySelectorAll('.bill-select').forEach(box => box.checked = this.checked);
+    });
+}
+
+function bulkBills(action) {
+    const ids = Array.from(document.querySelectorAll('.bill-select:checked')).map(box => parseInt(box.value));
+    if (!ids.length) {
+        alert('Selecione ao menos uma conta.');
+        return;
+    }
+
+    let items = ids.map(id => ({id: id}));
+    if (action === 'reschedule') {
+        const dueDate = document.getElementById('bulkDueDate').value;
+        if (!dueDate) {
+            alert('Informe a nova data de vencimento.');
+            return;
+        }
+        items = ids.map(id => ({id: id, due_date: dueDate + 'T12:00'}));
+    }
+
+    fetch('/bills/bulk', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({action: action, items: items})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.status !== 'ok') {
+            alert(data.message);
+            return;
+        }
+        if (data.failed) {
+            const errors = data.results.filter(r => r.status === 'error').map(r => `#${r.id}: ${r.message}`);
+            alert(`${data.processed} conta(s) processada(s).\n` + errors.join('\n'));
+        }
+        window.location.reload();
+    })
+    .catch(() => alert('Erro ao processar as contas.'));
+}
+
+// Auto-format currency input in modal
+document.getElementById('paid_amount').addEventListener('input', function() {
+    formatCurrencyInput(this);
+});
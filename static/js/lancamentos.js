@@ -0,0 +1,51 @@
+// Set default datetime to now
+document.addEventListener('DOMContentLoaded', function() {
+    const whenInput = document.getElementById('when');
+    if (whenInput && !whenInput.value) {
+        const now = new Date();
+
+        // Format to YYYY-MM-DDTHH:MM
+        const year = now.getFullYear();
+        const month = String(now.getMonth() + 1).padStart(2, '0');
+        const day = String(now.getDate()).padStart(2, '0');
+        const hours = String(now.getHours()).padStart(2, '0');
+        const minutes = String(now.getMinutes()).padStart(2, '0');
+
+        whenInput.value = `${year}-${month}-${day}T${hours}:${minutes}`;
+    }
+});
+
+// Update category options based on transaction type
+document.getElementById('type').addEventListener('change', function() {
+    const categorySelect = document.getElementById('category_id');
+    const optgroups = categorySelect.querySelectorAll('optgroup');
+
+    // Show all optgroups first
+    optgroups.forEach(group => group.style.display = 'block');
+
+    if (this.value === 'receita') {
+        // Hide expense categories
+        optgroups.forEach(group => {
+            if (group.label === 'Despesas') {
+                group.style.display = 'none';
+            }
+        });
+    } else if (this.value === 'despesa') {
+        // Hide income categories
+        optgroups.forEach(group => {
+            if (group.label === 'Receitas') {
+                group.style.display = 'none';
+            }
+        });
+    }
+
+    // Reset category selection
+    categorySelect.value = '';
+});
+
+// Create default account function
+function createDefaultAccount() {
+    // This would need to be implemented as a separate endpoint
+    // For now, just show a message
+    alert('Funcionalidade em desenvolvimento. Por favor, entre em contato com o suporte.');
+}
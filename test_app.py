@@ -2,25 +2,42 @@ import pytest
 import tempfile
 import os
 from datetime import datetime, timezone
-from app import app
+import helpers
+
+os.environ.setdefault('SESSION_STORE', 'memory')
+os.environ.setdefault('CACHE_VERSIONS', 'memory')
+
+from app import app, create_app
+from config import TestConfig
 from helpers import brl, br_datetime, parse_br_currency, parse_br_datetime, init_db, get_db_connection
+from cache import QueryCache, LRUBackend, LocalSharedBackend, query_cache
+from sessions import ServerSideSessionInterface, MemorySessionStore, SQLiteSessionStore
+from ai_assistant import answer_cache, normalize_intent, get_assistant_response
+from chat_log import ChatLogWriter, chat_log
+from forecast import forecast_engine, bill_occurrences
+from auth import bucket_store
 
 @pytest.fixture
 def client():
     # Create a temporary database for testing
-    db_fd, app.config['DATABASE'] = tempfile.mkstemp()
-    app.config['TESTING'] = True
-    
-    # Set test database path
-    os.environ['DB_PATH'] = app.config['DATABASE']
+    db_fd, db_path = tempfile.mkstemp()
+    test_app = create_app(TestConfig, {'DB_PATH': db_path})
+    previous = test_app.extensions['database'].activate()
+    query_cache.backend.clear()
+    answer_cache.backend.clear()
+    forecast_engine.clear()
+    bucket_store.clear()
     
-    with app.test_client() as client:
-        with app.app_context():
+    with test_app.test_client() as client:
+        with test_app.app_context():
             init_db()
         yield client
     
+    # Write pending chat log rows before the database goes away
+    chat_log.flush()
+    previous.activate()
     os.close(db_fd)
-    os.unlink(app.config['DATABASE'])
+    os.unlink(db_path)
 
 def test_currency_formatting():
     """Test Brazilian currency formatting"""
@@ -174,7 +191,7 @@ def test_database_initialization():
     """Test that database initializes correctly"""
     # Create temporary database
     db_fd, db_path = tempfile.mkstemp()
-    os.environ['DB_PATH'] = db_path
+    previous = helpers.Database(db_path, use_sqlite_cloud=False).activate()
     
     try:
         init_db()
@@ -190,6 +207,7 @@ def test_database_initialization():
             assert table in tables
     
     finally:
+        previous.activate()
         os.close(db_fd)
         os.unlink(db_path)
 
@@ -200,5 +218,1466 @@ def test_trial_status_calculation():
     from app import check_trial_status
     assert callable(check_trial_status)
 
+def register_user(client, email='test@example.com'):
+    """Register (and log in) a test user"""
+    client.post('/register', data={
+        'name': 'Test User',
+        'email': email,
+        'password': 'password123'
+    })
+
+def test_query_cache_lru_and_versioning():
+    """Test LRU eviction and per-user version invalidation"""
+    cache = QueryCache(LRUBackend(max_entries=2))
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    
+    assert cache.get_or_compute(1, 'q', (), compute) == 1
+    assert cache.get_or_compute(1, 'q', (), compute) == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    
+    # A write bumps the version and makes the old result unreachable
+    cache.bump_user(1)
+    assert cache.get_or_compute(1, 'q', (), compute) == 2
+    # Other users are unaffected
+    assert cache.get_or_compute(2, 'q', (), compute) == 3
+    assert cache.get_or_compute(2, 'q', (), compute) == 3
+    
+    # Bounded size
+    cache.get_or_compute(3, 'q', (), compute)
+    assert cache.backend.size() == 2
+
+def test_query_cache_shared_backend():
+    """Test that workers sharing a backend see each other's invalidations"""
+    backend = LocalSharedBackend()
+    worker_a, worker_b = QueryCache(backend), QueryCache(backend)
+    
+    assert worker_a.get_or_compute(1, 'q', ('x',), lambda: {'total': 10}) == {'total': 10}
+    assert worker_b.get_or_compute(1, 'q', ('x',), lambda: {'total': 99}) == {'total': 10}
+    
+    worker_b.bump_user(1)
+    assert worker_a.get_or_compute(1, 'q', ('x',), lambda: {'total': 20}) == {'total': 20}
+
+def test_query_cache_shared_versions(tmp_path):
+    """Test that per-process LRUs sharing the SQLite version counters see each other's invalidations"""
+    from cache import SQLiteCounters
+    path = str(tmp_path / 'versions.db')
+    worker_a = QueryCache(LRUBackend(counters=SQLiteCounters(path)))
+    worker_b = QueryCache(LRUBackend(counters=SQLiteCounters(path)))
+    
+    assert worker_a.get_or_compute(1, 'q', (), lambda: 10) == 10
+    assert worker_b.get_or_compute(1, 'q', (), lambda: 10) == 10
+    worker_b.bump_user(1)
+    assert worker_a.user_version(1) == 1
+    assert worker_a.get_or_compute(1, 'q', (), lambda: 20) == 20
+    # A worker restart drops its values but never rewinds the shared counter
+    worker_a.backend.clear_entries()
+    assert worker_b.user_version(1) == 1
+
+def test_dashboard_cache_invalidated_by_entry(client, monkeypatch):
+    """Test that creating an entry invalidates the cached dashboard"""
+    register_user(client)
+    client.get('/dashboard')
+    rv = client.get('/dashboard')
+    assert rv.status_code == 200
+    # Cache statistics cover every user: admin-only
+    assert client.get('/api/cache/stats').status_code == 403
+    monkeypatch.setitem(client.application.config, 'ADMIN_EMAILS', {'test@example.com'})
+    assert client.get('/api/cache/stats').get_json()['hits'] > 0
+    
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={
+        'type': 'receita',
+        'amount': '1.234,56',
+        'account_id': account_id,
+        'when': '25/12/2023 15:30'
+    })
+    
+    rv = client.get('/dashboard')
+    assert 'R$ 1.234,56'.encode() in rv.data
+
+def test_session_uses_profile_snapshot(client):
+    """Test that authenticated views read the profile from the session, not users"""
+    register_user(client)
+    
+    conn = get_db_connection()
+    conn.execute("UPDATE users SET name = 'Changed Elsewhere'")
+    conn.commit()
+    conn.close()
+    
+    rv = client.get('/perfil')
+    assert rv.status_code == 200
+    assert b'Test User' in rv.data
+    assert b'Changed Elsewhere' not in rv.data
+    
+    # Writes through the app refresh the snapshot
+    client.post('/perfil', data={'name': 'New Name'})
+    rv = client.get('/perfil')
+    assert b'New Name' in rv.data
+
+def test_logout_all_revokes_sessions(client):
+    """Test that revocation drops the server-side session"""
+    register_user(client)
+    assert client.get('/dashboard').status_code == 200
+    
+    client.post('/logout-all')
+    rv = client.get('/dashboard')
+    assert rv.status_code == 302
+    assert '/login' in rv.location
+
+def test_sqlite_session_store(tmp_path):
+    """Test the SQLite session store round-trip, revocation and purging"""
+    import sqlite3
+    from datetime import timedelta
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    expires = datetime.now(timezone.utc) + timedelta(days=1)
+    store.save('a', {'user_id': 1, 'user_name': 'A'}, expires)
+    store.save('b', {'user_id': 1, 'user_name': 'A'}, expires)
+    store.save('c', {'user_id': 2, 'user_name': 'C'}, expires)
+    store.save('old', {'user_id': 3}, datetime.now(timezone.utc) - timedelta(days=1))
+    
+    assert store.load('a')['user_name'] == 'A'
+    assert store.load('old') is None
+    assert store.revoke_user(1) == 2
+    assert store.load('a') is None
+    assert store.load('c')['user_id'] == 2
+    
+    # Expired sessions nobody loads again go on a sampled save; WAL was set once, on the file
+    conn = sqlite3.connect(str(tmp_path / 'sessions.db'))
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.close()
+    store.save('stale', {'user_id': 4}, datetime.now(timezone.utc) - timedelta(days=1))
+    store.purge_rate = 1.0
+    store.save('d', {'user_id': 5}, expires)
+    conn = sqlite3.connect(str(tmp_path / 'sessions.db'))
+    assert [row[0] for row in conn.execute('SELECT id FROM sessions ORDER BY id')] == ['c', 'd']
+    conn.close()
+    memory = MemorySessionStore(purge_rate=1.0)
+    memory.save('stale', {'user_id': 4}, datetime.now(timezone.utc) - timedelta(days=1))
+    memory.save('d', {'user_id': 5}, expires)
+    assert list(memory._sessions) == ['d']
+
+def test_assistant_stream(client):
+    """Test that the assistant answer is streamed as Server-Sent Events"""
+    register_user(client)
+    
+    rv = client.post('/api/assistant/stream', json={'message': 'ajuda'})
+    assert rv.status_code == 200
+    assert rv.mimetype == 'text/event-stream'
+    
+    body = rv.get_data(as_text=True)
+    assert body.count('data: {"chunk"') > 1
+    assert 'event: done' in body
+
+def test_assistant_stream_sends_parts_as_ready(client, monkeypatch):
+    """Test that answer parts reach the stream before the rest is computed, and that timeouts stop the task"""
+    import sys
+    import threading
+    import ai_assistant
+    from functools import partial
+    register_user(client)
+    release = threading.Event()
+    def slow_parts(user_id, message):
+        yield 'primeira parte\n'
+        release.wait(5)
+        yield 'segunda parte'
+    monkeypatch.setattr(ai_assistant, 'assistant_answer_parts', slow_parts)
+    
+    events = ai_assistant.stream_assistant_response(ai_assistant.submit_assistant_stream(1, 'x'))
+    assert next(events) == ': started\n\n'
+    assert 'primeira parte' in next(events)
+    release.set()
+    rest = ''.join(events)
+    assert 'segunda parte' in rest and 'event: done' in rest
+    
+    # Timing out cancels the pool task, which stops before its next part
+    release.clear()
+    stream = ai_assistant.submit_assistant_stream(1, 'x')
+    body = ''.join(ai_assistant.stream_assistant_response(stream, timeout=0.2))
+    assert 'primeira parte' in body and 'event: error' in body and stream.cancelled.is_set()
+    release.set()
+    stream.future.result(timeout=5)
+    assert stream.parts.empty()
+    
+    # The JSON endpoint answers a timeout with 504
+    release.clear()
+    monkeypatch.setattr(ai_assistant, 'get_assistant_response', lambda user_id, message: release.wait(5) and '')
+    monkeypatch.setattr(sys.modules['app'], 'ask_assistant', partial(ai_assistant.ask_assistant, timeout=0.1))
+    assert client.post('/api/assistant', json={'message': 'saldo'}).status_code == 504
+    release.set()
+
+def test_assistant_concurrency_cap(client, monkeypatch):
+    """Test that requests beyond the concurrency cap are rejected"""
+    import threading
+    import ai_assistant
+    register_user(client)
+    monkeypatch.setattr(ai_assistant, '_inflight', threading.BoundedSemaphore(1))
+    ai_assistant._inflight.acquire()
+    
+    rv = client.post('/api/assistant', json={'message': 'saldo'})
+    assert rv.status_code == 429
+    rv = client.post('/api/assistant/stream', json={'message': 'saldo'})
+    assert rv.status_code == 429
+    assert 'event: error' in rv.get_data(as_text=True)
+
+def test_normalize_intent():
+    """Test that equivalent questions map to the same cache key"""
+    assert normalize_intent('Saldo') == normalize_intent('qual meu saldo?') == ('saldo', ())
+    assert normalize_intent('despesas de ontem') == ('despesas', ('ontem',))
+    assert normalize_intent('maiores entradas') == ('receitas', ('mes',))
+    assert normalize_intent('ranking') == ('top', ('receita',))
+    assert normalize_intent('contas a pagar vencendo') == ('contas', ('pagar', 'semana'))
+    assert normalize_intent('xyz')[0] == 'unknown'
+
+def test_assistant_answer_cache(client):
+    """Test that answers are reused until the user's data changes"""
+    register_user(client)
+    answer_cache.reset_stats()
+    
+    first = client.post('/api/assistant', json={'message': 'resumo mensal'}).get_json()['answer']
+    second = client.post('/api/assistant', json={'message': 'Resumo mensal!'}).get_json()['answer']
+    assert first == second
+    stats = client.get('/api/assistant/cache-stats').get_json()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '50,00', 'account_id': account_id})
+    
+    third = client.post('/api/assistant', json={'message': 'resumo mensal'}).get_json()['answer']
+    assert 'R$ 50,00' in third
+    assert client.get('/api/assistant/cache-stats').get_json()['misses'] == 2
+
+def test_chat_history_api(client, monkeypatch):
+    """Test that assistant exchanges are logged and paginated"""
+    register_user(client)
+    for question in ['saldo', 'resumo mensal', 'ajuda']:
+        client.post('/api/assistant', json={'message': question})
+    chat_log.flush()
+    
+    data = client.get('/api/chat/history?per_page=2').get_json()
+    assert data['status'] == 'ok'
+    assert [m['intent'] for m in data['messages']] == ['help', 'resumo']
+    assert data['has_more']
+    data = client.get('/api/chat/history?per_page=2&page=2').get_json()
+    assert [m['message'] for m in data['messages']] == ['saldo']
+    assert not data['has_more']
+    
+    # Intent stats are admin-only
+    assert client.get('/api/chat/stats').status_code == 403
+    monkeypatch.setitem(client.application.config, 'ADMIN_EMAILS', {'test@example.com'})
+    intents = client.get('/api/chat/stats').get_json()['intents']
+    assert {row['intent'] for row in intents} == {'saldo', 'resumo', 'help'}
+
+def test_chat_log_retention(client):
+    """Test rolling per-user retention of the chat log"""
+    register_user(client)
+    writer = ChatLogWriter(max_per_user=3)
+    for i in range(5):
+        writer.record(1, 'saldo', f'pergunta {i}', 'resposta', 1.0)
+    writer.stop()
+    
+    conn = get_db_connection()
+    rows = conn.execute('SELECT message FROM chat_messages WHERE user_id = 1 ORDER BY id').fetchall()
+    conn.close()
+    assert [row['message'] for row in rows] == ['pergunta 2', 'pergunta 3', 'pergunta 4']
+
+def test_report_engine_aggregations():
+    """Test bucketing, category shares and month-over-month deltas"""
+    from datetime import date
+    from reports import EntryColumns, build_report
+    
+    columns = EntryColumns()
+    columns.append(date(2024, 1, 1), 'receita', 1, 1000.0)   # Monday
+    columns.append(date(2024, 1, 3), 'despesa', 2, 100.0)
+    columns.append(date(2024, 1, 9), 'despesa', 3, 300.0)
+    columns.append(date(2024, 2, 5), 'despesa', 2, 200.0)
+    columns.append(date(2024, 2, 5), 'transferencia', None, 50.0)
+    
+    report = build_report(columns, date(2024, 1, 1), date(2024, 2, 29), 'semana', {1: 'Salário', 2: 'Alimentação', 3: 'Lazer'})
+    assert report['total_receitas'] == 1000.0
+    assert report['total_despesas'] == 600.0
+    assert [bucket['day'] for bucket in report['flow']] == [
+        'Semana de 01/01/2024', 'Semana de 08/01/2024', 'Semana de 05/02/2024']
+    
+    shares = {(row['category_name'], row['type']): row['share'] for row in report['top_categories']}
+    assert shares[('Alimentação', 'despesa')] == 50.0
+    assert shares[('Salário', 'receita')] == 100.0
+    
+    january, february = report['monthly']
+    assert january['despesas'] == 400.0
+    assert february['delta_despesas'] == -200.0
+    assert february['delta_despesas_pct'] == -50.0
+
+def test_relatorios_custom_period(client):
+    """Test the date range and granularity parameters of /relatorios"""
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '80,00', 'account_id': account_id, 'when': '10/03/2023 10:00'})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '20,00', 'account_id': account_id, 'when': '10/05/2023 10:00'})
+    
+    rv = client.get('/relatorios?from=2023-01-01&to=2023-12-31&granularity=mes')
+    assert rv.status_code == 200
+    assert b'Comparativo Mensal' in rv.data
+    assert 'R$ 100,00'.encode() in rv.data
+    assert b'Mar/2023' in rv.data
+    
+    rv = client.get('/relatorios?from=01/05/2023&to=31/05/2023')
+    assert 'R$ 20,00'.encode() in rv.data
+    assert 'R$ 80,00'.encode() not in rv.data
+
+def test_local_day_bucketing(client):
+    """Test that late-evening São Paulo entries land on their local day"""
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    # 22:30 in São Paulo is already the next day in UTC
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '10,00', 'account_id': account_id, 'when': '25/12/2023 22:30'})
+    
+    conn = get_db_connection()
+    entry = conn.execute('SELECT when_utc, local_day FROM entries').fetchone()
+    conn.close()
+    assert entry['when_utc'].startswith('2023-12-26')
+    assert entry['local_day'] == '2023-12-25'
+    
+    rv = client.get('/relatorios?from=2023-12-01&to=2023-12-31')
+    assert b'25/12/2023' in rv.data
+    assert b'26/12/2023' not in rv.data
+
+def test_migration_backfills_local_day(tmp_path):
+    """Test that migrate_db adds, backfills and indexes entries.local_day"""
+    import sqlite3
+    db_path = str(tmp_path / 'old.db')
+    previous = helpers.Database(db_path, use_sqlite_cloud=False).activate()
+    
+    conn = sqlite3.connect(db_path)
+    conn.execute('''CREATE TABLE entries (id INTEGER PRIMARY KEY, user_id INTEGER, account_id INTEGER,
+                    category_id INTEGER, type TEXT, amount REAL, note TEXT, when_utc TEXT, created_at_utc TEXT)''')
+    conn.execute("INSERT INTO entries (user_id, account_id, type, amount, when_utc, created_at_utc) "
+                 "VALUES (1, 1, 'despesa', 5, '2024-01-01T02:00:00+00:00', '2024-01-01T02:00:00+00:00')")
+    conn.commit()
+    conn.close()
+    
+    try:
+        helpers.migrate_db()
+        helpers.migrate_db()  # idempotent
+        
+        conn = get_db_connection()
+        assert conn.execute('SELECT local_day FROM entries').fetchone()['local_day'] == '2023-12-31'
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT local_day, SUM(amount) FROM entries "
+                            "WHERE user_id = 1 AND local_day BETWEEN '2023-12-01' AND '2023-12-31' GROUP BY local_day").fetchall()
+        conn.close()
+    finally:
+        previous.activate()
+    assert 'idx_entries_user_local_day' in ' '.join(str(row[3]) for row in plan)
+
+def test_bill_occurrences():
+    """Test overdue and recurring bill expansion over the forecast horizon"""
+    from datetime import date
+    today = date(2024, 1, 20)
+    assert bill_occurrences(date(2024, 1, 10), 'nao', today, 90) == [0]
+    assert bill_occurrences(date(2024, 1, 31), 'mensal', today, 90) == [11, 40, 71]  # 31/01, 29/02, 31/03
+    assert bill_occurrences(date(2024, 1, 25), 'anual', today, 90) == [5]
+    assert bill_occurrences(date(2024, 6, 1), 'nao', today, 90) == []
+
+def test_forecast_incremental_updates(client):
+    """Test projected balances and that bill writes only trigger partial recomputation"""
+    from datetime import timedelta
+    from zoneinfo import ZoneInfo
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    today = datetime.now(ZoneInfo('America/Sao_Paulo')).date()
+    due = (today + timedelta(days=10)).strftime('%d/%m/%Y')
+    
+    client.post('/lancamentos', data={'type': 'receita', 'amount': '500,00', 'account_id': account_id, 'when': ''})
+    client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '100,00', 'description': 'Aluguel',
+                                              'account_id': account_id, 'due_date': due})
+    forecast = client.get('/api/previsao?days=30').get_json()['forecast']
+    balances = forecast['accounts'][0]['balances']
+    assert len(balances) == 30
+    assert balances[0] == 500.0 and balances[9] == 500.0 and balances[10] == 400.0
+    
+    full_builds = forecast_engine.full_builds
+    later = (today + timedelta(days=20)).strftime('%d/%m/%Y')
+    client.post('/contas-pagar-receber', data={'type': 'receber', 'amount': '50,00', 'description': 'Cliente',
+                                              'account_id': account_id, 'due_date': later})
+    balances = client.get('/api/previsao?days=30').get_json()['forecast']['accounts'][0]['balances']
+    assert balances[19] == 400.0 and balances[20] == 450.0
+    assert forecast_engine.full_builds == full_builds
+    
+    assert client.get('/api/previsao?days=45').status_code == 400
+    answer = get_assistant_response(1, 'previsão de saldo')
+    assert 'Previsão de saldo para 30 dias' in answer and 'R$ 450,00' in answer
+
+def test_forecast_builds_outside_the_lock_and_evicts(client):
+    """Test forecast rebuilds run without the engine lock, keep writes made meanwhile and stay bounded"""
+    from forecast import ForecastEngine
+    register_user(client)
+    register_user(client, email='other@example.com')
+    engine = ForecastEngine(max_users=1)
+    engine.get(1)
+    engine.notify_write(1, entries=True)
+    
+    refresh = engine._refresh
+    def refresh_with_concurrent_write(conn, user_id, state):
+        assert engine._lock.acquire(blocking=False)  # readers and writers of other users are not blocked
+        engine._lock.release()
+        refresh(conn, user_id, state)
+        engine.notify_write(user_id, bills_from=state['today'])
+    engine._refresh = refresh_with_concurrent_write
+    engine.get(1)
+    assert engine.partial_builds == 1
+    assert engine._states[1]['dirty_bills_from'] is not None  # the write made during the refresh is still pending
+    
+    engine.get(2)
+    assert list(engine._states) == [2]
+    assert engine.full_builds == 2
+
+def test_split_sql_statements_keeps_triggers():
+    """Test that the cloud schema splitter keeps trigger bodies whole"""
+    statements = helpers.split_sql_statements(open('schema.sql', encoding='utf-8').read())
+    triggers = [stmt for stmt in statements if stmt.startswith('CREATE TRIGGER')]
+    assert len(triggers) == 12
+    assert all(stmt.endswith('END;') for stmt in triggers)
+
+def test_search_folds_accents_and_isolates_users(client):
+    """Test FTS search over notes and bill descriptions"""
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '300,00', 'note': 'Condomínio março', 'account_id': account_id, 'when': ''})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '20,00', 'note': 'Padaria', 'account_id': account_id, 'when': ''})
+    client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '1.200,00', 'description': 'Aluguel apartamento',
+                                              'account_id': account_id, 'due_date': '10/01/2030'})
+    
+    rv = client.get('/buscar?q=condominio')
+    assert 'Condomínio março'.encode() in rv.data
+    assert b'Padaria' not in rv.data
+    rv = client.get('/buscar?q=alug&scope=contas')
+    assert b'Aluguel apartamento' in rv.data
+    
+    answer = get_assistant_response(1, 'procurar condominio')
+    assert 'Condomínio março' in answer
+    
+    client.get('/logout')
+    register_user(client, 'other@example.com')
+    rv = client.get('/buscar?q=condominio')
+    assert 'Condomínio março'.encode() not in rv.data
+
+def test_migration_builds_search_index(client):
+    """Test that migrate_db indexes rows written before the FTS tables existed"""
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '50,00', 'note': 'Farmácia', 'account_id': account_id, 'when': ''})
+    
+    conn = get_db_connection()
+    for name in ('entries_fts_insert', 'entries_fts_delete', 'entries_fts_update',
+                 'bills_fts_insert', 'bills_fts_delete', 'bills_fts_update'):
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.execute('DROP TABLE entries_fts')
+    conn.execute('DROP TABLE bills_fts')
+    conn.commit()
+    conn.close()
+    
+    helpers.migrate_db()
+    helpers.migrate_db()  # idempotent
+    
+    rv = client.get('/buscar?q=farmacia')
+    assert 'Farmácia'.encode() in rv.data
+
+def test_migration_adds_search_owner(client):
+    """Test that migrate_db rebuilds FTS tables created without the owner column"""
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '50,00', 'note': 'Farmácia', 'account_id': account_id, 'when': ''})
+
+    conn = get_db_connection()
+    for name in ('entries_fts_insert', 'entries_fts_delete', 'entries_fts_update',
+                 'bills_fts_insert', 'bills_fts_delete', 'bills_fts_update'):
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.execute('DROP TABLE entries_fts')
+    conn.execute('DROP TABLE bills_fts')
+    conn.execute("CREATE VIRTUAL TABLE entries_fts USING fts5(note, content='entries', content_rowid='id')")
+    conn.execute("CREATE VIRTUAL TABLE bills_fts USING fts5(description, content='bills', content_rowid='id')")
+    conn.commit()
+    conn.close()
+
+    helpers.migrate_db()
+
+    conn = get_db_connection()
+    assert helpers._column_exists(conn, 'entries_fts', 'owner')
+    assert helpers._column_exists(conn, 'bills_fts', 'owner')
+    conn.close()
+    rv = client.get('/buscar?q=farmacia')
+    assert 'Farmácia'.encode() in rv.data
+
+    client.get('/logout')
+    register_user(client, 'other@example.com')
+    rv = client.get('/buscar?q=farmacia')
+    assert 'Farmácia'.encode() not in rv.data
+
+def test_bulk_pay_bills(client, monkeypatch):
+    """Test paying many bills in one request with per-item results"""
+    register_user(client)
+    register_user(client, 'other@example.com')  # logs in as the second user
+    conn = get_db_connection()
+    other_account = conn.execute('SELECT id FROM accounts WHERE user_id = 2').fetchone()['id']
+    conn.close()
+    client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '10,00', 'description': 'Alheia',
+                                              'account_id': other_account, 'due_date': '10/01/2030'})
+    client.get('/logout')
+    client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts WHERE user_id = 1').fetchone()['id']
+    conn.close()
+    for description in ('Luz', 'Água', 'Internet'):
+        client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '100,00', 'description': description,
+                                                  'account_id': account_id, 'due_date': '10/01/2030'})
+    
+    rv = client.post('/bills/bulk', json={'action': 'pay', 'items': [
+        {'id': 2}, {'id': 3, 'paid_amount': '80,00'}, {'id': 1}, {'id': 2}, {'id': 99}, {'id': 'x'}]})
+    data = rv.get_json()
+    assert data['processed'] == 2 and data['failed'] == 4
+    assert [r['status'] for r in data['results']] == ['ok', 'ok', 'error', 'error', 'error', 'error']
+    
+    conn = get_db_connection()
+    paid = conn.execute("SELECT id, paid_amount FROM bills WHERE status = 'pago' ORDER BY id").fetchall()
+    entries = conn.execute("SELECT amount, note, local_day FROM entries ORDER BY amount").fetchall()
+    conn.close()
+    assert [(row['id'], row['paid_amount']) for row in paid] == [(2, 100.0), (3, 80.0)]
+    assert [(row['amount'], row['note']) for row in entries] == [(80.0, 'Pagamento: Água'), (100.0, 'Pagamento: Luz')]
+    assert all(row['local_day'] for row in entries)
+    
+    # Paying again reports the bill as already paid
+    data = client.post('/bills/bulk', json={'action': 'pay', 'items': [2]}).get_json()
+    assert data['results'][0] == {'id': 2, 'status': 'error', 'message': 'Conta já está paga'}
+    
+    # NaN is not an amount; a bill paid between loading and updating (another request) gets no second entry
+    data = client.post('/bills/bulk', json={'action': 'pay', 'items': [{'id': 4, 'paid_amount': 'nan'}]}).get_json()
+    assert data['results'][0] == {'id': 4, 'status': 'error', 'message': 'Valor deve ser maior que zero'}
+    import bills
+    load_user_bills = bills.load_user_bills
+    def paid_after_loading(conn, user_id, bill_ids):
+        loaded = load_user_bills(conn, user_id, bill_ids)
+        conn.execute("UPDATE bills SET status = 'pago' WHERE id = 4")
+        return loaded
+    monkeypatch.setattr(bills, 'load_user_bills', paid_after_loading)
+    data = client.post('/bills/bulk', json={'action': 'pay', 'items': [4]}).get_json()
+    assert data['results'][0] == {'id': 4, 'status': 'error', 'message': 'Conta já está paga'}
+    conn = get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 2
+    conn.close()
+
+def test_bulk_reschedule_bills(client):
+    """Test moving many bills to a new due date"""
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    for description in ('Luz', 'Água'):
+        client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '100,00', 'description': description,
+                                                  'account_id': account_id, 'due_date': '10/01/2020'})
+    
+    data = client.post('/bills/bulk', json={'action': 'reschedule', 'items': [
+        {'id': 1, 'due_date': '15/02/2030'}, {'id': 2}]}).get_json()
+    assert [r['status'] for r in data['results']] == ['ok', 'error']
+    
+    conn = get_db_connection()
+    bill = conn.execute('SELECT due_date_utc, status FROM bills WHERE id = 1').fetchone()
+    conn.close()
+    assert bill['due_date_utc'].startswith('2030-02-15') and bill['status'] == 'pendente'
+    assert client.post('/bills/bulk', json={'action': 'delete', 'items': [1]}).status_code == 400
+
+def test_bench_smoke(client):
+    """Test the benchmark generator and runner on a tiny dataset"""
+    from bench.datagen import generate_dataset, bench_email, BENCH_PASSWORD
+    from bench.runner import run_routes, percentile, ROUTES
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    
+    generate_dataset(users=2, entries_per_user=30, bills_per_user=5)
+    client.post('/login', data={'email': bench_email(0), 'password': BENCH_PASSWORD})
+    results = run_routes(client, iterations=2, warmup=1, routes=ROUTES[:1], clear_caches=query_cache.backend.clear)
+    assert results['dashboard']['cold']['statuses'] == [200]
+    assert results['dashboard']['cold']['queries_per_request'] > results['dashboard']['warm']['queries_per_request']
+
+def test_normalize_sql():
+    """Test statement normalization used for the slow-query log"""
+    from instrumentation import normalize_sql
+    assert normalize_sql("SELECT * FROM bills\n   WHERE id IN (?, ?, ?) AND status = 'pago' LIMIT 5") == \
+        'SELECT * FROM bills WHERE id IN (?...) AND status = ? LIMIT ?'
+
+def test_sql_instrumentation_and_metrics(client, monkeypatch, caplog):
+    """Test Server-Timing, the slow-query log and the admin /metrics endpoint"""
+    import app as app_module
+    import instrumentation
+    instrumentation.route_metrics.reset()
+    monkeypatch.setattr(instrumentation, 'SLOW_QUERY_MS', 0)
+    register_user(client)
+    
+    with caplog.at_level('WARNING', logger='slow_query'):
+        rv = client.get('/dashboard')
+    timing = rv.headers.getlist('Server-Timing')
+    assert timing[0].startswith('db;dur=') and 'queries' in timing[0]
+    assert any('"route": "dashboard"' in record.getMessage() for record in caplog.records)
+    
+    assert client.get('/metrics').status_code == 403
+    monkeypatch.setitem(client.application.config, 'ADMIN_EMAILS', {'test@example.com'})
+    body = client.get('/metrics').get_data(as_text=True)
+    assert '# TYPE app_request_duration_seconds histogram' in body
+    assert 'app_requests_total{route="dashboard"} 1' in body
+    assert 'app_db_queries_total{route="dashboard"}' in body
+
+def test_profiling_ring_buffer(tmp_path, monkeypatch):
+    """Test per-route profiling, the bounded profile directory and pstats output"""
+    import gzip, marshal, pstats
+    from flask import Flask
+    import profiling
+    monkeypatch.setattr(profiling, 'PROFILE_ENABLED', True)
+    monkeypatch.setattr(profiling, 'PROFILE_ROUTES', {'slow'})
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(profiling, 'PROFILE_MAX_FILES', 2)
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+    
+    demo = Flask('profiling_demo')
+    demo.add_url_rule('/slow', 'slow', lambda: str(sum(range(10000))))
+    demo.add_url_rule('/fast', 'fast', lambda: 'ok')
+    assert profiling.profile_app(demo)
+    client = demo.test_client()
+    for _ in range(3):
+        client.get('/slow')
+    client.get('/fast')
+    
+    profiles = profiling.list_profiles()
+    assert len(profiles) == 2 and {p['route'] for p in profiles} == {'slow'}
+    client.get('/fast', headers={'X-Profile': 'secret'})
+    assert profiling.list_profiles()[0]['route'] == 'fast'
+    
+    with gzip.open(tmp_path / profiles[0]['name']) as f:
+        raw = tmp_path / 'raw.pstats'
+        raw.write_bytes(f.read())
+    assert pstats.Stats(str(raw)).total_calls > 0
+    assert profiling.profile_path('../etc/passwd') is None
+
+    # A request while another one is profiled, or while another tool holds the hook, runs unprofiled
+    saved = len(os.listdir(tmp_path))
+    with profiling._cprofile_lock:
+        assert client.get('/slow').status_code == 200
+    class BusyProfile:
+        def enable(self):
+            raise ValueError('Another profiling tool is already active')
+    monkeypatch.setattr(profiling.cProfile, 'Profile', BusyProfile)
+    assert client.get('/slow').status_code == 200
+    assert len(os.listdir(tmp_path)) == saved and not profiling._cprofile_lock.locked()
+
+def test_profiling_disabled_adds_no_hooks(monkeypatch):
+    """Test that profiling installs nothing when disabled"""
+    from flask import Flask
+    import profiling
+    monkeypatch.setattr(profiling, 'PROFILE_ENABLED', False)
+    demo = Flask('profiling_off')
+    assert profiling.profile_app(demo) is False
+    assert not demo.before_request_funcs and not demo.teardown_request_funcs
+
+def test_app_import_skips_optional_sdks():
+    """Test that importing the app loads neither the payment SDK nor the cloud driver"""
+    import subprocess, sys
+    code = "import sys, app; print('mercadopago' in sys.modules, 'sqlitecloud' in sys.modules)"
+    env = dict(os.environ, USE_SQLITE_CLOUD='false', SESSION_STORE='memory')
+    output = subprocess.check_output([sys.executable, '-c', code], env=env, text=True)
+    assert output.strip().splitlines()[-1] == 'False False'
+
+def test_app_import_creates_no_files(tmp_path):
+    """Test that importing the app with the default stores leaves the working directory untouched"""
+    import subprocess, sys
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('SESSION_STORE', 'CACHE_VERSIONS', 'CACHE_BACKEND', 'DB_PATH')}
+    env.update(USE_SQLITE_CLOUD='false', PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    subprocess.check_call([sys.executable, '-c', 'import app'], cwd=str(tmp_path), env=env)
+    assert os.listdir(tmp_path) == []
+
+def test_ensure_db_runs_schema_once(tmp_path, monkeypatch):
+    """Test that ensure_db creates the schema once and then only checks its version"""
+    previous = helpers.Database(str(tmp_path / 'fresh.db'), use_sqlite_cloud=False).activate()
+    try:
+        assert helpers.ensure_db() is True
+        assert helpers.ensure_db() is False  # same process: no-op
+        monkeypatch.setattr(helpers.current_database(), 'ready', False)
+        assert helpers.ensure_db() is False  # another worker: schema already current
+        
+        conn = get_db_connection()
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == helpers.schema_version()
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'entries_fts'").fetchone()
+        conn.close()
+    finally:
+        previous.activate()
+
+def test_create_app_with_config_overrides(tmp_path):
+    """Test that create_app applies config overrides without reloading modules or touching the process"""
+    db_path = str(tmp_path / 'factory.db')
+    active = helpers.current_database()
+
+    factory_app = create_app({'DB_PATH': db_path, 'USE_SQLITE_CLOUD': False, 'SESSION_STORE': 'memory',
+                              'ADMIN_EMAILS': {'admin@example.com'}})
+    database = factory_app.extensions['database']
+    assert database.db_path == db_path and database.use_sqlite_cloud is False
+    assert helpers.current_database() is active  # until the worker resources start
+    assert isinstance(factory_app.session_interface.store, MemorySessionStore)
+    assert factory_app.config['ADMIN_EMAILS'] == {'admin@example.com'}
+    assert create_app(TestConfig, {'DB_PATH': db_path}).config['SESSION_STORE'] == 'memory'
+
+    # Once activated (the 'database' worker resource), the first request creates the schema there
+    previous = database.activate()
+    try:
+        response = factory_app.test_client().get('/login')
+        assert response.status_code == 200
+        conn = get_db_connection()
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'users'").fetchone()
+        conn.close()
+    finally:
+        previous.activate()
+
+def test_worker_resources_lifecycle():
+    """Test that worker resources start in order and stop in reverse, isolating failures"""
+    from workers import WorkerResources
+    calls = []
+    def failing_stop():
+        calls.append('stop b')
+        raise RuntimeError('boom')
+    resources = WorkerResources()
+    resources.register('a', start=lambda: calls.append('start a'), stop=lambda: calls.append('stop a'))
+    resources.register('b', start=lambda: calls.append('start b'), stop=failing_stop)
+
+    resources.start()
+    assert resources.started
+    resources.stop()
+    assert calls == ['start a', 'start b', 'stop b', 'stop a']
+    assert not resources.started
+    assert app.extensions['worker_resources'].names == [
+        'database', 'query_cache', 'answer_cache', 'forecast', 'route_metrics', 'assistant_pool', 'auth_hash_pool', 'chat_log', 'write_coordinator', 'reminders']
+
+def test_balance_checkpoints_and_history(client):
+    """Test balance-as-of-date from monthly checkpoints, rebuilt after back-dated entries"""
+    from datetime import date
+    from balances import balance_at, ensure_checkpoints
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'receita', 'amount': '1000,00', 'account_id': account_id, 'when': '10/01/2024 12:00'})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '200,00', 'account_id': account_id, 'when': '15/03/2024 12:00'})
+    
+    conn = get_db_connection()
+    assert balance_at(conn, 1, date(2024, 2, 20)) == {account_id: 1000.0}
+    months = [row['month'] for row in conn.execute('SELECT month FROM balance_checkpoints ORDER BY month')]
+    assert months[:3] == ['2024-01', '2024-02', '2024-03']
+    assert ensure_checkpoints(conn, 1) == 0  # already current
+    
+    # An account without entries gets a zero checkpoint, so reads do not keep rebuilding it
+    empty_id = conn.execute("INSERT INTO accounts (user_id, name, initial_balance) VALUES (1, 'Reserva', 30)").lastrowid
+    conn.commit()
+    assert ensure_checkpoints(conn, 1) == 1
+    assert ensure_checkpoints(conn, 1) == 0
+    assert balance_at(conn, 1, date(2024, 2, 20)) == {account_id: 1000.0, empty_id: 30.0}
+    conn.execute('DELETE FROM balance_checkpoints WHERE account_id = ?', (empty_id,))
+    conn.execute('DELETE FROM accounts WHERE id = ?', (empty_id,))
+    conn.commit()
+    conn.close()
+    
+    # A back-dated entry adjusts the checkpoints from its month on, in place
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '50,00', 'account_id': account_id, 'when': '05/02/2024 12:00'})
+    conn = get_db_connection()
+    checkpoints = dict(conn.execute("SELECT month, closing_total FROM balance_checkpoints WHERE month <= '2024-03'").fetchall())
+    assert checkpoints == {'2024-01': 1000.0, '2024-02': 950.0, '2024-03': 750.0}
+    assert ensure_checkpoints(conn, 1) == 0
+    assert balance_at(conn, 1, date(2024, 2, 4)) == {account_id: 1000.0}
+    assert balance_at(conn, 1, date(2024, 3, 31)) == {account_id: 750.0}
+    assert balance_at(conn, 1, date(2023, 12, 31)) == {account_id: 0.0}
+    conn.close()
+    
+    rv = client.get('/api/saldo/historico?from=2024-02-04&to=2024-02-06')
+    points = rv.get_json()['history']['points']
+    assert [point['total'] for point in points] == [1000.0, 950.0, 950.0]
+    rv = client.get('/api/saldo/historico?granularity=mes&from=2023-12-01&to=2024-03-31')
+    points = rv.get_json()['history']['points']
+    assert [(point['date'], point['total']) for point in points] == [
+        ('2023-12-31', 0.0), ('2024-01-31', 1000.0), ('2024-02-29', 950.0), ('2024-03-31', 750.0)]
+    assert client.get('/api/saldo/historico?from=2020-01-01&to=2024-01-01').status_code == 400
+    
+    # Before the first checkpoint the months in between are missing: they are dropped and rebuilt
+    client.post('/lancamentos', data={'type': 'receita', 'amount': '10,00', 'account_id': account_id, 'when': '05/11/2023 12:00'})
+    conn = get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM balance_checkpoints').fetchone()[0] == 0
+    assert balance_at(conn, 1, date(2024, 3, 31)) == {account_id: 760.0}
+    conn.close()
+
+def test_transfer_between_accounts(client):
+    """Test that a transfer writes both legs atomically and moves balance between accounts"""
+    from datetime import date
+    from balances import balance_at
+    register_user(client)
+    conn = get_db_connection()
+    source_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    target_id = conn.execute("INSERT INTO accounts (user_id, name, initial_balance) VALUES (1, 'Poupança', 0)").lastrowid
+    conn.commit()
+    conn.close()
+    client.post('/lancamentos', data={'type': 'receita', 'amount': '1000,00', 'account_id': source_id, 'when': '10/01/2024 12:00'})
+    
+    rv = client.post('/lancamentos/transferencia', json={'from_account_id': source_id, 'to_account_id': target_id,
+                                                        'amount': '300,00', 'when': '15/01/2024 12:00'})
+    assert rv.get_json()['status'] == 'ok'
+    conn = get_db_connection()
+    legs = conn.execute('SELECT account_id, type, amount, transfer_group FROM entries WHERE type = ? ORDER BY amount',
+                        ('transferencia',)).fetchall()
+    assert [(leg['account_id'], leg['amount']) for leg in legs] == [(source_id, -300.0), (target_id, 300.0)]
+    assert legs[0]['transfer_group'] == legs[1]['transfer_group'] == rv.get_json()['transfer_group']
+    assert balance_at(conn, 1, date(2024, 1, 31)) == {source_id: 700.0, target_id: 300.0}
+    conn.close()
+    
+    # Invalid transfers write nothing; a lone 'transferencia' entry is rejected
+    assert client.post('/lancamentos/transferencia', json={'from_account_id': source_id, 'to_account_id': source_id,
+                                                           'amount': 10}).status_code == 400
+    assert client.post('/lancamentos/transferencia', json={'from_account_id': source_id, 'to_account_id': 999,
+                                                           'amount': 10}).status_code == 400
+    client.post('/lancamentos', data={'type': 'transferencia', 'amount': '10,00', 'account_id': source_id, 'when': ''})
+    conn = get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 3
+    conn.close()
+    
+    # Dashboard total is unchanged by the transfer; monthly receitas/despesas ignore it
+    rv = client.get('/dashboard')
+    assert 'R$ 1.000,00'.encode() in rv.data
+    rv = client.get('/relatorios?from=2024-01-01&to=2024-01-31')
+    assert 'R$ 300,00'.encode() not in rv.data
+
+def test_token_bucket_refills():
+    """Test token bucket burst, refusal with retry-after and refill over time"""
+    from auth import MemoryBucketStore
+    store = MemoryBucketStore(max_keys=2)
+    assert store.take('ip:1', 2, 1.0, now=0) == 0
+    assert store.take('ip:1', 2, 1.0, now=0) == 0
+    assert store.take('ip:1', 2, 1.0, now=0.5) == pytest.approx(0.5)
+    assert store.take('ip:1', 2, 1.0, now=1.5) == 0
+    store.take('ip:2', 2, 1.0, now=2)
+    store.take('ip:3', 2, 1.0, now=2)
+    assert len(store._buckets) == 2  # least recently used key evicted
+
+def test_login_rehash_rate_limit_and_admission(client, monkeypatch):
+    """Test rehash to tuned KDF parameters on login, per-email limits and pool admission control"""
+    import threading
+    import auth
+    from werkzeug.security import generate_password_hash
+    register_user(client)
+    conn = get_db_connection()
+    conn.execute('UPDATE users SET password_hash = ?', (generate_password_hash('password123', 'pbkdf2:sha256:1000'),))
+    conn.commit()
+    conn.close()
+
+    # The rehash is best-effort: a busy pool skips it and the login still succeeds
+    import importlib
+    app_module = importlib.import_module('app')
+    def busy_hash(password):
+        raise auth.AuthBusy()
+    with monkeypatch.context() as patch:
+        patch.setattr(app_module, 'hash_password', busy_hash)
+        rv = client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    assert rv.status_code == 302
+    conn = get_db_connection()
+    assert conn.execute('SELECT password_hash FROM users').fetchone()['password_hash'].startswith('pbkdf2:sha256:1000$')
+    conn.close()
+
+    rv = client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    assert rv.status_code == 302
+    conn = get_db_connection()
+    assert conn.execute('SELECT password_hash FROM users').fetchone()['password_hash'].startswith(auth.AUTH_HASH_METHOD + '$')
+    conn.close()
+    assert 'app_auth_hash_seconds_count{operation="verify"}' in auth.auth_metrics.render()
+    
+    # Pool at its pending cap: refused without hashing
+    pending = threading.BoundedSemaphore(1)
+    pending.acquire()
+    monkeypatch.setattr(auth, '_pending', pending)
+    rv = client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    assert rv.status_code == 503
+    
+    # A hash that outlives the timeout answers 503 and keeps its slot until it really ends
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(auth, '_executor', executor)
+    monkeypatch.setattr(auth, '_pending', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(auth, 'AUTH_HASH_TIMEOUT_SECONDS', 0.05)
+    release = threading.Event()
+    with pytest.raises(auth.AuthBusy):
+        auth._run('verify', release.wait, 5)
+    monkeypatch.setattr(auth, 'AUTH_HASH_TIMEOUT_SECONDS', 10)
+    rv = client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    assert rv.status_code == 503
+    release.set()
+    executor.submit(lambda: None).result()  # runs once the slow job (and its callback) is done
+    bucket_store.clear()
+    rv = client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    assert rv.status_code == 302
+    executor.shutdown()
+    
+    monkeypatch.setattr(auth.email_limiter, 'burst', 1)
+    bucket_store.clear()
+    client.post('/login', data={'email': 'test@example.com', 'password': 'wrong'})
+    rv = client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    assert rv.status_code == 429
+    assert 'Muitas tentativas'.encode() in rv.data
+
+def test_minify_assets():
+    """Test CSS/JS minification keeps strings and line structure"""
+    from assets import minify_css, minify_js
+    assert minify_css("/* tema */\n.a ,\n.b {\n  color: red ;\n  content: 'x  y';\n}\n") == ".a,.b{color:red;content:'x  y'}\n"
+    assert minify_js("    // comentário\n    const a = 1\n\n    go(a)\n") == "const a = 1\ngo(a)\n"
+
+def test_fingerprinted_assets_and_html_compression(client):
+    """Test bundle URLs in pages, precompressed bundle variants and gzip for large HTML"""
+    import gzip
+    import re
+    rv = client.get('/login')
+    html = rv.data.decode()
+    assert 'Content-Encoding' not in rv.headers  # client did not ask for compression
+    assert '<script>' not in html
+    url = re.search(r'src="(/assets/base\.[0-9a-f]{12}\.js)"', html).group(1)
+    
+    plain = client.get(url)
+    assert plain.status_code == 200 and 'immutable' in plain.headers['Cache-Control']
+    assert 'addEventListener' in plain.data.decode()
+    plain.close()
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    compressed.close()
+    assert client.get('/assets/base.000000000000.js').status_code == 404
+    
+    rv = client.get('/login', headers={'Accept-Encoding': 'gzip'})
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in rv.headers['Vary']
+    assert gzip.decompress(rv.data).decode() == html
+
+def test_archive_moves_old_entries_and_routes_queries(client, monkeypatch):
+    """Test yearly archival keeps balances, reports and listings correct"""
+    from datetime import date
+    import archive
+    from archive import archive_entries, entries_source, hot_floor
+    from balances import balance_at
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'receita', 'amount': '1000,00', 'account_id': account_id, 'when': '10/03/2020 12:00', 'note': 'Antigo'})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '100,00', 'account_id': account_id, 'when': '10/04/2020 12:00'})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '50,00', 'account_id': account_id, 'when': ''})
+    
+    conn = get_db_connection()
+    assert balance_at(conn, 1, date(2020, 3, 31)) == {account_id: 1000.0}  # checkpoints before archiving
+    assert archive_entries(conn) == {2020: 2}
+    assert archive_entries(conn) == {}  # nothing left to move
+    assert conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 1
+    assert conn.execute('SELECT COUNT(*) FROM entries_archive_2020').fetchone()[0] == 2
+    assert conn.execute('SELECT archived_total FROM accounts').fetchone()[0] == 900.0
+    assert entries_source(conn, hot_floor()) == 'entries'
+    assert 'entries_archive_2020' in entries_source(conn, date(2020, 1, 1), date(2020, 12, 31))
+    assert entries_source(conn, date(2020, 5, 1)) == 'entries'  # archived up to 2020-05-01
+    # A longer horizon set after archiving does not hide what was already moved
+    monkeypatch.setattr(archive, 'ARCHIVE_HORIZON_MONTHS', 12 * 100)
+    assert 'entries_archive_2020' in entries_source(conn, date(2020, 3, 1), date(2020, 3, 31))
+    
+    # Balances as of archived dates, with kept and with rebuilt checkpoints
+    assert balance_at(conn, 1, date(2020, 4, 30)) == {account_id: 900.0}
+    conn.execute('DELETE FROM balance_checkpoints')
+    conn.commit()
+    assert balance_at(conn, 1, date(2020, 3, 31)) == {account_id: 1000.0}
+    conn.close()
+    
+    assert 'R$ 850,00'.encode() in client.get('/dashboard').data
+    assert 'R$ 1.000,00'.encode() in client.get('/relatorios?from=2020-03-01&to=2020-03-31').data
+    assert b'Antigo' in client.get('/lancamentos').data
+    assert b'Antigo' in client.get('/export/csv').data
+
+    # Archived notes stay searchable, and the index still matches its source
+    from consistency import check_consistency
+    assert b'Antigo' in client.get('/buscar?q=antigo').data
+    assert 'Antigo' in get_assistant_response(1, 'procurar antigo')
+    conn = get_db_connection()
+    assert check_consistency(conn) == []
+    # Archives made before the fix lost their search rows: the migration indexes them again
+    conn.execute("INSERT INTO entries_fts(entries_fts, rowid, note, owner) SELECT 'delete', id, note, 'u' || user_id FROM entries_archive_2020")
+    conn.commit()
+    helpers.migrate_db(conn)
+    assert conn.execute("SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH 'antigo'").fetchone()[0] == 1
+    conn.close()
+
+def test_backup_snapshot_rotation_and_restore(client, tmp_path, monkeypatch):
+    """Test online snapshots are checked, rotated and restorable"""
+    import sqlite3
+    import backup
+    from backup import BackupError, create_backup, list_backups, verify_backup, restore_backup
+    monkeypatch.setattr(backup, 'BACKUP_DIR', str(tmp_path))
+    monkeypatch.setattr(backup, 'BACKUP_KEEP', 2)
+    monkeypatch.setattr(backup, 'BACKUP_PAGES_PER_STEP', 1)
+    monkeypatch.setattr(backup, 'BACKUP_STEP_SLEEP_SECONDS', 0)
+    register_user(client)
+    
+    first = create_backup()
+    assert verify_backup(first)
+    conn = get_db_connection()
+    conn.execute("UPDATE users SET name = 'Depois'")
+    conn.commit()
+    conn.close()
+    create_backup()
+    create_backup()
+    names = [b['name'] for b in list_backups()]
+    assert len(names) == 2 and os.path.basename(first) not in names
+    
+    # Restore the oldest kept snapshot after a change; the current state is kept aside first
+    conn = get_db_connection()
+    conn.execute("UPDATE users SET name = 'Perdido'")
+    conn.commit()
+    conn.close()
+    previous = restore_backup(list_backups()[-1]['path'])
+    assert list_backups(source='prerestore')[0]['path'] == previous
+    conn = get_db_connection()
+    assert conn.execute('SELECT name FROM users').fetchone()[0] == 'Depois'
+    conn.close()
+    
+    # A write between every step: the copy gives up paging after BACKUP_MAX_RESTARTS and still finishes
+    writer = get_db_connection()
+    def write_between_steps(status, remaining, total):
+        writer.execute("UPDATE users SET name = name || '.'")
+        writer.commit()
+    monkeypatch.setattr(backup, '_step_pause', write_between_steps)
+    monkeypatch.setattr(backup, 'BACKUP_MAX_RESTARTS', 2)
+    live = sqlite3.connect(helpers.current_database().db_path)
+    copy = sqlite3.connect(str(tmp_path / 'copy.db'))
+    assert backup.online_copy(live, copy) == 3
+    live.close()
+    current = writer.execute('SELECT name FROM users').fetchone()[0]
+    assert current.startswith('Depois.') and copy.execute('SELECT name FROM users').fetchone()[0] == current
+    copy.close()
+    writer.close()
+    
+    corrupt = tmp_path / 'database-20200101T000000000000Z.db.gz'
+    corrupt.write_bytes(b'not a snapshot')
+    with pytest.raises(BackupError):
+        verify_backup(str(corrupt))
+
+def test_export_cloud_keeps_derived_tables(client, tmp_path, monkeypatch):
+    """Test the cloud export copies counters and alerts as they are instead of deriving them twice"""
+    import sqlite3
+    import sys
+    import types
+    import backup
+    from consistency import check_consistency
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    category_id = conn.execute("SELECT id FROM categories WHERE type = 'despesa'").fetchone()['id']
+    conn.close()
+    client.post('/orcamentos', json={'category_id': category_id, 'limit': 100})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '90,00', 'note': 'Farmácia', 'account_id': account_id,
+                                      'category_id': category_id, 'when': ''})
+    client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '10,00', 'description': 'Luz',
+                                              'account_id': account_id, 'due_date': '10/01/2030'})
+    conn = get_db_connection()
+    conn.execute("UPDATE budget_alerts SET notified_at_utc = '2020-01-01T00:00:00+00:00'")
+    conn.commit()
+    conn.close()
+
+    # A sqlite3 stand-in for sqlitecloud that reads the test database
+    cloud_path = helpers.current_database().db_path
+    monkeypatch.setitem(sys.modules, 'sqlitecloud', types.SimpleNamespace(connect=lambda url: sqlite3.connect(cloud_path)))
+    path, counts = backup.export_cloud(str(tmp_path), 'sqlitecloud://stand-in')
+    assert counts['entries'] == 1 and counts['budget_spending'] == 1 and counts['budget_alerts'] == 1
+
+    exported = str(tmp_path / 'exported.db')
+    backup.restore_backup(path, exported, keep_current=False)
+    local = sqlite3.connect(exported)
+    local.row_factory = sqlite3.Row
+    assert local.execute('SELECT spent FROM budget_spending').fetchone()[0] == 90.0
+    assert local.execute('SELECT notified_at_utc FROM budget_alerts').fetchone()[0] is not None
+    assert local.execute("SELECT rowid FROM entries_fts WHERE entries_fts MATCH 'farmacia'").fetchall()
+    assert local.execute("SELECT rowid FROM bills_fts WHERE bills_fts MATCH 'luz'").fetchall()
+    assert check_consistency(local) == []
+    # The triggers are back: a new entry still moves the counter
+    local.execute('''INSERT INTO entries (user_id, account_id, category_id, type, amount, note, when_utc, local_day, created_at_utc)
+                     SELECT user_id, account_id, category_id, type, 5, 'x', when_utc, local_day, created_at_utc FROM entries''')
+    assert local.execute('SELECT spent FROM budget_spending').fetchone()[0] == 95.0
+    local.close()
+
+def test_entry_edit_and_delete_keep_derived_data_consistent(client):
+    """Test edits/deletes apply deltas to checkpoints and search, checked against a full recompute"""
+    from datetime import date
+    from balances import balance_at
+    from consistency import check_consistency
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.execute("INSERT INTO accounts (user_id, name, initial_balance) VALUES (1, 'Poupança', 0)")
+    conn.commit()
+    savings_id = conn.execute("SELECT id FROM accounts WHERE name = 'Poupança'").fetchone()['id']
+    conn.close()
+    client.post('/lancamentos', data={'type': 'receita', 'amount': '1000,00', 'account_id': account_id, 'when': '10/03/2024 12:00', 'note': 'Salario'})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '100,00', 'account_id': account_id, 'when': '10/04/2024 12:00'})
+    client.post('/lancamentos/transferencia', json={'from_account_id': account_id, 'to_account_id': savings_id, 'amount': 200, 'when': '15/04/2024 12:00'})
+    
+    conn = get_db_connection()
+    assert balance_at(conn, 1, date(2024, 4, 30)) == {account_id: 700.0, savings_id: 200.0}
+    income_id = conn.execute("SELECT id FROM entries WHERE note = 'Salario'").fetchone()['id']
+    leg_id = conn.execute("SELECT id FROM entries WHERE type = 'transferencia' AND amount > 0").fetchone()['id']
+    checkpoints = conn.execute('SELECT COUNT(*) FROM balance_checkpoints').fetchone()[0]
+    conn.close()
+    
+    response = client.post(f'/lancamentos/{income_id}/editar', json={'amount': '1.500,00', 'note': 'Bonus', 'when': '10/02/2024 12:00'})
+    assert response.get_json()['status'] == 'ok'
+    assert client.post(f'/lancamentos/{leg_id}/editar', json={'amount': 300}).get_json()['status'] == 'ok'
+    assert client.post(f'/lancamentos/{leg_id}/editar', json={'account_id': account_id}).status_code == 400
+    for amount in ('nan', 'inf', '-1'):
+        assert client.post(f'/lancamentos/{income_id}/editar', json={'amount': amount}).status_code == 400
+    assert client.post('/lancamentos/9999/excluir', json={}).status_code == 404
+    
+    conn = get_db_connection()
+    assert check_consistency(conn) == []
+    assert balance_at(conn, 1, date(2024, 4, 30)) == {account_id: 1100.0, savings_id: 300.0}
+    assert conn.execute("SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH 'bonus'").fetchone()[0] == 1
+    conn.close()
+    
+    # Deleting one leg deletes the transfer; the later checkpoints are adjusted, not dropped
+    assert client.post(f'/lancamentos/{leg_id}/excluir', json={}).get_json()['status'] == 'ok'
+    conn = get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM entries WHERE type = 'transferencia'").fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM balance_checkpoints').fetchone()[0] >= checkpoints
+    assert check_consistency(conn) == []
+    
+    # The checker finds and repairs a corrupted checkpoint
+    conn.execute("UPDATE balance_checkpoints SET closing_total = closing_total + 1 WHERE month = '2024-03'")
+    conn.commit()
+    assert [p['check'] for p in check_consistency(conn, repair=True)] == ['checkpoint']
+    assert check_consistency(conn) == []
+    assert balance_at(conn, 1, date(2024, 4, 30)) == {account_id: 1400.0, savings_id: 0.0}
+    conn.close()
+
+def test_bill_edit_and_delete(client):
+    """Test editing an open bill, the limits on a paid one, and deleting"""
+    register_user(client)
+    register_user(client, 'other@example.com')  # logs in as the second user
+    client.get('/logout')
+    client.post('/login', data={'email': 'test@example.com', 'password': 'password123'})
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts WHERE user_id = 1').fetchone()['id']
+    conn.close()
+    client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '100,00', 'description': 'Luz', 'account_id': account_id, 'due_date': '10/01/2099'})
+    conn = get_db_connection()
+    bill_id = conn.execute('SELECT id FROM bills').fetchone()['id']
+    conn.close()
+    
+    assert client.post(f'/bill/{bill_id}/editar', json={'amount': 'nan'}).status_code == 400
+    assert client.post(f'/bill/{bill_id}/editar', json={'amount': '150,00', 'description': 'Energia', 'due_date': '10/01/2020'}).get_json()['status'] == 'ok'
+    conn = get_db_connection()
+    bill = conn.execute('SELECT amount, description, status FROM bills').fetchone()
+    assert (bill['amount'], bill['description'], bill['status']) == (150.0, 'Energia', 'vencido')
+    # The category must be one of the user's, of the bill's kind
+    foreign_category = conn.execute("SELECT id FROM categories WHERE user_id = 2 AND type = 'despesa'").fetchone()['id']
+    income_category = conn.execute("SELECT id FROM categories WHERE user_id = 1 AND type = 'receita'").fetchone()['id']
+    expense_category = conn.execute("SELECT id FROM categories WHERE user_id = 1 AND type = 'despesa'").fetchone()['id']
+    conn.close()
+    assert client.post(f'/bill/{bill_id}/editar', json={'category_id': foreign_category}).status_code == 400
+    assert client.post(f'/bill/{bill_id}/editar', json={'category_id': income_category}).status_code == 400
+    assert client.post(f'/bill/{bill_id}/editar', json={'category_id': expense_category}).get_json()['status'] == 'ok'
+    conn = get_db_connection()
+    assert conn.execute('SELECT category_id FROM bills').fetchone()[0] == expense_category
+    conn.execute("UPDATE bills SET status = 'pago'")
+    conn.commit()
+    conn.close()
+    assert client.post(f'/bill/{bill_id}/editar', json={'amount': 10}).status_code == 400
+    assert client.post(f'/bill/{bill_id}/editar', json={'notes': 'Conferida'}).get_json()['status'] == 'ok'
+    
+    client.post(f'/bill/{bill_id}/excluir')
+    conn = get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM bills').fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM bills_fts WHERE bills_fts MATCH 'energia'").fetchone()[0] == 0
+    conn.close()
+
+def test_write_coordinator_group_commit(client, monkeypatch):
+    """Test concurrent writes share group commits, a failing write rolls back alone, routes go through it"""
+    import threading
+    from writes import WriteCoordinator, write_coordinator
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    
+    coordinator = WriteCoordinator(enabled=True, batch_max=16, batch_wait_ms=50)
+    def write(index):
+        def job(conn):
+            conn.execute("INSERT INTO entries (user_id, account_id, type, amount, when_utc, local_day, created_at_utc) "
+                         "VALUES (1, ?, 'receita', ?, '2024-01-01T12:00:00+00:00', '2024-01-01', '2024-01-01')",
+                         (account_id, index))
+            if index == 3:
+                raise ValueError('boom')
+            return index
+        return job
+    futures = []
+    threads = [threading.Thread(target=lambda i=i: futures.append((i, coordinator.submit(write(i))))) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for index, future in futures:
+        if index == 3:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+        else:
+            assert future.result(timeout=5) == index
+    coordinator.stop()
+    stats = coordinator.stats()
+    assert stats['writes'] == 7 and stats['failed'] == 1 and stats['batches'] < 8
+    
+    conn = get_db_connection()
+    assert sorted(row[0] for row in conn.execute('SELECT amount FROM entries')) == [0, 1, 2, 4, 5, 6, 7]
+    conn.close()
+    
+    # Routes write through the shared coordinator when it is enabled
+    monkeypatch.setattr(write_coordinator, 'enabled', True)
+    write_coordinator.start()
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '10,00', 'account_id': account_id, 'when': ''})
+    client.post('/perfil', data={'name': 'Novo Nome'})
+    # Edit routes run their job on the writer thread, outside the request context
+    conn = get_db_connection()
+    entry_id = conn.execute('SELECT id FROM entries ORDER BY id DESC LIMIT 1').fetchone()['id']
+    conn.close()
+    assert client.post(f'/lancamentos/{entry_id}/editar', json={'amount': '12,00'}).status_code == 200
+    write_coordinator.stop()
+    assert write_coordinator.stats()['writes'] == 3
+    conn = get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 8
+    assert conn.execute('SELECT amount FROM entries WHERE id = ?', (entry_id,)).fetchone()[0] == 12.0
+    assert conn.execute('SELECT name FROM users').fetchone()[0] == 'Novo Nome'
+    conn.close()
+
+def test_write_coordinator_timeout_drops_queued_write(client, monkeypatch):
+    """Test a write that times out while still queued is cancelled, never committed later"""
+    import time
+    import threading
+    import writes
+    from writes import WriteBusy, run_write, write_coordinator
+    register_user(client)
+    monkeypatch.setattr(write_coordinator, 'enabled', True)
+    monkeypatch.setattr(writes, 'WRITE_TIMEOUT_SECONDS', 0.2)
+    write_coordinator.start()
+    release = threading.Event()
+    # Holds the writer thread, so the next write stays queued past its timeout
+    blocker = write_coordinator.submit(lambda conn: release.wait(5))
+    time.sleep(0.1)  # let its batch close
+    with pytest.raises(WriteBusy):
+        run_write(lambda conn: conn.execute("UPDATE users SET name = 'Tarde'"))
+    release.set()
+    blocker.result(timeout=5)
+    write_coordinator.stop()
+    conn = get_db_connection()
+    assert conn.execute('SELECT name FROM users').fetchone()[0] != 'Tarde'
+    conn.close()
+
+def test_budgets_track_spending_and_queue_alerts(client):
+    """Test budget counters follow entry writes, thresholds queue alerts once, and the views read them"""
+    from budgets import budget_status, pending_alerts
+    from consistency import check_consistency
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    category_id = conn.execute("SELECT id FROM categories WHERE type = 'despesa'").fetchone()['id']
+    income_category = conn.execute("SELECT id FROM categories WHERE type = 'receita'").fetchone()['id']
+    conn.close()
+    
+    assert client.post('/orcamentos', json={'category_id': income_category, 'limit': 100}).status_code == 400
+    assert client.post('/orcamentos', json={'category_id': category_id, 'limit': '500,00'}).get_json()['status'] == 'ok'
+    def spend(amount):
+        client.post('/lancamentos', data={'type': 'despesa', 'amount': amount, 'account_id': account_id,
+                                          'category_id': category_id, 'when': ''})
+    spend('300,00')
+    spend('150,00')  # 90%: crosses 80%
+    spend('10,00')   # still between thresholds: no new alert
+    
+    conn = get_db_connection()
+    status = budget_status(conn, 1)
+    assert [(b['spent'], b['percent'], b['status']) for b in status] == [(460.0, 92.0, 'alerta')]
+    assert [a['threshold'] for a in pending_alerts(conn, 1)] == [80]
+    entry_id = conn.execute('SELECT id FROM entries ORDER BY id DESC LIMIT 1').fetchone()['id']
+    conn.close()
+    
+    # Editing the last entry up crosses 100%; deleting it brings the counter back down
+    client.post(f'/lancamentos/{entry_id}/editar', json={'amount': 60})
+    conn = get_db_connection()
+    assert [a['threshold'] for a in pending_alerts(conn, 1)] == [80, 100]
+    assert budget_status(conn, 1)[0]['status'] == 'estourado'
+    conn.close()
+    client.post(f'/lancamentos/{entry_id}/excluir', json={})
+    
+    data = client.get('/api/orcamentos').get_json()
+    assert data['budgets'][0]['spent'] == 450.0 and len(data['alerts']) == 2
+    
+    # Lowering an entry never queues an alert (limit 100: 95 -> 85 stays above 80%)
+    conn = get_db_connection()
+    other_category = conn.execute("SELECT id FROM categories WHERE type = 'despesa' AND id != ?", (category_id,)).fetchone()['id']
+    conn.close()
+    client.post('/orcamentos', json={'category_id': other_category, 'limit': 100})
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '95,00', 'account_id': account_id,
+                                      'category_id': other_category, 'when': ''})
+    conn = get_db_connection()
+    entry_id = conn.execute('SELECT id FROM entries ORDER BY id DESC LIMIT 1').fetchone()['id']
+    conn.execute('DELETE FROM budget_alerts WHERE category_id = ?', (other_category,))
+    conn.commit()
+    conn.close()
+    client.post(f'/lancamentos/{entry_id}/editar', json={'amount': 85})
+    conn = get_db_connection()
+    assert [a for a in pending_alerts(conn, 1) if a['category_id'] == other_category] == []
+    conn.close()
+    assert '450,00'.encode() in client.get('/dashboard').data
+    answer = get_assistant_response(1, 'como está meu orçamento?')
+    assert 'R$ 450,00 de R$ 500,00' in answer
+    conn = get_db_connection()
+    assert check_consistency(conn) == []
+    conn.close()
+
+def test_budgets_ignore_other_users_categories(client):
+    """Test no write path lets another user's spending land on a budgeted category"""
+    from budgets import budget_status, pending_alerts
+    register_user(client)
+    conn = get_db_connection()
+    category_id = conn.execute("SELECT id FROM categories WHERE user_id = 1 AND type = 'despesa'").fetchone()['id']
+    conn.close()
+    client.post('/orcamentos', json={'category_id': category_id, 'limit': 100})
+    client.get('/logout')
+    register_user(client, 'other@example.com')
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts WHERE user_id = 2').fetchone()['id']
+    conn.close()
+
+    client.post('/lancamentos', data={'type': 'despesa', 'amount': '90,00', 'account_id': account_id,
+                                      'category_id': category_id, 'when': ''})
+    client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '90,00', 'description': 'Alheia',
+                                              'account_id': account_id, 'category_id': category_id, 'due_date': '10/01/2099'})
+    conn = get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM bills').fetchone()[0] == 0
+
+    # Bills written before the check: paying them drops the foreign category from the entry
+    for description in ('Uma', 'Outra'):
+        conn.execute('''INSERT INTO bills (user_id, account_id, category_id, type, amount, description, due_date_utc, status, created_at_utc)
+                        VALUES (2, ?, ?, 'pagar', 90, ?, '2099-01-10T12:00:00+00:00', 'pendente', '2024-01-01')''',
+                     (account_id, category_id, description))
+    conn.commit()
+    bill_ids = [row[0] for row in conn.execute('SELECT id FROM bills ORDER BY id')]
+    conn.close()
+    client.post(f'/bill/{bill_ids[0]}/pay')
+    assert client.post('/bills/bulk', json={'action': 'pay', 'items': [bill_ids[1]]}).get_json()['processed'] == 1
+
+    conn = get_db_connection()
+    assert [row[0] for row in conn.execute('SELECT category_id FROM entries')] == [None, None]
+    assert conn.execute('SELECT COUNT(*) FROM budget_spending').fetchone()[0] == 0
+    assert budget_status(conn, 1)[0]['spent'] == 0 and pending_alerts(conn, 1) == []
+    conn.close()
+
+def test_reminder_scheduler(client):
+    """Test due-date reminders fire from the heap at each lead time, follow bill writes and are sent once"""
+    from datetime import datetime, timedelta, timezone
+    from reminders import ReminderScheduler, Notifier
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    for description, due in (('Luz', '02/01/2099 21:00'), ('Aluguel', '05/01/2099 21:00')):
+        client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '100,00', 'description': description,
+                                                   'account_id': account_id, 'due_date': due})
+    now = datetime(2099, 1, 1, 12, 0, tzinfo=timezone.utc)  # Luz due in 36h, Aluguel in 108h
+    
+    sent = []
+    class RecordingNotifier(Notifier):
+        def record(self, conn, user_id, kind, subject, message):
+            sent.append(message)
+            return super().record(conn, user_id, kind, subject, message)
+    scheduler = ReminderScheduler(lead_hours=(72, 24, 0), window_hours=24, notifier=RecordingNotifier(channels=('inapp',)))
+    other_worker = ReminderScheduler(lead_hours=(72, 24, 0), window_hours=24, notifier=RecordingNotifier(channels=('inapp',)))
+    
+    # Loaded window is 96h: only Luz; its missed 72h reminder goes out at once, the next one is 12h away
+    scheduler.tick(now)
+    assert len(sent) == 1 and 'Luz' in sent[0]
+    scheduler.tick(now + timedelta(hours=11))
+    assert len(sent) == 1
+    other_worker.tick(now)
+    assert len(sent) == 1  # already claimed by the first worker
+    scheduler.tick(now + timedelta(hours=12))
+    assert len(sent) == 2
+    
+    # Sliding the window picks up Aluguel; paying Luz drops its last reminder
+    conn = get_db_connection()
+    luz_id = conn.execute("SELECT id FROM bills WHERE description = 'Luz'").fetchone()['id']
+    conn.close()
+    client.post(f'/bill/{luz_id}/pay', data={})
+    scheduler.notify_bill_write(1)
+    scheduler.tick(now + timedelta(hours=36))
+    assert len(sent) == 3 and 'Aluguel' in sent[2]
+    assert scheduler.stats()['scans'] == 3
+    
+    data = client.get('/api/notificacoes').get_json()
+    assert len(data['notifications']) == 3 and data['notifications'][0]['kind'] == 'vencimento'
+    client.post('/notificacoes/lidas', json={'ids': [data['notifications'][0]['id']]})
+    assert len(client.get('/api/notificacoes').get_json()['notifications']) == 2
+    client.post('/notificacoes/lidas', data={})
+    assert client.get('/api/notificacoes').get_json()['notifications'] == []
+
+def test_reminder_email_failure_unclaims(client):
+    """Test a failed reminder email is sent after the claim commits and undoes it so the retry sends again"""
+    from datetime import datetime, timedelta, timezone
+    from reminders import ReminderScheduler, Notifier, REMINDER_RETRY_SECONDS
+    register_user(client)
+    conn = get_db_connection()
+    account_id = conn.execute('SELECT id FROM accounts').fetchone()['id']
+    conn.close()
+    client.post('/contas-pagar-receber', data={'type': 'pagar', 'amount': '100,00', 'description': 'Luz',
+                                               'account_id': account_id, 'due_date': '02/01/2099 21:00'})
+    now = datetime(2099, 1, 1, 12, 0, tzinfo=timezone.utc)
+    
+    emails = []
+    class FlakyNotifier(Notifier):
+        def send_email(self, to, subject, message):
+            # The claim is already committed: another connection sees it while the email goes out
+            check = get_db_connection()
+            claims = check.execute('SELECT COUNT(*) FROM bill_reminders').fetchone()[0]
+            check.close()
+            assert claims == 1
+            emails.append(to)
+            if len(emails) == 1:
+                raise OSError('SMTP indisponível')
+    scheduler = ReminderScheduler(lead_hours=(72,), window_hours=24, notifier=FlakyNotifier(channels=('inapp', 'email')))
+    scheduler.tick(now)
+    assert scheduler.stats()['failed'] == 1 and scheduler.stats()['sent'] == 0
+    conn = get_db_connection()
+    assert conn.execute('SELECT COUNT(*) FROM bill_reminders').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM notifications').fetchone()[0] == 0
+    conn.close()
+    
+    # The retry claims again and sends once
+    scheduler.tick(now + timedelta(seconds=REMINDER_RETRY_SECONDS))
+    assert len(emails) == 2 and scheduler.stats()['sent'] == 1
+    assert len(client.get('/api/notificacoes').get_json()['notifications']) == 1
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -0,0 +1,34 @@
+import math
+import uuid
+from datetime import datetime, timezone
+from helpers import insert_entry
+
+def create_transfer(conn, user_id, from_account_id, to_account_id, amount, when_utc, note=None):
+    """Write both legs of a transfer and return their transfer_group
+
+    The legs are 'transferencia' entries sharing one transfer_group: the
+    amount leaves the source account negative and enters the destination
+    positive, so balances add them as-is and receita/despesa totals ignore
+    them. Does not commit: the caller commits both legs together.
+    """
+    if not (math.isfinite(amount) and amount > 0):
+        raise ValueError("Valor deve ser maior que zero")
+    try:
+        from_account_id, to_account_id = int(from_account_id), int(to_account_id)
+    except (TypeError, ValueError):
+        raise ValueError("Conta inválida")
+    if from_account_id == to_account_id:
+        raise ValueError("Escolha contas de origem e destino diferentes")
+    accounts = {row['id']: row['name'] for row in conn.execute(
+        'SELECT id, name FROM accounts WHERE user_id = ? AND id IN (?, ?)',
+        (user_id, from_account_id, to_account_id)).fetchall()}
+    if len(accounts) != 2:
+        raise ValueError("Conta inválida")
+
+    transfer_group = uuid.uuid4().hex
+    created_at_utc = datetime.now(timezone.utc).isoformat()
+    insert_entry(conn, user_id, from_account_id, None, 'transferencia', -amount,
+                 note or f"Transferência para {accounts[to_account_id]}", when_utc, created_at_utc, transfer_group)
+    insert_entry(conn, user_id, to_account_id, None, 'transferencia', amount,
+                 note or f"Transferência de {accounts[from_account_id]}", when_utc, created_at_utc, transfer_group)
+    return transfer_group
@@ -0,0 +1,36 @@
+import logging
+
+class WorkerResources:
+    """Per-worker subsystems (pools, caches, background threads) with start/stop hooks
+
+    create_app registers them; gunicorn's post_fork calls start() in each worker,
+    worker_exit calls stop(). Tests and benchmarks do the same explicitly.
+    """
+
+    def __init__(self):
+        self._resources = []
+        self.started = False
+
+    def register(self, name, start=None, stop=None):
+        self._resources.append((name, start, stop))
+
+    @property
+    def names(self):
+        return [name for name, _, _ in self._resources]
+
+    def start(self):
+        for name, start, _ in self._resources:
+            if start:
+                start()
+        self.started = True
+
+    def stop(self):
+        """Stop in reverse order; one failing resource does not keep the others running"""
+        for name, _, stop in reversed(self._resources):
+            if not stop:
+                continue
+            try:
+                stop()
+            except Exception as e:
+                logging.error(f"Error stopping {name}: {e}")
+        self.started = False
@@ -0,0 +1,225 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import helpers
+
+# Optional single-writer coordinator for the local engine (WRITE_COORDINATOR=true).
+# Writes queue up for one writer thread per worker, which runs each batch in one
+# transaction: one lock acquisition and one fsync for up to WRITE_BATCH_MAX writes.
+WRITE_COORDINATOR_ENABLED = os.environ.get("WRITE_COORDINATOR", "false").lower() == "true"
+WRITE_BATCH_MAX = int(os.environ.get("WRITE_BATCH_MAX", "64"))
+# After the first write arrives, wait at most this long for others to join its batch
+WRITE_BATCH_WAIT_MS = float(os.environ.get("WRITE_BATCH_WAIT_MS", "2"))
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", "1000"))
+WRITE_TIMEOUT_SECONDS = float(os.environ.get("WRITE_TIMEOUT_SECONDS", "10"))
+
+class WriteBusy(Exception):
+    """Raised when the write queue is full, or a queued write timed out before it ran"""
+
+class GroupConnection:
+    """The connection a write sees inside a group commit: the coordinator commits
+
+    commit() is a no-op (the group commits once); a write aborts by raising,
+    which rolls back its own savepoint only.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def execute(self, *args, **kwargs):
+        return self._conn.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._conn.executemany(*args, **kwargs)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        raise RuntimeError("A grouped write aborts by raising, not by rollback()")
+
+    def close(self):
+        pass
+
+class WriteCoordinator:
+    """One writer thread that group-commits queued write jobs, results through futures"""
+
+    def __init__(self, enabled=WRITE_COORDINATOR_ENABLED, batch_max=WRITE_BATCH_MAX,
+                 batch_wait_ms=WRITE_BATCH_WAIT_MS, queue_size=WRITE_QUEUE_SIZE):
+        self.enabled = enabled
+        self.batch_max = batch_max
+        self.batch_wait = batch_wait_ms / 1000
+        self.queue_size = queue_size
+        self.reset()
+
+    def reset(self):
+        """Fresh queue, thread state and counters (a forked worker inherits the parent's)"""
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._conn = None
+        self._conn_target = None
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+
+    def submit(self, job):
+        """Queue job(conn) for the next group commit; the future resolves once it is committed"""
+        future = Future()
+        try:
+            self._queue.put_nowait((job, future))
+        except queue.Full:
+            raise WriteBusy()
+        self._ensure_thread()
+        return future
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='write-coordinator', daemon=True)
+                self._thread.start()
+
+    def _collect(self, first):
+        """The first job plus whatever arrives before the batch is full or the wait runs out"""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_max:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._commit_group(self._collect(first))
+        self._close()
+
+    def _connection(self):
+        # Reopened when another database is activated (an app's 'database' worker resource)
+        target = helpers.current_database()
+        if self._conn is not None and self._conn_target != target:
+            self._close()
+        if self._conn is None:
+            self._conn = helpers.get_db_connection()
+            self._conn_target = target
+        return self._conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            finally:
+                self._conn = None
+
+    def _commit_group(self, batch):
+        """Run a batch in one transaction, each job in its own savepoint; set futures after COMMIT"""
+        # Jobs whose caller gave up waiting were cancelled: drop them. The rest can no longer be cancelled
+        batch = [(job, future) for job, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        done = []
+        try:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            group = GroupConnection(conn)
+            for job, future in batch:
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    done.append((future, job(group), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    done.append((future, None, e))
+                conn.execute('RELEASE write_job')
+            conn.execute('COMMIT')
+        except Exception as e:
+            logging.error(f"Error in group commit of {len(batch)} writes: {e}")
+            try:
+                if self._conn is not None:
+                    self._conn.rollback()
+            except Exception:
+                pass
+            # The connection may be unusable: open a new one for the next batch
+            self._close()
+            self.failed += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        for future, result, error in done:
+            if error is None:
+                self.writes += 1
+                future.set_result(result)
+            else:
+                self.failed += 1
+                future.set_exception(error)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'batches': self.batches,
+            'writes': self.writes,
+            'failed': self.failed,
+            'mean_batch': round(self.writes / self.batches, 2) if self.batches else 0.0,
+            'queued': self._queue.qsize(),
+        }
+
+    def start(self):
+        self.reset()
+
+    def stop(self):
+        """Commit what is queued, then stop the writer thread"""
+        self._stopping.set()
+        if self._thread is not None:
+            # The thread closes its connection on the way out
+            self._thread.join(timeout=WRITE_TIMEOUT_SECONDS)
+            self._thread = None
+
+write_coordinator = WriteCoordinator()
+
+def run_write(job):
+    """Run job(conn) in a committed transaction and return its result
+
+    With the coordinator enabled (local engine only) the job joins the next
+    group commit; otherwise it gets its own connection and commit. Either
+    way a raised exception means nothing of the job was written.
+    """
+    if write_coordinator.enabled and not helpers.current_database().use_sqlite_cloud:
+        future = write_coordinator.submit(job)
+        try:
+            return future.result(timeout=WRITE_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            # Still queued: cancel it, so it is never written. Already in a group: it will commit, wait for it
+            if future.cancel():
+                raise WriteBusy()
+            return future.result()
+    conn = helpers.get_db_connection()
+    try:
+        result = job(conn)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()